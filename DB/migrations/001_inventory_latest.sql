@@ -0,0 +1,159 @@
+-- Migration 001: latest inventory snapshot
+--
+-- inventory keeps one row per center x product x report_date, so every "latest stock"
+-- query had to recompute the newest row per (center_id, product_id) over the whole history.
+-- inventory_latest keeps that row materialized and is maintained incrementally by
+-- statement-level triggers that only touch the pairs present in each INSERT/UPDATE/DELETE.
+
+-- Create inventory_latest table
+CREATE TABLE IF NOT EXISTS inventory_latest (
+    center_id INTEGER NOT NULL REFERENCES medical_centers(center_id),
+    product_id INTEGER NOT NULL REFERENCES products(product_id),
+    inventory_id INTEGER NOT NULL,
+    current_stock INTEGER NOT NULL DEFAULT 0,
+    avg_monthly_consumption DOUBLE PRECISION,
+    accumulated_consumption_4m INTEGER,
+    measurement DOUBLE PRECISION,
+    last_month_consumption INTEGER,
+    last_month_stock INTEGER,
+    status_indicator VARCHAR(50),
+    cpma_12_months_ago DOUBLE PRECISION,
+    cpma_24_months_ago DOUBLE PRECISION,
+    cpma_36_months_ago DOUBLE PRECISION,
+    accumulated_consumption_12m INTEGER,
+    report_date DATE NOT NULL,
+    status VARCHAR(20),
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_inventory_latest PRIMARY KEY (center_id, product_id)
+);
+
+-- Centers with stock of a product (find_centers_with_stock_*)
+CREATE INDEX IF NOT EXISTS idx_inventory_latest_product_in_stock
+    ON inventory_latest (product_id) WHERE current_stock > 0;
+
+-- Low stock reports (generate_low_stock_report)
+CREATE INDEX IF NOT EXISTS idx_inventory_latest_low_stock
+    ON inventory_latest (center_id) WHERE status_indicator IN ('Substock', 'Desabastecido');
+
+-- Full rebuild (initial load or repair)
+CREATE OR REPLACE FUNCTION refresh_inventory_latest()
+RETURNS VOID AS $$
+BEGIN
+    TRUNCATE inventory_latest;
+    INSERT INTO inventory_latest (
+        center_id, product_id, inventory_id, current_stock, avg_monthly_consumption,
+        accumulated_consumption_4m, measurement, last_month_consumption, last_month_stock,
+        status_indicator, cpma_12_months_ago, cpma_24_months_ago, cpma_36_months_ago,
+        accumulated_consumption_12m, report_date, status
+    )
+    SELECT DISTINCT ON (i.center_id, i.product_id)
+        i.center_id, i.product_id, i.inventory_id, i.current_stock, i.avg_monthly_consumption,
+        i.accumulated_consumption_4m, i.measurement, i.last_month_consumption, i.last_month_stock,
+        i.status_indicator, i.cpma_12_months_ago, i.cpma_24_months_ago, i.cpma_36_months_ago,
+        i.accumulated_consumption_12m, i.report_date, i.status
+    FROM inventory i
+    ORDER BY i.center_id, i.product_id, i.report_date DESC;
+END;
+$$ language 'plpgsql';
+
+-- Incremental refresh after INSERT: only the new rows are read. A new row replaces the
+-- snapshot only if it is at least as recent as the one already stored.
+CREATE OR REPLACE FUNCTION inventory_latest_after_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO inventory_latest AS il (
+        center_id, product_id, inventory_id, current_stock, avg_monthly_consumption,
+        accumulated_consumption_4m, measurement, last_month_consumption, last_month_stock,
+        status_indicator, cpma_12_months_ago, cpma_24_months_ago, cpma_36_months_ago,
+        accumulated_consumption_12m, report_date, status
+    )
+    SELECT DISTINCT ON (n.center_id, n.product_id)
+        n.center_id, n.product_id, n.inventory_id, n.current_stock, n.avg_monthly_consumption,
+        n.accumulated_consumption_4m, n.measurement, n.last_month_consumption, n.last_month_stock,
+        n.status_indicator, n.cpma_12_months_ago, n.cpma_24_months_ago, n.cpma_36_months_ago,
+        n.accumulated_consumption_12m, n.report_date, n.status
+    FROM new_rows n
+    ORDER BY n.center_id, n.product_id, n.report_date DESC
+    ON CONFLICT (center_id, product_id) DO UPDATE SET
+        inventory_id = EXCLUDED.inventory_id,
+        current_stock = EXCLUDED.current_stock,
+        avg_monthly_consumption = EXCLUDED.avg_monthly_consumption,
+        accumulated_consumption_4m = EXCLUDED.accumulated_consumption_4m,
+        measurement = EXCLUDED.measurement,
+        last_month_consumption = EXCLUDED.last_month_consumption,
+        last_month_stock = EXCLUDED.last_month_stock,
+        status_indicator = EXCLUDED.status_indicator,
+        cpma_12_months_ago = EXCLUDED.cpma_12_months_ago,
+        cpma_24_months_ago = EXCLUDED.cpma_24_months_ago,
+        cpma_36_months_ago = EXCLUDED.cpma_36_months_ago,
+        accumulated_consumption_12m = EXCLUDED.accumulated_consumption_12m,
+        report_date = EXCLUDED.report_date,
+        status = EXCLUDED.status,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE il.report_date <= EXCLUDED.report_date;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Incremental refresh after UPDATE/DELETE: the touched pairs are recomputed from inventory,
+-- because the modified row may stop being the latest one.
+CREATE OR REPLACE FUNCTION inventory_latest_recompute_pairs()
+RETURNS TRIGGER AS $$
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS inventory_latest_touched (
+        center_id INTEGER, product_id INTEGER
+    ) ON COMMIT DROP;
+    TRUNCATE inventory_latest_touched;
+
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO inventory_latest_touched SELECT DISTINCT center_id, product_id FROM old_rows;
+    ELSE
+        INSERT INTO inventory_latest_touched
+        SELECT center_id, product_id FROM old_rows
+        UNION
+        SELECT center_id, product_id FROM new_rows;
+    END IF;
+
+    DELETE FROM inventory_latest il
+    USING inventory_latest_touched t
+    WHERE il.center_id = t.center_id AND il.product_id = t.product_id;
+
+    INSERT INTO inventory_latest (
+        center_id, product_id, inventory_id, current_stock, avg_monthly_consumption,
+        accumulated_consumption_4m, measurement, last_month_consumption, last_month_stock,
+        status_indicator, cpma_12_months_ago, cpma_24_months_ago, cpma_36_months_ago,
+        accumulated_consumption_12m, report_date, status
+    )
+    SELECT DISTINCT ON (i.center_id, i.product_id)
+        i.center_id, i.product_id, i.inventory_id, i.current_stock, i.avg_monthly_consumption,
+        i.accumulated_consumption_4m, i.measurement, i.last_month_consumption, i.last_month_stock,
+        i.status_indicator, i.cpma_12_months_ago, i.cpma_24_months_ago, i.cpma_36_months_ago,
+        i.accumulated_consumption_12m, i.report_date, i.status
+    FROM inventory i
+    JOIN inventory_latest_touched t ON i.center_id = t.center_id AND i.product_id = t.product_id
+    ORDER BY i.center_id, i.product_id, i.report_date DESC;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Create statement-level triggers (one per event: transition tables require it)
+DROP TRIGGER IF EXISTS trg_inventory_latest_insert ON inventory;
+CREATE TRIGGER trg_inventory_latest_insert
+AFTER INSERT ON inventory
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_after_insert();
+
+DROP TRIGGER IF EXISTS trg_inventory_latest_update ON inventory;
+CREATE TRIGGER trg_inventory_latest_update
+AFTER UPDATE ON inventory
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_recompute_pairs();
+
+DROP TRIGGER IF EXISTS trg_inventory_latest_delete ON inventory;
+CREATE TRIGGER trg_inventory_latest_delete
+AFTER DELETE ON inventory
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_recompute_pairs();
+
+-- Initial population from the existing history
+SELECT refresh_inventory_latest();
@@ -0,0 +1,46 @@
+-- Migration 002: support for COPY-based bulk ingestion (MediFinderCore/ingest.py)
+--
+-- * inventory.content_hash lets the loader skip rows whose content did not change.
+-- * inventory_status_indicator() holds the status rules of check_inventory_stock() so the
+--   loader can compute status_indicator set-based with exactly the same logic.
+-- * check_inventory_stock() becomes a no-op when the session sets medifinder.bulk_load = 'on',
+--   avoiding the per-row PL/pgSQL work on rows whose status was already computed.
+
+ALTER TABLE inventory ADD COLUMN IF NOT EXISTS content_hash VARCHAR(32);
+
+-- Status rules shared by the row trigger and the bulk loader
+CREATE OR REPLACE FUNCTION inventory_status_indicator(
+    current_stock INTEGER,
+    avg_monthly_consumption DOUBLE PRECISION,
+    fallback VARCHAR
+)
+RETURNS VARCHAR AS $$
+    SELECT CASE
+        WHEN current_stock IS NOT NULL AND avg_monthly_consumption IS NOT NULL AND avg_monthly_consumption > 0 THEN
+            CASE
+                WHEN current_stock = 0 THEN 'Desabastecido'
+                WHEN current_stock < avg_monthly_consumption THEN 'Substock'
+                WHEN current_stock > avg_monthly_consumption * 3 THEN 'Sobrestock'
+                ELSE 'Normostock'
+            END
+        WHEN current_stock = 0 THEN 'Desabastecido'
+        WHEN avg_monthly_consumption IS NULL OR avg_monthly_consumption = 0 THEN
+            CASE WHEN current_stock > 0 THEN 'Sin_Rotación' ELSE 'Sin_Consumo' END
+        ELSE fallback
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION check_inventory_stock()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- The bulk loader already computed status_indicator with inventory_status_indicator()
+    IF current_setting('medifinder.bulk_load', true) = 'on' THEN
+        RETURN NEW;
+    END IF;
+
+    NEW.status_indicator = inventory_status_indicator(
+        NEW.current_stock, NEW.avg_monthly_consumption, NEW.status_indicator
+    );
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
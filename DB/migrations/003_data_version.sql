@@ -0,0 +1,43 @@
+-- Migration 003: data version watermark
+--
+-- data_version holds a single counter that is bumped by every statement that writes to
+-- inventory or to the tables the public answers are built from. The answer cache
+-- (MediFinderCore/answer_cache.py) keys its entries on this counter, so cached answers
+-- become stale as soon as new data is committed, with no expiry times.
+
+CREATE TABLE IF NOT EXISTS data_version (
+    singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO data_version (singleton) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+-- One bump per statement: a COPY/upsert of a whole file counts as a single change
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS trg_inventory_data_version ON inventory;
+CREATE TRIGGER trg_inventory_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON inventory
+FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+DROP TRIGGER IF EXISTS trg_products_data_version ON products;
+CREATE TRIGGER trg_products_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+DROP TRIGGER IF EXISTS trg_medical_centers_data_version ON medical_centers;
+CREATE TRIGGER trg_medical_centers_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON medical_centers
+FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+
+DROP TRIGGER IF EXISTS trg_regions_data_version ON regions;
+CREATE TRIGGER trg_regions_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON regions
+FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
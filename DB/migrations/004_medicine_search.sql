@@ -0,0 +1,19 @@
+-- Migration 004: ranked medicine search (MediFinderCore/search.py)
+--
+-- * medifinder_normalize_name() lower-cases, strips Spanish accents and collapses spaces, the
+--   same normalization catalog.normalize_name() applies to the search term in Python.
+-- * idx_products_name_normalized indexes the normalized name with gin_trgm_ops so the
+--   word-similarity operator (<%) and the LIKE fallback of the ranked search use the index.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION medifinder_normalize_name(value TEXT)
+RETURNS TEXT AS $$
+    SELECT btrim(regexp_replace(
+        translate(lower(value), 'áàäâéèëêíìïîóòöôúùüûñç', 'aaaaeeeeiiiioooouuuunc'),
+        '\s+', ' ', 'g'
+    ));
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX IF NOT EXISTS idx_products_name_normalized
+ON products USING gin (medifinder_normalize_name(name) gin_trgm_ops);
@@ -0,0 +1,262 @@
+-- Migration 005: monthly range partitioning of inventory
+--
+-- inventory gets one row per center x product every month, and history queries (consumption
+-- trends, rankings) had to read every month ever loaded. inventory is rebuilt as a table
+-- PARTITION BY RANGE (report_date) with one partition per month, so a query with a
+-- report_date predicate only reads the months it asks for.
+--
+-- The rows are moved online by MediFinderCore/migrate.py:
+--   1. This file creates the partitioned copy (inventory_part) and statement-level triggers
+--      that mirror every write on inventory into it while the copy runs.
+--   2. inventory_partitioning_backfill(month) copies one month per transaction.
+--   3. inventory_partitioning_swap() blocks writes (not reads) for the rest of its transaction,
+--      drops the rows deleted during the copy and swaps the tables. The old table is kept as
+--      inventory_unpartitioned until it is dropped by hand.
+-- The same steps can be run from psql:
+--   SELECT inventory_partitioning_backfill(m::date)
+--   FROM generate_series((SELECT date_trunc('month', min(report_date)) FROM inventory),
+--                        (SELECT max(report_date) FROM inventory), interval '1 month') m;
+--   SELECT inventory_partitioning_swap();
+--
+-- Partitions for new months are created by ensure_inventory_partitions(), which the loaders
+-- (MediFinderCore/ingest.py, benchmarks) call before writing.
+
+-- Create the monthly partitions covering [first_month, last_month] that do not exist yet.
+-- Before the swap the partitioned table is inventory_part; afterwards it is inventory.
+CREATE OR REPLACE FUNCTION ensure_inventory_partitions(first_month DATE, last_month DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    parent REGCLASS;
+    partition_month DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT c.oid INTO parent
+    FROM pg_class c
+    WHERE c.oid IN (to_regclass('inventory'), to_regclass('inventory_part')) AND c.relkind = 'p';
+    IF parent IS NULL OR first_month IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    FOR partition_month IN
+        SELECT generate_series(date_trunc('month', first_month),
+                               date_trunc('month', COALESCE(last_month, first_month)),
+                               interval '1 month')::date
+    LOOP
+        partition_name := 'inventory_' || to_char(partition_month, '"y"YYYY"m"MM');
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+        EXECUTE format('CREATE TABLE %I PARTITION OF %s FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, parent, partition_month,
+                       (partition_month + interval '1 month')::date);
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$ language 'plpgsql';
+
+-- Mirror writes on the unpartitioned inventory into inventory_part during the copy.
+-- Later writes win over the copy: the backfill never overwrites a mirrored row.
+CREATE OR REPLACE FUNCTION inventory_partitioning_mirror()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- DELETE rather than TRUNCATE: a TRUNCATE ... CASCADE may have already emptied inventory_part
+    -- in the same statement, and truncating it again from here fails
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM inventory_part;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM inventory_part p
+        USING old_rows o
+        WHERE p.center_id = o.center_id AND p.product_id = o.product_id AND p.report_date = o.report_date;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM ensure_inventory_partitions(
+            (SELECT min(report_date) FROM new_rows), (SELECT max(report_date) FROM new_rows)
+        );
+        INSERT INTO inventory_part AS p (
+            inventory_id, center_id, product_id, current_stock, avg_monthly_consumption,
+            accumulated_consumption_4m, measurement, last_month_consumption, last_month_stock,
+            status_indicator, cpma_12_months_ago, cpma_24_months_ago, cpma_36_months_ago,
+            accumulated_consumption_12m, report_date, status, created_at, updated_at, content_hash
+        )
+        SELECT
+            n.inventory_id, n.center_id, n.product_id, n.current_stock, n.avg_monthly_consumption,
+            n.accumulated_consumption_4m, n.measurement, n.last_month_consumption, n.last_month_stock,
+            n.status_indicator, n.cpma_12_months_ago, n.cpma_24_months_ago, n.cpma_36_months_ago,
+            n.accumulated_consumption_12m, n.report_date, n.status, n.created_at, n.updated_at, n.content_hash
+        FROM new_rows n
+        ON CONFLICT (center_id, product_id, report_date) DO UPDATE SET
+            inventory_id = EXCLUDED.inventory_id,
+            current_stock = EXCLUDED.current_stock,
+            avg_monthly_consumption = EXCLUDED.avg_monthly_consumption,
+            accumulated_consumption_4m = EXCLUDED.accumulated_consumption_4m,
+            measurement = EXCLUDED.measurement,
+            last_month_consumption = EXCLUDED.last_month_consumption,
+            last_month_stock = EXCLUDED.last_month_stock,
+            status_indicator = EXCLUDED.status_indicator,
+            cpma_12_months_ago = EXCLUDED.cpma_12_months_ago,
+            cpma_24_months_ago = EXCLUDED.cpma_24_months_ago,
+            cpma_36_months_ago = EXCLUDED.cpma_36_months_ago,
+            accumulated_consumption_12m = EXCLUDED.accumulated_consumption_12m,
+            status = EXCLUDED.status,
+            created_at = EXCLUDED.created_at,
+            updated_at = EXCLUDED.updated_at,
+            content_hash = EXCLUDED.content_hash;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Copy one month of the unpartitioned inventory; returns the rows copied
+CREATE OR REPLACE FUNCTION inventory_partitioning_backfill(backfill_month DATE)
+RETURNS BIGINT AS $$
+DECLARE
+    copied BIGINT;
+BEGIN
+    PERFORM ensure_inventory_partitions(backfill_month, backfill_month);
+    INSERT INTO inventory_part (
+        inventory_id, center_id, product_id, current_stock, avg_monthly_consumption,
+        accumulated_consumption_4m, measurement, last_month_consumption, last_month_stock,
+        status_indicator, cpma_12_months_ago, cpma_24_months_ago, cpma_36_months_ago,
+        accumulated_consumption_12m, report_date, status, created_at, updated_at, content_hash
+    )
+    SELECT
+        i.inventory_id, i.center_id, i.product_id, i.current_stock, i.avg_monthly_consumption,
+        i.accumulated_consumption_4m, i.measurement, i.last_month_consumption, i.last_month_stock,
+        i.status_indicator, i.cpma_12_months_ago, i.cpma_24_months_ago, i.cpma_36_months_ago,
+        i.accumulated_consumption_12m, i.report_date, i.status, i.created_at, i.updated_at, i.content_hash
+    FROM inventory i
+    WHERE i.report_date >= date_trunc('month', backfill_month)
+      AND i.report_date < date_trunc('month', backfill_month) + interval '1 month'
+    ON CONFLICT (center_id, product_id, report_date) DO NOTHING;
+    GET DIAGNOSTICS copied = ROW_COUNT;
+    RETURN copied;
+END;
+$$ language 'plpgsql';
+
+-- Replace inventory with inventory_part; returns the rows dropped because they were deleted
+-- from inventory while their month was being copied
+CREATE OR REPLACE FUNCTION inventory_partitioning_swap()
+RETURNS BIGINT AS $$
+DECLARE
+    removed BIGINT;
+BEGIN
+    -- Writers wait from here until commit; readers only wait for the renames below
+    LOCK TABLE inventory IN EXCLUSIVE MODE;
+
+    DELETE FROM inventory_part p
+    WHERE NOT EXISTS (
+        SELECT 1 FROM inventory i
+        WHERE i.center_id = p.center_id AND i.product_id = p.product_id AND i.report_date = p.report_date
+    );
+    GET DIAGNOSTICS removed = ROW_COUNT;
+
+    DROP TRIGGER IF EXISTS trg_inventory_partitioning_mirror_insert ON inventory;
+    DROP TRIGGER IF EXISTS trg_inventory_partitioning_mirror_update ON inventory;
+    DROP TRIGGER IF EXISTS trg_inventory_partitioning_mirror_delete ON inventory;
+    DROP TRIGGER IF EXISTS trg_inventory_partitioning_mirror_truncate ON inventory;
+    DROP TRIGGER IF EXISTS update_inventory_timestamp ON inventory;
+    DROP TRIGGER IF EXISTS trg_check_inventory_stock ON inventory;
+    DROP TRIGGER IF EXISTS trg_inventory_latest_insert ON inventory;
+    DROP TRIGGER IF EXISTS trg_inventory_latest_update ON inventory;
+    DROP TRIGGER IF EXISTS trg_inventory_latest_delete ON inventory;
+    DROP TRIGGER IF EXISTS trg_inventory_data_version ON inventory;
+
+    ALTER TABLE inventory RENAME TO inventory_unpartitioned;
+    ALTER TABLE inventory_unpartitioned RENAME CONSTRAINT inventory_pkey TO inventory_unpartitioned_pkey;
+    ALTER TABLE inventory_unpartitioned RENAME CONSTRAINT uq_inventory_center_product_report
+        TO uq_inventory_unpartitioned_center_product_report;
+    ALTER INDEX IF EXISTS idx_inventory_center_product RENAME TO idx_inventory_unpartitioned_center_product;
+    ALTER INDEX IF EXISTS idx_inventory_current_stock RENAME TO idx_inventory_unpartitioned_current_stock;
+    ALTER INDEX IF EXISTS idx_inventory_status_indicator RENAME TO idx_inventory_unpartitioned_status_indicator;
+    ALTER INDEX IF EXISTS idx_inventory_report_date RENAME TO idx_inventory_unpartitioned_report_date;
+
+    ALTER TABLE inventory_part RENAME TO inventory;
+    ALTER TABLE inventory RENAME CONSTRAINT inventory_part_pkey TO inventory_pkey;
+    ALTER TABLE inventory RENAME CONSTRAINT uq_inventory_part_center_product_report
+        TO uq_inventory_center_product_report;
+    ALTER INDEX idx_inventory_part_center_product RENAME TO idx_inventory_center_product;
+    ALTER INDEX idx_inventory_part_current_stock RENAME TO idx_inventory_current_stock;
+    ALTER INDEX idx_inventory_part_status_indicator RENAME TO idx_inventory_status_indicator;
+    ALTER INDEX idx_inventory_part_report_date RENAME TO idx_inventory_report_date;
+    -- Otherwise dropping inventory_unpartitioned would drop the id sequence
+    ALTER SEQUENCE inventory_inventory_id_seq OWNED BY inventory.inventory_id;
+
+    CREATE TRIGGER update_inventory_timestamp BEFORE UPDATE ON inventory
+        FOR EACH ROW EXECUTE FUNCTION update_timestamp();
+    CREATE TRIGGER trg_check_inventory_stock BEFORE INSERT OR UPDATE ON inventory
+        FOR EACH ROW EXECUTE FUNCTION check_inventory_stock();
+    CREATE TRIGGER trg_inventory_latest_insert AFTER INSERT ON inventory
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_after_insert();
+    CREATE TRIGGER trg_inventory_latest_update AFTER UPDATE ON inventory
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_recompute_pairs();
+    CREATE TRIGGER trg_inventory_latest_delete AFTER DELETE ON inventory
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_recompute_pairs();
+    -- No per-statement data_version trigger on the new table (migration 010): the swap itself
+    -- bumps the version once, like a load does
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+    RETURN removed;
+END;
+$$ language 'plpgsql';
+
+-- Create inventory_part and start mirroring (skipped once inventory is partitioned)
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'inventory'::regclass) = 'p'
+       OR to_regclass('inventory_part') IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    CREATE TABLE inventory_part (
+        inventory_id INTEGER NOT NULL DEFAULT nextval('inventory_inventory_id_seq'),
+        center_id INTEGER NOT NULL REFERENCES medical_centers(center_id),
+        product_id INTEGER NOT NULL REFERENCES products(product_id),
+        current_stock INTEGER NOT NULL DEFAULT 0,
+        avg_monthly_consumption DOUBLE PRECISION,
+        accumulated_consumption_4m INTEGER,
+        measurement DOUBLE PRECISION,
+        last_month_consumption INTEGER,
+        last_month_stock INTEGER,
+        status_indicator VARCHAR(50),
+        cpma_12_months_ago DOUBLE PRECISION,
+        cpma_24_months_ago DOUBLE PRECISION,
+        cpma_36_months_ago DOUBLE PRECISION,
+        accumulated_consumption_12m INTEGER,
+        report_date DATE NOT NULL,
+        status VARCHAR(20) DEFAULT 'ACTIVO',
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        content_hash VARCHAR(32),
+        -- Unique keys of a partitioned table must include the partition key
+        CONSTRAINT inventory_part_pkey PRIMARY KEY (inventory_id, report_date),
+        CONSTRAINT uq_inventory_part_center_product_report UNIQUE (center_id, product_id, report_date)
+    ) PARTITION BY RANGE (report_date);
+
+    CREATE INDEX idx_inventory_part_center_product ON inventory_part (center_id, product_id);
+    CREATE INDEX idx_inventory_part_current_stock ON inventory_part (current_stock);
+    CREATE INDEX idx_inventory_part_status_indicator ON inventory_part (status_indicator);
+    CREATE INDEX idx_inventory_part_report_date ON inventory_part (report_date);
+
+    PERFORM ensure_inventory_partitions(
+        (SELECT min(report_date) FROM inventory), (SELECT max(report_date) FROM inventory)
+    );
+
+    CREATE TRIGGER trg_inventory_partitioning_mirror_insert AFTER INSERT ON inventory
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_partitioning_mirror();
+    CREATE TRIGGER trg_inventory_partitioning_mirror_update AFTER UPDATE ON inventory
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_partitioning_mirror();
+    CREATE TRIGGER trg_inventory_partitioning_mirror_delete AFTER DELETE ON inventory
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_partitioning_mirror();
+    CREATE TRIGGER trg_inventory_partitioning_mirror_truncate AFTER TRUNCATE ON inventory
+        FOR EACH STATEMENT EXECUTE FUNCTION inventory_partitioning_mirror();
+END;
+$$;
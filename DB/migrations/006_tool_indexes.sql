@@ -0,0 +1,51 @@
+-- Migration 006: indexes matched to the tool queries
+--
+-- One index per access path of MediFinderAgent/tools (checked with benchmarks/index_advisor.py
+-- and benchmarks/query_plans.py), and no indexes that no query reads:
+--
+-- * inventory_latest, centers with stock of a product (find_centers_with_stock_*,
+--   find_nearest_centers_with_stock): leads with product_id, partial on current_stock > 0 and
+--   covers the columns find_nearest reads, so it is answered from the index alone.
+-- * inventory_latest, every center of a product (get_consumption_trends "latest"/"top_centers").
+-- * medical_centers by region: every regional query filters mc.region_id.
+-- * inventory history by product (get_consumption_trends "monthly"/"raw",
+--   find_top_consuming_region_for_medicine): product_id, center_id, report_date DESC, covering
+--   the consumption columns.
+-- * The latest row per (center_id, product_id), read by the inventory_latest triggers, is served
+--   by uq_inventory_center_product_report scanned backwards, so no separate
+--   (center_id, product_id, report_date DESC) index is added.
+--
+-- Dropped: idx_inventory_center_product (a prefix of uq_inventory_center_product_report),
+-- idx_inventory_current_stock and idx_inventory_status_indicator (stock and status are read from
+-- inventory_latest), idx_products_code (duplicates uq_products_code) and
+-- idx_medical_centers_location (nearest-center search runs on the in-memory index of
+-- MediFinderCore/geo.py).
+--
+-- CREATE INDEX CONCURRENTLY is not available on partitioned tables nor inside the migration
+-- transaction, so writes to each table wait while its indexes are built.
+
+DROP INDEX IF EXISTS idx_inventory_latest_product_in_stock;
+CREATE INDEX IF NOT EXISTS idx_inventory_latest_product_center_in_stock
+    ON inventory_latest (product_id, center_id)
+    INCLUDE (current_stock, report_date, status_indicator)
+    WHERE current_stock > 0;
+
+CREATE INDEX IF NOT EXISTS idx_inventory_latest_product_center
+    ON inventory_latest (product_id, center_id);
+
+CREATE INDEX IF NOT EXISTS idx_medical_centers_region
+    ON medical_centers (region_id, center_id);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_product_center_date
+    ON inventory (product_id, center_id, report_date DESC)
+    INCLUDE (avg_monthly_consumption, last_month_consumption, accumulated_consumption_12m);
+
+DROP INDEX IF EXISTS idx_inventory_center_product;
+DROP INDEX IF EXISTS idx_inventory_current_stock;
+DROP INDEX IF EXISTS idx_inventory_status_indicator;
+DROP INDEX IF EXISTS idx_products_code;
+DROP INDEX IF EXISTS idx_medical_centers_location;
+
+ANALYZE inventory_latest;
+ANALYZE medical_centers;
+ANALYZE inventory;
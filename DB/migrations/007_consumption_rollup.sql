@@ -0,0 +1,73 @@
+-- Migration 007: region x product x month consumption rollup
+--
+-- consumption_rollup holds, for every region, product and report month, the sum of the
+-- avg_monthly_consumption (CPMA) reported by the centers of the region, counting each center once
+-- per month (its last report of the month). The region and medicine rankings of
+-- MediFinderAgent/tools/analytics_tools.py read it instead of aggregating the whole inventory history.
+--
+-- The bulk loader (MediFinderCore/ingest.py) calls refresh_consumption_rollup() for the months of
+-- each file in the same transaction as the inventory upsert. Writes made outside the loader are
+-- picked up by calling refresh_consumption_rollup() for their months, or with no arguments to
+-- rebuild the whole table.
+
+CREATE TABLE IF NOT EXISTS consumption_rollup (
+    region_id INTEGER NOT NULL REFERENCES regions(region_id) ON DELETE CASCADE,
+    product_id INTEGER NOT NULL REFERENCES products(product_id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    avg_monthly_consumption DOUBLE PRECISION NOT NULL,
+    last_month_consumption BIGINT,
+    centers_reporting INTEGER NOT NULL,
+    CONSTRAINT pk_consumption_rollup PRIMARY KEY (region_id, month, product_id)
+);
+
+-- Region ranking: (region_id, month) range of the primary key. Medicine ranking: this one.
+CREATE INDEX IF NOT EXISTS idx_consumption_rollup_product_month
+    ON consumption_rollup (product_id, month, region_id) INCLUDE (avg_monthly_consumption);
+
+-- Rebuilds the rollup rows of the months between first_month and last_month (the whole inventory
+-- when both are NULL) and returns the number of rows written. Each month is guarded by an advisory
+-- lock, taken in order, so parallel loads of the same month run their refresh one after the other
+-- and the last one sees the inventory rows committed by the others.
+CREATE OR REPLACE FUNCTION refresh_consumption_rollup(first_month DATE DEFAULT NULL, last_month DATE DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    low DATE := date_trunc('month', COALESCE(first_month, (SELECT min(report_date) FROM inventory)));
+    high DATE := date_trunc('month', COALESCE(last_month, (SELECT max(report_date) FROM inventory)));
+    locked_month DATE;
+    written INTEGER;
+BEGIN
+    IF low IS NULL OR high IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    FOR locked_month IN SELECT m::date FROM generate_series(low, high, interval '1 month') m LOOP
+        PERFORM pg_advisory_xact_lock(72401007, (extract(year FROM locked_month) * 100
+                                                 + extract(month FROM locked_month))::integer);
+    END LOOP;
+
+    DELETE FROM consumption_rollup WHERE month BETWEEN low AND high;
+
+    INSERT INTO consumption_rollup (
+        region_id, product_id, month, avg_monthly_consumption, last_month_consumption, centers_reporting
+    )
+    SELECT mc.region_id, i.product_id, i.month,
+           SUM(i.avg_monthly_consumption), SUM(i.last_month_consumption), COUNT(*)
+    FROM (
+        SELECT DISTINCT ON (center_id, product_id, date_trunc('month', report_date))
+            center_id, product_id, date_trunc('month', report_date)::date AS month,
+            avg_monthly_consumption, last_month_consumption
+        FROM inventory
+        WHERE report_date >= low AND report_date < high + interval '1 month'
+          AND avg_monthly_consumption IS NOT NULL
+        ORDER BY center_id, product_id, date_trunc('month', report_date), report_date DESC
+    ) i
+    JOIN medical_centers mc ON mc.center_id = i.center_id
+    WHERE mc.region_id IS NOT NULL
+    GROUP BY mc.region_id, i.product_id, i.month;
+    GET DIAGNOSTICS written = ROW_COUNT;
+    RETURN written;
+END;
+$$ language 'plpgsql';
+
+SELECT refresh_consumption_rollup();
+ANALYZE consumption_rollup;
@@ -0,0 +1,34 @@
+-- Migration 008: consumption anomalies
+--
+-- consumption_anomalies holds the center x product rows of inventory_latest whose last month
+-- consumption departs from their CPMA history (current CPMA and the CPMA 12, 24 and 36 months
+-- ago). It is rebuilt as a whole by the batch job in MediFinderCore/anomalies.py
+-- (python -m MediFinderCore.anomalies), which computes a robust z-score and the ratio to the
+-- baseline for every row at once. get_consumption_anomalies reads it by region and severity.
+--
+-- severity: 1 = mild, 2 = moderate, 3 = severe. direction: 'alza' (spike) or 'baja' (drop).
+
+CREATE TABLE IF NOT EXISTS consumption_anomalies (
+    center_id INTEGER NOT NULL REFERENCES medical_centers(center_id) ON DELETE CASCADE,
+    product_id INTEGER NOT NULL REFERENCES products(product_id) ON DELETE CASCADE,
+    region_id INTEGER REFERENCES regions(region_id) ON DELETE CASCADE,
+    report_date DATE NOT NULL,
+    last_month_consumption INTEGER NOT NULL,
+    baseline DOUBLE PRECISION NOT NULL,
+    ratio DOUBLE PRECISION,
+    robust_z DOUBLE PRECISION NOT NULL,
+    severity SMALLINT NOT NULL CHECK (severity BETWEEN 1 AND 3),
+    direction VARCHAR(4) NOT NULL CHECK (direction IN ('alza', 'baja')),
+    detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT pk_consumption_anomalies PRIMARY KEY (center_id, product_id)
+);
+
+-- Anomalies of a region, most severe first
+CREATE INDEX IF NOT EXISTS idx_consumption_anomalies_region_severity
+    ON consumption_anomalies (region_id, severity DESC, (abs(robust_z)) DESC);
+
+-- National list and per-medicine lookups, most severe first
+CREATE INDEX IF NOT EXISTS idx_consumption_anomalies_severity
+    ON consumption_anomalies (severity DESC, (abs(robust_z)) DESC);
+CREATE INDEX IF NOT EXISTS idx_consumption_anomalies_product
+    ON consumption_anomalies (product_id, severity DESC);
@@ -0,0 +1,126 @@
+-- Migration 009: inventory change watermarks for incremental Watcher runs
+--
+-- region_inventory_versions keeps one change counter per region, bumped by statement-level
+-- triggers on inventory_latest for every region whose center x product rows were inserted,
+-- updated or deleted. inventory_pair_versions records, for each pair, the region version of
+-- its last change. The Watcher (MediFinderWatcher/agent.py, MediFinderCore/watermarks.py)
+-- stores in watcher_watermarks the version it last analyzed per region, so a run only looks
+-- at regions whose counter moved and, inside them, at the pairs with a newer version.
+--
+-- A counter is used instead of comparing updated_at timestamps: the bump takes the region row
+-- lock, so versions become visible in commit order, whereas CURRENT_TIMESTAMP is the start of
+-- each transaction and two concurrent loads can commit out of order.
+
+CREATE TABLE IF NOT EXISTS region_inventory_versions (
+    region_id INTEGER PRIMARY KEY REFERENCES regions(region_id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 1,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS inventory_pair_versions (
+    center_id INTEGER NOT NULL REFERENCES medical_centers(center_id) ON DELETE CASCADE,
+    product_id INTEGER NOT NULL REFERENCES products(product_id) ON DELETE CASCADE,
+    region_id INTEGER NOT NULL REFERENCES regions(region_id) ON DELETE CASCADE,
+    version BIGINT NOT NULL,
+    CONSTRAINT pk_inventory_pair_versions PRIMARY KEY (center_id, product_id)
+);
+
+-- Pairs of a region changed after a given version
+CREATE INDEX IF NOT EXISTS idx_inventory_pair_versions_region_version
+    ON inventory_pair_versions (region_id, version);
+
+CREATE TABLE IF NOT EXISTS watcher_watermarks (
+    region_id INTEGER PRIMARY KEY REFERENCES regions(region_id) ON DELETE CASCADE,
+    version BIGINT NOT NULL,
+    report_date DATE,
+    processed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Bumps the regions of the touched pairs once per statement and stamps each pair with the
+-- new version of its region.
+CREATE OR REPLACE FUNCTION inventory_latest_track_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS inventory_latest_changed (
+        center_id INTEGER, product_id INTEGER
+    ) ON COMMIT DROP;
+    TRUNCATE inventory_latest_changed;
+
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO inventory_latest_changed SELECT center_id, product_id FROM new_rows;
+    ELSE
+        INSERT INTO inventory_latest_changed SELECT center_id, product_id FROM old_rows;
+    END IF;
+
+    WITH touched AS (
+        SELECT DISTINCT c.center_id, c.product_id, mc.region_id
+        FROM inventory_latest_changed c
+        JOIN medical_centers mc ON c.center_id = mc.center_id
+        WHERE mc.region_id IS NOT NULL
+    ),
+    bumped AS (
+        INSERT INTO region_inventory_versions AS v (region_id)
+        SELECT DISTINCT region_id FROM touched
+        ORDER BY region_id  -- same lock order in every transaction
+        ON CONFLICT (region_id) DO UPDATE SET
+            version = v.version + 1,
+            changed_at = CURRENT_TIMESTAMP
+        RETURNING v.region_id, v.version
+    )
+    INSERT INTO inventory_pair_versions AS pv (center_id, product_id, region_id, version)
+    SELECT t.center_id, t.product_id, t.region_id, b.version
+    FROM touched t
+    JOIN bumped b ON t.region_id = b.region_id
+    ON CONFLICT (center_id, product_id) DO UPDATE SET
+        region_id = EXCLUDED.region_id,
+        version = EXCLUDED.version;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- TRUNCATE has no transition tables: every region counts as changed
+CREATE OR REPLACE FUNCTION inventory_latest_track_truncate()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE region_inventory_versions SET version = version + 1, changed_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Statement-level triggers (one per event: transition tables require it). An UPDATE only
+-- needs its old rows because inventory_latest never changes a row's center or product.
+DROP TRIGGER IF EXISTS trg_inventory_latest_changes_insert ON inventory_latest;
+CREATE TRIGGER trg_inventory_latest_changes_insert
+AFTER INSERT ON inventory_latest
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_track_changes();
+
+DROP TRIGGER IF EXISTS trg_inventory_latest_changes_update ON inventory_latest;
+CREATE TRIGGER trg_inventory_latest_changes_update
+AFTER UPDATE ON inventory_latest
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_track_changes();
+
+DROP TRIGGER IF EXISTS trg_inventory_latest_changes_delete ON inventory_latest;
+CREATE TRIGGER trg_inventory_latest_changes_delete
+AFTER DELETE ON inventory_latest
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_track_changes();
+
+DROP TRIGGER IF EXISTS trg_inventory_latest_changes_truncate ON inventory_latest;
+CREATE TRIGGER trg_inventory_latest_changes_truncate
+AFTER TRUNCATE ON inventory_latest
+FOR EACH STATEMENT EXECUTE FUNCTION inventory_latest_track_truncate();
+
+-- Initial state: every region and pair at version 1, no watermarks (the first incremental
+-- run analyzes every region)
+INSERT INTO region_inventory_versions (region_id)
+SELECT region_id FROM regions
+ON CONFLICT DO NOTHING;
+
+INSERT INTO inventory_pair_versions (center_id, product_id, region_id, version)
+SELECT il.center_id, il.product_id, mc.region_id, 1
+FROM inventory_latest il
+JOIN medical_centers mc ON il.center_id = mc.center_id
+WHERE mc.region_id IS NOT NULL
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,26 @@
+-- Migration 010: one data version bump per load
+--
+-- Migration 003 bumped data_version from statement-level triggers on inventory, products,
+-- medical_centers and regions. Every writing statement then updated the single data_version
+-- row and held its lock until commit, so parallel loads (ingest --workers), the migration-005
+-- mirror triggers and refresh jobs all queued behind each other on that row.
+--
+-- The triggers are dropped. Writers now call next_data_version() once, as the last statement
+-- of the transaction that commits their changes: MediFinderCore/ingest.py does it at the end
+-- of each file, so the row lock is only held while that transaction commits. Anything that
+-- writes these tables another way must call it too (SELECT next_data_version();) for the
+-- answer cache and the in-memory catalogs to notice the change.
+
+DROP TRIGGER IF EXISTS trg_inventory_data_version ON inventory;
+DROP TRIGGER IF EXISTS trg_products_data_version ON products;
+DROP TRIGGER IF EXISTS trg_medical_centers_data_version ON medical_centers;
+DROP TRIGGER IF EXISTS trg_regions_data_version ON regions;
+
+CREATE OR REPLACE FUNCTION next_data_version()
+RETURNS BIGINT AS $$
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    RETURNING version;
+$$ language 'sql';
+
+-- The data written before this migration is a version of its own
+SELECT next_data_version();
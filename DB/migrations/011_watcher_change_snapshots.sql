@@ -0,0 +1,78 @@
+-- Migration 011: transaction-id change tracking for the Watcher watermarks
+--
+-- Migration 009 kept one change counter per region (region_inventory_versions). Every statement
+-- writing inventory_latest upserted the counter rows of its regions and held their locks until
+-- commit, so parallel loads touching the same region queued behind each other, and a TRUNCATE
+-- updated every counter row at once.
+--
+-- The counter is dropped. Each changed center x product pair in inventory_pair_versions is now
+-- stamped with the id of the transaction that changed it (pg_current_xact_id()), and a TRUNCATE
+-- only inserts its own transaction id into inventory_latest_truncations. No row is shared
+-- between writers. watcher_watermarks stores, per region, the snapshot (pg_current_snapshot())
+-- of the query that listed the changes the Watcher analyzed: a pair changed after the mark if
+-- its transaction is not visible in that snapshot, which also covers loads that were still in
+-- progress when the snapshot was taken and committed later (MediFinderCore/watermarks.py).
+--
+-- Existing watermarks cannot be translated to snapshots and are cleared: the first Watcher
+-- run after this migration analyzes every region, as after migration 009.
+
+DROP TABLE IF EXISTS region_inventory_versions;
+
+DROP INDEX IF EXISTS idx_inventory_pair_versions_region_version;
+ALTER TABLE inventory_pair_versions DROP COLUMN IF EXISTS version;
+-- Pairs already tracked count as changed by this migration's transaction
+ALTER TABLE inventory_pair_versions ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE inventory_pair_versions ALTER COLUMN change_xid DROP DEFAULT;
+
+-- Pairs of a region changed by transactions from a given snapshot's xmin on
+CREATE INDEX IF NOT EXISTS idx_inventory_pair_versions_region_xid
+    ON inventory_pair_versions (region_id, change_xid);
+
+CREATE TABLE IF NOT EXISTS inventory_latest_truncations (
+    change_xid xid8 PRIMARY KEY,
+    truncated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+DELETE FROM watcher_watermarks;
+ALTER TABLE watcher_watermarks DROP COLUMN IF EXISTS version;
+ALTER TABLE watcher_watermarks ADD COLUMN IF NOT EXISTS snapshot pg_snapshot NOT NULL;
+
+-- Stamps the touched pairs with the current transaction id. Only the pairs' own rows are
+-- locked, in (center_id, product_id) order, so concurrent loads of different pairs of the
+-- same region do not wait for each other.
+CREATE OR REPLACE FUNCTION inventory_latest_track_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS inventory_latest_changed (
+        center_id INTEGER, product_id INTEGER
+    ) ON COMMIT DROP;
+    TRUNCATE inventory_latest_changed;
+
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO inventory_latest_changed SELECT center_id, product_id FROM new_rows;
+    ELSE
+        INSERT INTO inventory_latest_changed SELECT center_id, product_id FROM old_rows;
+    END IF;
+
+    INSERT INTO inventory_pair_versions AS pv (center_id, product_id, region_id, change_xid)
+    SELECT DISTINCT c.center_id, c.product_id, mc.region_id, pg_current_xact_id()
+    FROM inventory_latest_changed c
+    JOIN medical_centers mc ON c.center_id = mc.center_id
+    WHERE mc.region_id IS NOT NULL
+    ORDER BY c.center_id, c.product_id
+    ON CONFLICT (center_id, product_id) DO UPDATE SET
+        region_id = EXCLUDED.region_id,
+        change_xid = EXCLUDED.change_xid;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- TRUNCATE has no transition tables: every region counts as changed by this transaction
+CREATE OR REPLACE FUNCTION inventory_latest_track_truncate()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO inventory_latest_truncations (change_xid) VALUES (pg_current_xact_id())
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
@@ -1,14 +1,20 @@
-from google.adk.agents import Agent
+import os
+import re
+from typing import AsyncGenerator, Optional
+from google.adk.agents import Agent, BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.genai import types
 from dotenv import load_dotenv
 
-from .tools import query_tools
-from .tools import analytics_tools
+from .tools import async_query_tools
+from .tools import async_analytics_tools
 
 # Importar Prompts desde el archivo de prompts
 from .tools.prompts import (
     PUBLIC_AGENT_DESC, PUBLIC_AGENT_INST,
     ANALYTICS_AGENT_DESC, ANALYTICS_AGENT_INST,
-    ROOT_AGENT_DESC, ROOT_AGENT_INST
+    ROOT_AGENT_DESC, ROLE_CLASSIFIER_INST
 )
 
 # Cargar variables de entorno desde el archivo .env
@@ -17,6 +23,9 @@ load_dotenv()
 # -- Modelo a usar --
 MODEL = "gemini-2.0-flash"
 
+# -- Si es "true", los mensajes sin prefijo de rol se clasifican con el LLM en lugar de ir al PublicAgent --
+ROUTER_LLM_FALLBACK = os.getenv("ROUTER_LLM_FALLBACK", "false").lower() == "true"
+
 # --- Definición del Agente Público (Para Usuarios Finales) ---
 
 PublicAgent = Agent(
@@ -26,12 +35,13 @@ PublicAgent = Agent(
     instruction=PUBLIC_AGENT_INST,
     tools=[
         # Herramientas de consulta para el público
-        query_tools.find_medicine_details_by_name,
-        query_tools.find_centers_with_stock_by_medicine,
-        query_tools.find_centers_with_stock_by_medicine_region,
-        query_tools.get_stock_details_for_medicine_at_center,
-        query_tools.list_all_regions,
-        query_tools.search_medicines_by_name,        
+        async_query_tools.find_medicine_details_by_name,
+        async_query_tools.find_centers_with_stock_by_medicine,
+        async_query_tools.find_centers_with_stock_by_medicine_region,
+        async_query_tools.find_nearest_centers_with_stock,
+        async_query_tools.get_stock_details_for_medicine_at_center,
+        async_query_tools.list_all_regions,
+        async_query_tools.search_medicines_by_name,        
     ],
 )
 
@@ -45,25 +55,84 @@ AnalyticsAgent = Agent(
     instruction=ANALYTICS_AGENT_INST,
     tools=[
         # Herramientas de análisis para gestores
-        analytics_tools.generate_low_stock_report,
-        analytics_tools.get_consumption_trends,
-        analytics_tools.find_top_consuming_region_for_medicine,
-        analytics_tools.find_most_consumed_medicine_by_region,
+        async_analytics_tools.generate_low_stock_report,
+        async_analytics_tools.generate_low_stock_reports,
+        async_analytics_tools.get_national_low_stock_overview,
+        async_analytics_tools.get_consumption_trends,
+        async_analytics_tools.find_top_consuming_region_for_medicine,
+        async_analytics_tools.find_most_consumed_medicine_by_region,
+        async_analytics_tools.forecast_stockouts,
+        async_analytics_tools.suggest_stock_transfers,
+        async_analytics_tools.get_consumption_anomalies,
         # Un analista también podría necesitar estas herramientas básicas
-        query_tools.list_all_regions,
-        query_tools.search_medicines_by_name,        
+        async_query_tools.list_all_regions,
+        async_query_tools.search_medicines_by_name,        
     ],
 )
 
-# Este agente actúa como un enrutador inteligente, delegando tareas
-# al sub-agente correcto basado en el rol del usuario.
-root_agent = Agent(
-    name="MediFinderRootAgent",
+# Clasificador de rol: solo se usa como respaldo del enrutador para mensajes sin prefijo.
+RoleClassifierAgent = Agent(
+    name="MediFinderRoleClassifier",
     model=MODEL,
-    description=ROOT_AGENT_DESC,
-    instruction=ROOT_AGENT_INST,
+    description="Clasifica un mensaje sin prefijo como de un usuario 'Publico' o 'Analista'.",
+    instruction=ROLE_CLASSIFIER_INST,
+    output_key="detected_role",
+    disallow_transfer_to_parent=True,
+    disallow_transfer_to_peers=True,
+)
+
+# --- Definición del Agente Raíz (Enrutador) ---
+
+# Prefijo de rol que frontend_app añade a cada mensaje ("Publico: ...", "Analista: ...").
+ROLE_PREFIX_RE = re.compile(r"^\s*(p[uú]blico|analista)\s*:", re.IGNORECASE)
+
+
+def _role_from_text(text: str) -> Optional[str]:
+    """Devuelve 'analista' o 'publico' según el prefijo de `text`, o None si no lo tiene."""
+    match = ROLE_PREFIX_RE.match(text or "")
+    if not match:
+        return None
+    return "analista" if match.group(1).lower() == "analista" else "publico"
+
+
+def _user_text(content: Optional[types.Content]) -> str:
+    if not content or not content.parts:
+        return ""
+    return "".join(part.text or "" for part in content.parts)
+
+
+class PrefixRouterAgent(BaseAgent):
+    """
+    Enrutador sin LLM: lee el prefijo de rol del mensaje y ejecuta directamente el
+    PublicAgent ('Publico:') o el AnalyticsAgent ('Analista:'), sin una llamada a Gemini
+    solo para decidir a quién delegar. Los mensajes sin prefijo van al PublicAgent o,
+    si `llm_fallback` está activo, al clasificador de rol.
+    """
+    name: str = "MediFinderRootAgent"
+    description: str = ROOT_AGENT_DESC
+    llm_fallback: bool = ROUTER_LLM_FALLBACK
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        role = _role_from_text(_user_text(ctx.user_content))
+
+        if role is None and self.llm_fallback:
+            classifier = self.find_agent("MediFinderRoleClassifier")
+            async for event in classifier.run_async(ctx):
+                yield event
+            role = "analista" if "analista" in str(ctx.session.state.get("detected_role", "")).lower() else "publico"
+
+        target = "MediFinderAnalyticsAgent" if role == "analista" else "MediFinderPublicAgent"
+        async for event in self.find_agent(target).run_async(ctx):
+            yield event
+
+
+# El enrutador recibe los especialistas como sub-agentes para poder encontrarlos por su nombre.
+root_agent = PrefixRouterAgent(
     sub_agents=[
         PublicAgent,
-        AnalyticsAgent
+        AnalyticsAgent,
+        RoleClassifierAgent
     ]
-)
\ No newline at end of file
+)
@@ -1,59 +1,43 @@
-import os
 import psycopg2
 from typing import Optional
 from psycopg2 import sql
-from psycopg2.extras import DictCursor
-from dotenv import load_dotenv
-
-# Cargar variables de entorno
-load_dotenv()
-
-# Configuración de la base de datos
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": os.getenv("DB_PORT", "5432"),
-    "database": os.getenv("DB_NAME", "medifinder"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASS", "admin"),
-}
-
-def get_db_connection():
-    """Establece una conexión con la base de datos PostgreSQL."""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except psycopg2.OperationalError as e:
-        print(f"Error al conectar con la base de datos: {e}")
-        return None
+
+from MediFinderCore import answer_cache, catalog, db, encoding, geo, metrics, search
 
 # --- Herramientas de Consulta (Para el Agente Público) ---
 
+# Marca de "sin entrada en la caché" para respuestas que pueden ser None.
+_NOT_CACHED = object()
+
+@metrics.instrument
 def find_medicine_details_by_name(medicine_name: str) -> dict:
     """
-    Busca detalles específicos de medicamentos que coincidan con un nombre dado.
+    Busca detalles específicos de medicamentos que coincidan con un nombre dado, ordenados
+    de la coincidencia más parecida a la menos parecida (columna 'score', de 0 a 1).
     Proporciona detalles como código, descripción, dosis y concentración.
     """
-    conn = get_db_connection()
-    if not conn:
-        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
-
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cur:
+        candidates = search.medicines.search(medicine_name, limit=20)
+        if not candidates:
+            return {"status": "not_found", "medicines": []}
+        scores = {candidate['product_id']: candidate['score'] for candidate in candidates}
+        with db.get_cursor() as cur:
             query = sql.SQL("""
                 SELECT product_id, code, name, description, dosage_form, strength
                 FROM products
-                WHERE name ILIKE %s ORDER BY name LIMIT 20;
+                WHERE product_id = ANY(%s)
+                ORDER BY array_position(%s::int[], product_id);
             """)
-            cur.execute(query, (f"%{medicine_name}%",))
-            results = cur.fetchall()
-            if results:
-                return {"status": "success", "medicines": [dict(row) for row in results]}
-            return {"status": "not_found", "medicines": []}
+            ranked_ids = list(scores)
+            cur.execute(query, (ranked_ids, ranked_ids))
+            results = [{**dict(row), "score": scores[row['product_id']]} for row in cur.fetchall()]
+            return {"status": "success", "medicines": encoding.encode_rows(results)}
+    except db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
     except psycopg2.Error as e:
         return {"status": "error", "error_message": f"Error de base de datos: {e}"}
-    finally:
-        if conn: conn.close()
 
+@metrics.instrument
 def find_centers_with_stock_by_medicine(medicine_name: str) -> dict:
     """
     Encuentra centros médicos en TODAS las regiones que tienen stock (>0) de un medicamento.
@@ -61,134 +45,199 @@ def find_centers_with_stock_by_medicine(medicine_name: str) -> dict:
     # Esta función es un caso especial de la búsqueda por región, sin filtro de región.
     return find_centers_with_stock_by_medicine_region(medicine_name, region_name=None)
 
+@metrics.instrument
 def find_centers_with_stock_by_medicine_region(medicine_name: str, region_name: Optional[str] = None) -> dict:
     """
     Encuentra centros médicos con stock (>0) de un medicamento, opcionalmente filtrando por región.
     """
-    conn = get_db_connection()
-    if not conn:
-        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
-
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cur:
-            # 1. Encontrar el product_id
-            cur.execute("SELECT product_id FROM products WHERE name ILIKE %s LIMIT 1;", (f"%{medicine_name}%",))
-            product_result = cur.fetchone()
-            if not product_result:
-                return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
-            product_id = product_result['product_id']
-
-            # 2. Construir la consulta base
+        # 1. Resolver el product_id con la búsqueda por similitud
+        match = search.match_medicine(medicine_name)
+        product = match['best']
+        if not product:
+            return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+        product_id = product['product_id']
+
+        # 2. Resolver la región si se proporciona
+        region_id = None
+        if region_name:
+            region_result = catalog.resolve_region(region_name)
+            if not region_result:
+                return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
+            region_id = region_result['region_id']
+
+        # 3. Reutilizar la respuesta si los datos no cambiaron desde que se calculó
+        version = answer_cache.data_version()
+        cache_key = ("centers_with_stock", product_id, region_id)
+        centers_found = answer_cache.answers.get(cache_key, version)
+        if centers_found is None:
+            # Consulta sobre el último registro de cada centro (inventory_latest)
             query_sql = """
-                SELECT DISTINCT ON (mc.center_id)
+                SELECT
                     mc.name AS center_name, mc.address, r.name AS region_name,
-                    i.current_stock, i.report_date, i.status_indicator,
+                    il.current_stock, il.report_date, il.status_indicator,
                     mc.latitude, mc.longitude
-                FROM inventory i
-                JOIN medical_centers mc ON i.center_id = mc.center_id
+                FROM inventory_latest il
+                JOIN medical_centers mc ON il.center_id = mc.center_id
                 JOIN regions r ON mc.region_id = r.region_id
-                WHERE i.product_id = %s AND i.current_stock > 0
+                WHERE il.product_id = %s AND il.current_stock > 0
             """
             params = [product_id]
-
-            # 3. Añadir filtro de región si se proporciona
-            if region_name:
-                cur.execute("SELECT region_id FROM regions WHERE name ILIKE %s LIMIT 1;", (f"%{region_name}%",))
-                region_result = cur.fetchone()
-                if not region_result:
-                    return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
-                
+            if region_id is not None:
                 query_sql += " AND mc.region_id = %s"
-                params.append(region_result['region_id'])
-
-            query_sql += " ORDER BY mc.center_id, i.report_date DESC;"
-            
-            cur.execute(query_sql, tuple(params))
-            results = cur.fetchall()
+                params.append(region_id)
+            query_sql += " ORDER BY mc.center_id;"
 
-            if results:
+            with db.get_cursor() as cur:
+                cur.execute(query_sql, tuple(params))
                 centers_found = []
-                for row in results:
+                for row in cur.fetchall():
                     row_dict = dict(row)
                     row_dict['report_date'] = row_dict['report_date'].isoformat() if row_dict.get('report_date') else None
                     centers_found.append(row_dict)
-                return {"status": "success", "centers": centers_found}
-            
-            message = f"No se encontraron centros con stock para '{medicine_name}'."
-            if region_name:
-                message += f" en la región '{region_name}'."
-            return {"status": "no_centers_found", "centers": [], "message": message}
+            answer_cache.answers.put(cache_key, version, centers_found)
+
+        if centers_found:
+            return {"status": "success", "centers": encoding.encode_rows(centers_found), **search.match_note(match)}
+
+        message = f"No se encontraron centros con stock para '{medicine_name}'."
+        if region_name:
+            message += f" en la región '{region_name}'."
+        return {"status": "no_centers_found", "centers": [], "message": message}
 
+    except db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
     except psycopg2.Error as e:
         return {"status": "error", "error_message": f"Error de base de datos: {e}"}
-    finally:
-        if conn: conn.close()
 
-def get_stock_details_for_medicine_at_center(medicine_name: str, center_name: str) -> dict:
+@metrics.instrument
+def find_nearest_centers_with_stock(medicine_name: str, lat: float, lon: float, k: int = 5, radius_km: Optional[float] = None) -> dict:
     """
-    Obtiene los detalles de stock más recientes para un medicamento en un centro médico específico.
+    Encuentra los `k` centros médicos más cercanos a unas coordenadas (lat, lon) que tienen stock (>0)
+    de un medicamento, opcionalmente limitados a un radio en kilómetros. Devuelve la distancia en km.
     """
-    conn = get_db_connection()
-    if not conn:
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return {"status": "error", "error_message": f"Coordenadas inválidas: ({lat}, {lon})."}
+    if k < 1 or (radius_km is not None and radius_km <= 0):
+        return {"status": "error", "error_message": "'k' y 'radius_km' deben ser positivos."}
+
+    try:
+        # 1. Resolver el product_id y cargar los catálogos que alimentan el índice espacial
+        match = search.match_medicine(medicine_name)
+        product = match['best']
+        if not product:
+            return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+        catalog.centers.refresh()
+        catalog.regions.refresh()
+
+        # 2. Centros con stock según el último registro de inventario (reutilizado mientras no cambien los datos)
+        version = answer_cache.data_version()
+        cache_key = ("stock_by_center", product['product_id'])
+        stock_by_center = answer_cache.answers.get(cache_key, version)
+        if stock_by_center is None:
+            with db.get_cursor() as cur:
+                query = """
+                    SELECT il.center_id, il.current_stock, il.report_date, il.status_indicator
+                    FROM inventory_latest il
+                    WHERE il.product_id = %s AND il.current_stock > 0;
+                """
+                cur.execute(query, (product['product_id'],))
+                stock_by_center = {row['center_id']: dict(row) for row in cur.fetchall()}
+            answer_cache.answers.put(cache_key, version, stock_by_center)
+
+        # 3. Intersectar el índice espacial con los centros que tienen stock
+        nearest = geo.get_center_index().nearest(lat, lon, k=k, radius_km=radius_km, allowed=stock_by_center.keys())
+        centers_found = []
+        for center_id, distance_km in nearest:
+            # El índice puede ser de un catálogo anterior (centro eliminado o recarga en curso)
+            center = catalog.centers.get(center_id)
+            if center is None:
+                continue
+            region = catalog.regions.get(center['region_id'])
+            stock = stock_by_center[center_id]
+            centers_found.append({
+                "center_name": center['name'], "address": center['address'],
+                "region_name": region['name'] if region else None,
+                "distance_km": round(distance_km, 2),
+                "current_stock": stock['current_stock'],
+                "report_date": stock['report_date'].isoformat() if stock.get('report_date') else None,
+                "status_indicator": stock['status_indicator'],
+                "latitude": center['latitude'], "longitude": center['longitude'],
+            })
+        if centers_found:
+            return {"status": "success", "medicine_name": product['name'], "centers": encoding.encode_rows(centers_found),
+                    **search.match_note(match)}
+
+        message = f"No se encontraron centros con stock para '{medicine_name}' cerca de ({lat}, {lon})."
+        if radius_km is not None:
+            message += f" Radio de búsqueda: {radius_km} km."
+        return {"status": "no_centers_found", "centers": [], "message": message}
+
+    except db.ConnectionUnavailable:
         return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg2.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
 
+@metrics.instrument
+def get_stock_details_for_medicine_at_center(medicine_name: str, center_name: str) -> dict:
+    """
+    Obtiene los detalles de stock más recientes para un medicamento en un centro médico específico.
+    """
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cur:
-            query = """
-                SELECT
-                    p.name as medicine_name, mc.name as center_name,
-                    i.current_stock, i.report_date, i.status_indicator, i.avg_monthly_consumption
-                FROM inventory i
-                JOIN products p ON i.product_id = p.product_id
-                JOIN medical_centers mc ON i.center_id = mc.center_id
-                WHERE p.name ILIKE %s AND mc.name ILIKE %s
-                ORDER BY i.report_date DESC
-                LIMIT 1;
-            """
-            cur.execute(query, (f"%{medicine_name}%", f"%{center_name}%"))
-            stock_result = cur.fetchone()
-
-            if stock_result:
-                details = dict(stock_result)
-                details['report_date'] = details['report_date'].isoformat() if details.get('report_date') else None
-                return {"status": "success", "details": details}
-            
+        # Resolver producto (por similitud) y centro (en memoria) para consultar el inventario por IDs exactos
+        match = search.match_medicine(medicine_name)
+        product = match['best']
+        center = catalog.resolve_center(center_name)
+        if not product or not center:
             return {"status": "stock_not_found", "error_message": f"No se encontró stock para '{medicine_name}' en '{center_name}'."}
+
+        version = answer_cache.data_version()
+        cache_key = ("stock_details", product['product_id'], center['center_id'])
+        stock_result = answer_cache.answers.get(cache_key, version, default=_NOT_CACHED)
+        if stock_result is _NOT_CACHED:
+            with db.get_cursor() as cur:
+                query = """
+                    SELECT
+                        il.current_stock, il.report_date, il.status_indicator, il.avg_monthly_consumption
+                    FROM inventory_latest il
+                    WHERE il.product_id = %s AND il.center_id = %s;
+                """
+                cur.execute(query, (product['product_id'], center['center_id']))
+                row = cur.fetchone()
+                stock_result = dict(row) if row else None
+            answer_cache.answers.put(cache_key, version, stock_result)
+
+        if stock_result:
+            details = {"medicine_name": product['name'], "center_name": center['name'], **stock_result}
+            details['report_date'] = details['report_date'].isoformat() if details.get('report_date') else None
+            return {"status": "success", "details": details}
+
+        return {"status": "stock_not_found", "error_message": f"No se encontró stock para '{medicine_name}' en '{center_name}'."}
+    except db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
     except psycopg2.Error as e:
         return {"status": "error", "error_message": f"Error de base de datos: {e}"}
-    finally:
-        if conn: conn.close()
 
+@metrics.instrument
 def list_all_regions() -> dict:
     """Lista todas las regiones disponibles en la base de datos."""
-    conn = get_db_connection()
-    if not conn:
-        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
-
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cur:
-            cur.execute("SELECT name FROM regions ORDER BY name;")
-            return {"status": "success", "regions": [row['name'] for row in cur.fetchall()]}
+        catalog.regions.refresh()
+        return {"status": "success", "regions": [row['name'] for row in catalog.regions.all()]}
+    except db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
     except psycopg2.Error as e:
         return {"status": "error", "error_message": f"Error de base de datos: {e}"}
-    finally:
-        if conn: conn.close()
 
+@metrics.instrument
 def search_medicines_by_name(search_term: str) -> dict:
-    """Busca medicamentos disponibles por nombre (limitado a 20 resultados)."""
-    conn = get_db_connection()
-    if not conn:
-        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
-
+    """Busca medicamentos disponibles por nombre, del más parecido al menos parecido (limitado a 20 resultados)."""
     try:
-        with conn.cursor(cursor_factory=DictCursor) as cur:
-            query = sql.SQL("SELECT name FROM products WHERE name ILIKE %s ORDER BY name LIMIT 20;")
-            cur.execute(query, (f"%{search_term}%",))
-            results = cur.fetchall()
-            if results:
-                return {"status": "success", "medicines": [row['name'] for row in results]}
-            return {"status": "not_found", "medicines": []}
+        results = search.medicines.search(search_term, limit=20)
+        if results:
+            return {"status": "success", "medicines": [row['name'] for row in results]}
+        return {"status": "not_found", "medicines": []}
+    except db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
     except psycopg2.Error as e:
         return {"status": "error", "error_message": f"Error de base de datos: {e}"}
-    finally:
-        if conn: conn.close()
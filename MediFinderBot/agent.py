@@ -2,7 +2,7 @@ from .tools.prompts import AGENT_DESCRIPTION, AGENT_INSTRUCTION
 from google.adk.agents import Agent
 from dotenv import load_dotenv
 
-from .tools import query_tools
+from .tools import async_query_tools
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
@@ -18,11 +18,12 @@ root_agent = Agent(
     instruction=AGENT_INSTRUCTION,
     tools=[
         # Herramientas de consulta para el público
-        query_tools.find_medicine_details_by_name,
-        query_tools.find_centers_with_stock_by_medicine,
-        query_tools.find_centers_with_stock_by_medicine_region,
-        query_tools.get_stock_details_for_medicine_at_center,
-        query_tools.list_all_regions,
-        query_tools.search_medicines_by_name,
+        async_query_tools.find_medicine_details_by_name,
+        async_query_tools.find_centers_with_stock_by_medicine,
+        async_query_tools.find_centers_with_stock_by_medicine_region,
+        async_query_tools.find_nearest_centers_with_stock,
+        async_query_tools.get_stock_details_for_medicine_at_center,
+        async_query_tools.list_all_regions,
+        async_query_tools.search_medicines_by_name,
     ],
 )
@@ -0,0 +1,189 @@
+"""
+Detección de consumos anómalos en todo el país (tabla consumption_anomalies, migración 008).
+
+Para cada centro y producto de inventory_latest se compara el consumo del último mes con su
+historial de CPMA (el actual y los de hace 12, 24 y 36 meses), todas las filas a la vez con
+arrays de NumPy:
+
+* Línea base: mediana del historial disponible; razón = último mes / línea base.
+* z robusto de log((último mes + 1) / (línea base + 1)) frente a las demás filas del mismo
+  producto: (valor - mediana) / (1.4826 x MAD). Así se compara cada centro con cuánto varía
+  normalmente ese medicamento de un mes a otro. Los productos con menos de MIN_GROUP_ROWS
+  filas usan la mediana y la MAD de todo el país.
+
+Una fila es anómala si |z| llega a Z_THRESHOLDS[0] y la razón se aleja de 1 al menos
+MIN_RATIO_CHANGE veces (en cualquier sentido); la severidad (1-3) es el último umbral de
+Z_THRESHOLDS alcanzado. Cada ejecución reemplaza la tabla entera en una transacción.
+
+Como en MediFinderCore.forecast, las filas se leen con COPY ... TO STDOUT (CSV, NULL como
+'nan', la fecha como días desde 1970-01-01) y np.loadtxt las convierte en una matriz de
+float64, sin crear un dict por fila.
+
+Uso:
+    python -m MediFinderCore.anomalies
+"""
+import argparse
+import csv
+import datetime
+import io
+import sys
+import time
+import warnings
+
+import numpy as np
+import psycopg2
+
+from . import db
+
+# |z| robusto mínimo de cada severidad (1 = leve, 2 = moderada, 3 = grave).
+Z_THRESHOLDS = (3.5, 6.0, 10.0)
+# Cambio mínimo respecto a la línea base (1.5 = +50 % o -33 %) para considerar la fila anómala.
+MIN_RATIO_CHANGE = 1.5
+MAD_SCALE = 1.4826
+# Filas mínimas de un producto para usar su propia mediana y MAD.
+MIN_GROUP_ROWS = 20
+# Dispersión mínima del log de la razón (evita z enormes cuando casi todas las filas coinciden).
+MIN_LOG_SPREAD = 0.05
+
+SNAPSHOT_QUERY = """
+    SELECT
+        il.center_id, il.product_id, mc.region_id, il.report_date - DATE '1970-01-01' AS report_day,
+        il.last_month_consumption, il.avg_monthly_consumption,
+        il.cpma_12_months_ago, il.cpma_24_months_ago, il.cpma_36_months_ago
+    FROM inventory_latest il
+    JOIN medical_centers mc ON il.center_id = mc.center_id
+    WHERE il.last_month_consumption IS NOT NULL
+"""
+SNAPSHOT_COPY = f"COPY ({SNAPSHOT_QUERY}) TO STDOUT WITH (FORMAT csv, NULL 'nan')"
+HISTORY_COLUMNS = ("avg_monthly_consumption", "cpma_12_months_ago", "cpma_24_months_ago", "cpma_36_months_ago")
+SNAPSHOT_COLUMNS = ("center_id", "product_id", "region_id", "report_day", "last_month_consumption") + HISTORY_COLUMNS
+TABLE_COLUMNS = ("center_id", "product_id", "region_id", "report_date", "last_month_consumption",
+                 "baseline", "ratio", "robust_z", "severity", "direction")
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def parse_snapshot(text: str) -> np.ndarray:
+    """Matriz (filas x SNAPSHOT_COLUMNS) del CSV de SNAPSHOT_COPY; los NULL quedan como NaN."""
+    if not text:
+        return np.empty((0, len(SNAPSHOT_COLUMNS)))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # np.loadtxt avisa si no hay filas
+        return np.loadtxt(io.StringIO(text), delimiter=",", dtype=np.float64, ndmin=2)
+
+
+def _group_medians(values: np.ndarray, groups: np.ndarray) -> tuple:
+    """Mediana del grupo de cada posición y tamaño de ese grupo (ordenando una sola vez)."""
+    order = np.lexsort((values, groups))
+    sorted_groups, sorted_values = groups[order], values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    counts = np.diff(np.r_[starts, values.size])
+    medians = (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+    medians_by_row, counts_by_row = np.empty(values.size), np.empty(values.size, dtype=np.int64)
+    medians_by_row[order] = np.repeat(medians, counts)
+    counts_by_row[order] = np.repeat(counts, counts)
+    return medians_by_row, counts_by_row
+
+
+def score(last_month, history, groups) -> dict:
+    """
+    Línea base, razón, z robusto y severidad (0 = normal) de cada fila. `history` tiene una
+    columna por CPMA histórico (NaN si falta) y `groups` es el producto de cada fila; las filas
+    sin historial quedan con severidad 0 y z NaN.
+    """
+    last_month = np.asarray(last_month, dtype=np.float64)
+    history = np.asarray(history, dtype=np.float64)
+    groups = np.asarray(groups)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # filas sin ningún CPMA: nanmedian -> NaN
+        baseline = np.nanmedian(history, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(baseline > 0, last_month / baseline, np.nan)
+
+    robust_z = np.full(last_month.size, np.nan)
+    scored = np.flatnonzero(~np.isnan(baseline) & (baseline >= 0))
+    if scored.size:
+        log_ratio = np.log1p(last_month[scored]) - np.log1p(baseline[scored])
+        median, size = _group_medians(log_ratio, groups[scored])
+        mad, _ = _group_medians(np.abs(log_ratio - median), groups[scored])
+        # Productos con pocas filas: mediana y MAD de todo el país
+        small = size < MIN_GROUP_ROWS
+        median = np.where(small, np.median(log_ratio), median)
+        mad = np.where(small, np.median(np.abs(log_ratio - np.median(log_ratio))), mad)
+        robust_z[scored] = (log_ratio - median) / np.maximum(MAD_SCALE * mad, MIN_LOG_SPREAD)
+
+    changed = (ratio >= MIN_RATIO_CHANGE) | (ratio <= 1 / MIN_RATIO_CHANGE) | ((baseline == 0) & (last_month > 0))
+    severity = np.searchsorted(np.array(Z_THRESHOLDS), np.nan_to_num(np.abs(robust_z)), side="right")
+    severity = np.where(changed & ~np.isnan(robust_z), severity, 0)
+    return {"baseline": baseline, "ratio": ratio, "robust_z": robust_z, "severity": severity}
+
+
+def detect(snapshot: np.ndarray) -> list:
+    """Filas anómalas (dicts con TABLE_COLUMNS) de la matriz de `parse_snapshot`."""
+    if not len(snapshot):
+        return []
+    column = {name: snapshot[:, i] for i, name in enumerate(SNAPSHOT_COLUMNS)}
+    last_month = column["last_month_consumption"]
+    result = score(last_month, np.column_stack([column[name] for name in HISTORY_COLUMNS]), column["product_id"])
+    anomalous = np.flatnonzero(result["severity"] > 0)
+    return [{
+        "center_id": int(column["center_id"][i]),
+        "product_id": int(column["product_id"][i]),
+        "region_id": None if np.isnan(column["region_id"][i]) else int(column["region_id"][i]),
+        "report_date": (EPOCH + datetime.timedelta(days=int(column["report_day"][i]))).isoformat(),
+        "last_month_consumption": int(last_month[i]),
+        "baseline": round(float(result["baseline"][i]), 3),
+        "ratio": None if np.isnan(result["ratio"][i]) else round(float(result["ratio"][i]), 3),
+        "robust_z": round(float(result["robust_z"][i]), 3),
+        "severity": int(result["severity"][i]),
+        # Respecto a la línea base del propio centro (el z se mide frente a las demás filas del producto)
+        "direction": "alza" if last_month[i] > result["baseline"][i] else "baja",
+    } for i in anomalous]
+
+
+def run() -> dict:
+    """Recalcula consumption_anomalies para todo el país y devuelve los conteos por severidad."""
+    started = time.perf_counter()
+    with db.get_connection() as conn:
+        snapshot = io.StringIO()
+        with conn.cursor() as cur:
+            cur.copy_expert(SNAPSHOT_COPY, snapshot)
+        rows = parse_snapshot(snapshot.getvalue())
+        anomalies = detect(rows)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for anomaly in anomalies:
+            writer.writerow(["" if anomaly[column] is None else anomaly[column] for column in TABLE_COLUMNS])
+        buffer.seek(0)
+        with conn.cursor() as cur:
+            # Se reemplaza todo en una transacción: las lecturas ven la ejecución anterior hasta el commit
+            cur.execute("DELETE FROM consumption_anomalies;")
+            cur.copy_expert(f"COPY consumption_anomalies ({', '.join(TABLE_COLUMNS)}) FROM STDIN "
+                            "WITH (FORMAT csv)", buffer)
+            cur.execute("ANALYZE consumption_anomalies;")
+        conn.commit()
+
+    severities = np.bincount([a["severity"] for a in anomalies], minlength=len(Z_THRESHOLDS) + 1)
+    return {"rows_scored": len(rows), "anomalies": len(anomalies),
+            "by_severity": {level: int(severities[level]) for level in range(1, len(Z_THRESHOLDS) + 1)},
+            "seconds": round(time.perf_counter() - started, 2)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args(argv)
+    try:
+        summary = run()
+    except (db.ConnectionUnavailable, psycopg2.Error) as e:
+        print(f"Error en la detección de anomalías: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_pool()
+    print(f"{summary['rows_scored']} filas analizadas, {summary['anomalies']} anomalías "
+          f"(leves {summary['by_severity'][1]}, moderadas {summary['by_severity'][2]}, "
+          f"graves {summary['by_severity'][3]}) en {summary['seconds']} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
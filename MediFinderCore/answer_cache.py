@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import psycopg
+import psycopg2
+
+from . import async_db, db
+
+# Número máximo de respuestas que se recuerdan (las menos usadas se descartan primero).
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+
+# Versión de los datos (migración 003); las cargas la suben una vez al confirmar (migración 010).
+DATA_VERSION_QUERY = "SELECT version FROM data_version;"
+
+_MISSING = object()
+
+
+class AnswerCache:
+    """
+    Caché LRU de respuestas de herramientas, acotada a `max_entries`.
+
+    Cada entrada guarda la versión de los datos (tabla data_version) con la que se calculó.
+    Una entrada de otra versión cuenta como obsoleta: se descarta y la herramienta vuelve a
+    consultar la base de datos. Así las respuestas caducan en cuanto se carga inventario
+    nuevo, sin depender de tiempos de expiración.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # clave -> (versión, respuesta)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, version: Optional[int], default=None):
+        """Devuelve la respuesta guardada para `key` si se calculó con `version`; si no, `default`."""
+        if version is None or self.max_entries <= 0:
+            return default
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            if entry[0] != version:
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: Optional[int], value):
+        """Guarda `value` para `key` calculado con `version` (no hace nada si la versión es desconocida)."""
+        if version is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Métricas de uso: aciertos, fallos (incluidas las entradas obsoletas), descartes y tamaño."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Caché compartida por las herramientas públicas del proceso.
+answers = AnswerCache()
+
+
+def data_version() -> Optional[int]:
+    """
+    Versión actual de los datos (pool síncrono), o None si no se puede leer
+    (por ejemplo, sin la migración 003); con None la caché no se usa.
+    """
+    try:
+        with db.get_cursor() as cur:
+            cur.execute(DATA_VERSION_QUERY)
+            row = cur.fetchone()
+            return row["version"] if row else None
+    except psycopg2.Error:
+        return None
+
+
+async def adata_version() -> Optional[int]:
+    """Versión actual de los datos (pool asíncrono), o None si no se puede leer."""
+    try:
+        async with async_db.get_cursor() as cur:
+            await cur.execute(DATA_VERSION_QUERY)
+            row = await cur.fetchone()
+            return row["version"] if row else None
+    except psycopg.Error:
+        return None
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from . import metrics
+from .db import DB_CONFIG, POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT, ConnectionUnavailable
+
+# Cadena de conexión equivalente a DB_CONFIG para el driver asíncrono (psycopg 3).
+CONNINFO = make_conninfo(
+    host=DB_CONFIG["host"],
+    port=DB_CONFIG["port"],
+    dbname=DB_CONFIG["database"],
+    user=DB_CONFIG["user"],
+    password=DB_CONFIG["password"],
+)
+
+class TimedAsyncCursor(psycopg.AsyncCursor):
+    """Cursor asíncrono que suma el tiempo de cada consulta a la llamada de herramienta en curso (ver metrics)."""
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            metrics.add_query_time(time.perf_counter() - start, query, params)
+
+
+# Argumentos de cada conexión del pool; sin instrumentación se usa el cursor original.
+CONNECTION_KWARGS = {"row_factory": dict_row}
+if metrics.ENABLED:
+    CONNECTION_KWARGS["cursor_factory"] = TimedAsyncCursor
+
+# --- Pool asíncrono compartido por todo el proceso ---
+# Un AsyncConnectionPool queda ligado al event loop en el que se abre, así que se guarda
+# junto con su loop y su pid y se vuelve a crear si cualquiera de los dos cambia.
+
+_pool: Optional[AsyncConnectionPool] = None
+_pool_loop: Optional[asyncio.AbstractEventLoop] = None
+_pool_pid: Optional[int] = None
+_pool_lock: Optional[asyncio.Lock] = None
+_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _pool_is_current(loop) -> bool:
+    return _pool is not None and _pool_loop is loop and _pool_pid == os.getpid()
+
+
+async def get_pool() -> AsyncConnectionPool:
+    """Devuelve el pool asíncrono del proceso para el event loop actual, abriéndolo en el primer uso."""
+    global _pool, _pool_loop, _pool_pid, _pool_lock, _lock_loop
+    loop = asyncio.get_running_loop()
+    if _pool_is_current(loop):
+        return _pool
+    if _lock_loop is not loop:
+        _pool_lock, _lock_loop = asyncio.Lock(), loop
+    async with _pool_lock:
+        if not _pool_is_current(loop):
+            pool = AsyncConnectionPool(
+                CONNINFO,
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                timeout=POOL_TIMEOUT,
+                kwargs=CONNECTION_KWARGS,
+                check=AsyncConnectionPool.check_connection,
+                name="medifinder-async",
+                open=False,
+            )
+            # No se espera a llenar el pool: si la base de datos no responde, el error
+            # aparece al pedir una conexión y no al importar las herramientas.
+            with metrics.detached():
+                await pool.open(wait=False)
+            _pool, _pool_loop, _pool_pid = pool, loop, os.getpid()
+    return _pool
+
+
+async def close_pool():
+    """Cierra el pool asíncrono del proceso."""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+@asynccontextmanager
+async def get_connection():
+    """
+    Presta una conexión asíncrona del pool compartido durante el bloque `async with`.
+    Confirma la transacción si el bloque termina bien y la revierte si lanza una excepción.
+    """
+    start = time.perf_counter()
+    pool = await get_pool()
+    try:
+        conn = await pool.getconn()
+    except PoolTimeout as e:
+        print(f"Error al conectar con la base de datos: {e}")
+        raise ConnectionUnavailable(str(e)) from e
+    metrics.add_connect_time(time.perf_counter() - start)
+    try:
+        yield conn
+        await conn.commit()
+    except BaseException:
+        try:
+            await conn.rollback()
+        except psycopg.Error:
+            pass
+        raise
+    finally:
+        await pool.putconn(conn)
+
+
+@asynccontextmanager
+async def get_cursor():
+    """Presta un cursor asíncrono cuyas filas son diccionarios."""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            yield cur
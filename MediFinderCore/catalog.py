@@ -0,0 +1,227 @@
+import asyncio
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from . import answer_cache, async_db, db
+
+# Segundos que un catálogo cargado se considera vigente antes de recargarlo desde la base de datos.
+CATALOG_TTL = float(os.getenv("CATALOG_TTL_SECONDS", "600"))
+# Número máximo de búsquedas por nombre (término -> fila) que se recuerdan por catálogo.
+CATALOG_LRU_SIZE = int(os.getenv("CATALOG_LRU_SIZE", "4096"))
+# Segundos durante los que se reutiliza la última versión de los datos leída: los catálogos no
+# consultan la versión en cada búsqueda, sino como mucho una vez por intervalo para todos ellos.
+CATALOG_VERSION_CHECK = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "2"))
+
+# (instante de la lectura, versión) de la última consulta de la versión de los datos
+_checked_version = (None, None)
+
+
+def normalize_name(text: str) -> str:
+    """Normaliza un nombre para compararlo: minúsculas, sin tildes y con espacios simples."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    without_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return re.sub(r"\s+", " ", without_accents).strip().lower()
+
+
+def _recent_version() -> tuple:
+    """(True, versión) si la última versión leída tiene menos de CATALOG_VERSION_CHECK segundos."""
+    read_at, version = _checked_version
+    if read_at is not None and time.monotonic() - read_at <= CATALOG_VERSION_CHECK:
+        return True, version
+    return False, None
+
+
+def current_data_version() -> Optional[int]:
+    """Versión de los datos para decidir si recargar los catálogos (pool síncrono, con intervalo)."""
+    global _checked_version
+    recent, version = _recent_version()
+    if not recent:
+        version = answer_cache.data_version()
+        _checked_version = (time.monotonic(), version)
+    return version
+
+
+async def acurrent_data_version() -> Optional[int]:
+    """Versión asíncrona de `current_data_version`."""
+    global _checked_version
+    recent, version = _recent_version()
+    if not recent:
+        version = await answer_cache.adata_version()
+        _checked_version = (time.monotonic(), version)
+    return version
+
+
+class CatalogTable:
+    """
+    Copia en memoria de una tabla pequeña (regiones, centros, productos) con un índice
+    por nombre normalizado.
+
+    `resolve` reproduce el `WHERE name ILIKE '%término%' LIMIT 1` de las herramientas sin ir
+    a la base de datos: primero busca una coincidencia exacta y, si no la hay, la primera
+    fila (por nombre) que contenga el término. Los resultados se recuerdan en un LRU acotado.
+    La tabla entera se recarga cuando cambia la versión de los datos (migración 003, así los
+    productos y centros nuevos de una carga se resuelven a los pocos segundos, ver
+    CATALOG_VERSION_CHECK), cuando vence su TTL o tras llamar a `invalidate`.
+    """
+
+    def __init__(self, name: str, query: str, id_column: str,
+                 ttl: float = CATALOG_TTL, lru_size: int = CATALOG_LRU_SIZE):
+        self.name = name
+        self.query = query
+        self.id_column = id_column
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self._rows = []       # Filas ordenadas por nombre
+        self._by_id = {}
+        self._by_name = {}    # Nombre normalizado -> fila
+        self._normalized = [] # Nombres normalizados, en el mismo orden que _rows
+        self._lru = OrderedDict()
+        self._loaded_at = None
+        self._data_version = None  # Versión de los datos con la que se cargó
+        self.version = 0      # Se incrementa en cada carga; permite invalidar estructuras derivadas
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # Un asyncio.Lock queda ligado a su event loop: se vuelve a crear si cambia (como el pool de async_db).
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._async_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def is_stale(self, data_version: Optional[int] = None) -> bool:
+        """True si el catálogo no está cargado, venció su TTL o se cargó con otra versión de los datos."""
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            return True
+        return data_version is not None and data_version != self._data_version
+
+    def load(self, rows, data_version: Optional[int] = None):
+        """Reemplaza el contenido del catálogo con las filas dadas (leídas con `data_version`)."""
+        rows = sorted((dict(row) for row in rows), key=lambda row: row["name"])
+        normalized = [normalize_name(row["name"]) for row in rows]
+        by_name = {}
+        for key, row in zip(normalized, rows):
+            by_name.setdefault(key, row)
+        with self._lock:
+            self._rows = rows
+            self._normalized = normalized
+            self._by_id = {row[self.id_column]: row for row in rows}
+            self._by_name = by_name
+            self._lru.clear()
+            self._loaded_at = time.monotonic()
+            self._data_version = data_version
+            self.version += 1
+
+    def invalidate(self):
+        """Fuerza la recarga del catálogo en el próximo uso."""
+        with self._lock:
+            self._loaded_at = None
+            self._lru.clear()
+
+    def refresh(self):
+        """Recarga el catálogo desde la base de datos si está vencido (pool síncrono)."""
+        # La versión se lee antes que las filas: si cambia entre medio, la próxima llamada recarga otra vez
+        data_version = current_data_version()
+        if self.is_stale(data_version):
+            with self._refresh_lock:
+                if self.is_stale(data_version):
+                    with db.get_cursor() as cur:
+                        cur.execute(self.query)
+                        self.load(cur.fetchall(), data_version)
+
+    async def arefresh(self):
+        """Recarga el catálogo desde la base de datos si está vencido (pool asíncrono)."""
+        data_version = await acurrent_data_version()
+        if self.is_stale(data_version):
+            loop = asyncio.get_running_loop()
+            if self._async_lock_loop is not loop:
+                self._async_lock, self._async_lock_loop = asyncio.Lock(), loop
+            async with self._async_lock:
+                if self.is_stale(data_version):
+                    async with async_db.get_cursor() as cur:
+                        await cur.execute(self.query)
+                        self.load(await cur.fetchall(), data_version)
+
+    def resolve(self, term: str) -> Optional[dict]:
+        """Devuelve la fila cuyo nombre mejor coincide con `term`, o None. No recarga el catálogo."""
+        key = normalize_name(term)
+        if not key:
+            return None
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+            row = self._by_name.get(key)
+            if row is None:
+                row = next((r for r, name in zip(self._rows, self._normalized) if key in name), None)
+            self._lru[key] = row
+            if len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+            return row
+
+    def search(self, term: str, limit: int = 20) -> list:
+        """Devuelve hasta `limit` filas, ordenadas por nombre, cuyo nombre contiene `term`."""
+        key = normalize_name(term)
+        with self._lock:
+            rows, normalized = self._rows, self._normalized
+        matches = (row for row, name in zip(rows, normalized) if key in name)
+        return [row for _, row in zip(range(limit), matches)]
+
+    def get(self, row_id) -> Optional[dict]:
+        return self._by_id.get(row_id)
+
+    def all(self) -> list:
+        """Todas las filas, ordenadas por nombre."""
+        return list(self._rows)
+
+
+products = CatalogTable(
+    "products", "SELECT product_id, name FROM products;", "product_id")
+regions = CatalogTable(
+    "regions", "SELECT region_id, name FROM regions;", "region_id")
+centers = CatalogTable(
+    "medical_centers",
+    "SELECT center_id, name, region_id, address, latitude, longitude FROM medical_centers;",
+    "center_id")
+
+TABLES = (products, regions, centers)
+
+
+def invalidate():
+    """Invalida todos los catálogos (por ejemplo, después de cargar nuevos datos)."""
+    global _checked_version
+    _checked_version = (None, None)
+    for table in TABLES:
+        table.invalidate()
+
+
+def resolve_product(name: str) -> Optional[dict]:
+    products.refresh()
+    return products.resolve(name)
+
+
+def resolve_region(name: str) -> Optional[dict]:
+    regions.refresh()
+    return regions.resolve(name)
+
+
+def resolve_center(name: str) -> Optional[dict]:
+    centers.refresh()
+    return centers.resolve(name)
+
+
+async def aresolve_product(name: str) -> Optional[dict]:
+    await products.arefresh()
+    return products.resolve(name)
+
+
+async def aresolve_region(name: str) -> Optional[dict]:
+    await regions.arefresh()
+    return regions.resolve(name)
+
+
+async def aresolve_center(name: str) -> Optional[dict]:
+    await centers.arefresh()
+    return centers.resolve(name)
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import DictCursor
+from dotenv import load_dotenv
+
+from . import metrics
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Configuración de la base de datos
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": os.getenv("DB_PORT", "5432"),
+    "database": os.getenv("DB_NAME", "medifinder"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASS", "admin"),
+}
+
+# Configuración del pool de conexiones
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Segundos que se espera por una conexión libre antes de rendirse.
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Una conexión ociosa más de este número de segundos se verifica con 'SELECT 1' al sacarla del pool.
+POOL_HEALTHCHECK_AFTER = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", "30"))
+
+
+class ConnectionUnavailable(Exception):
+    """No se pudo obtener una conexión válida del pool."""
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones psycopg2 seguro para hilos.
+
+    Mantiene hasta `max_size` conexiones abiertas; las ociosas se reutilizan en orden LIFO
+    para que las menos usadas puedan caducar en el servidor sin afectar a las calientes.
+    Cada conexión se valida al sacarla del pool (conexión cerrada, estado de transacción
+    desconocido o un 'SELECT 1' si lleva demasiado tiempo ociosa).
+    """
+
+    def __init__(self, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 timeout: float = POOL_TIMEOUT, healthcheck_after: float = POOL_HEALTHCHECK_AFTER,
+                 **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Tamaño de pool inválido: min={min_size}, max={max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self.connect_kwargs = connect_kwargs or dict(DB_CONFIG)
+        self.pid = os.getpid()
+        self._idle = []  # Pila de tuplas (conexión, instante en que quedó ociosa)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def fill(self):
+        """Abre conexiones hasta alcanzar `min_size` conexiones ociosas."""
+        with self._lock:
+            missing = self.min_size - len(self._idle)
+        for _ in range(max(missing, 0)):
+            conn = self._connect()
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Saca una conexión sana del pool, abriendo una nueva si no hay ociosas."""
+        if self._closed:
+            raise ConnectionUnavailable("El pool de conexiones está cerrado.")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise ConnectionUnavailable(f"No hubo conexiones libres en {self.timeout} segundos.")
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._connect()
+                conn, idle_since = entry
+                if self._is_healthy(conn, idle_since):
+                    return conn
+                self._discard(conn)
+        except psycopg2.OperationalError as e:
+            self._slots.release()
+            print(f"Error al conectar con la base de datos: {e}")
+            raise ConnectionUnavailable(str(e)) from e
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, discard: bool = False):
+        """Devuelve una conexión al pool dejándola fuera de cualquier transacción."""
+        try:
+            if not discard and not self._closed and not conn.closed:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        discard = True
+            if discard or self._closed or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Presta una conexión durante el bloque `with`.
+        Confirma la transacción si el bloque termina bien y la revierte si lanza una excepción.
+        """
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            discard = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not discard:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def close(self):
+        """Cierra todas las conexiones ociosas; las prestadas se cierran al devolverse."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = len(self._idle)
+        return {"idle": idle, "max_size": self.max_size, "min_size": self.min_size}
+
+
+# --- Pool compartido por todo el proceso ---
+# Los paquetes MediFinderAgent, MediFinderBot y MediFinderWatcher tienen cada uno su propia
+# copia de las herramientas, pero todas importan este módulo, así que un proceso que sirva
+# a los tres (por ejemplo 'adk api_server') abre un único pool.
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Devuelve el pool del proceso, creándolo en el primer uso (o tras un fork)."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            # Tras un fork las conexiones del padre no pueden compartirse: se abandonan sin cerrarlas.
+            _pool = ConnectionPool()
+            try:
+                _pool.fill()
+            except psycopg2.OperationalError as e:
+                # El pool se llenará de forma perezosa cuando la base de datos esté disponible.
+                print(f"Error al conectar con la base de datos: {e}")
+        return _pool
+
+
+def close_pool():
+    """Cierra el pool del proceso (útil en scripts y al apagar el servidor)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+class TimedDictCursor(DictCursor):
+    """DictCursor que suma el tiempo de cada consulta a la llamada de herramienta en curso (ver metrics)."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.add_query_time(time.perf_counter() - start, query, vars)
+
+
+# Sin instrumentación se usa el DictCursor original.
+DEFAULT_CURSOR = TimedDictCursor if metrics.ENABLED else DictCursor
+
+
+@contextmanager
+def get_connection():
+    """Presta una conexión del pool compartido. Ver `ConnectionPool.connection`."""
+    start = time.perf_counter()
+    with get_pool().connection() as conn:
+        metrics.add_connect_time(time.perf_counter() - start)
+        yield conn
+
+
+@contextmanager
+def get_cursor(cursor_factory=DEFAULT_CURSOR):
+    """Presta un cursor (DictCursor por defecto) sobre una conexión del pool compartido."""
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=cursor_factory) as cur:
+            yield cur
@@ -0,0 +1,88 @@
+import json
+import math
+import os
+from collections import Counter
+from numbers import Number
+from typing import Iterable, Optional, Sequence
+
+# Presupuesto aproximado de tokens para las filas de un resultado de herramienta.
+TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "1500"))
+# Estimación de caracteres por token para texto JSON (aproximación conservadora para Gemini).
+CHARS_PER_TOKEN = 4
+# Columnas de texto para las que el resumen incluye un conteo por valor.
+COUNT_BY_COLUMNS = ("status_indicator",)
+# Columnas numéricas sin sentido para sumar (además de las que terminan en '_id').
+NON_SUMMABLE_COLUMNS = ("latitude", "longitude")
+
+
+def estimate_tokens(value) -> int:
+    """Estima cuántos tokens ocupa `value` serializado como JSON compacto."""
+    text = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def summarize_rows(rows: Sequence[dict], columns: Sequence[str],
+                   count_by: Iterable[str] = COUNT_BY_COLUMNS) -> dict:
+    """
+    Estadísticas de todas las filas (no solo de las que caben en el presupuesto):
+    número de filas, total/mínimo/máximo de cada columna numérica (salvo ids y coordenadas)
+    y conteos por valor de las columnas de `count_by`.
+    """
+    summary = {"count": len(rows)}
+    for column in columns:
+        if column.endswith("_id") or column in NON_SUMMABLE_COLUMNS:
+            continue
+        values = [row[column] for row in rows
+                  if isinstance(row[column], Number) and not isinstance(row[column], bool)]
+        if values:
+            summary[column] = {"total": _round(sum(values)), "min": _round(min(values)), "max": _round(max(values))}
+    for column in count_by:
+        if column in columns:
+            summary[f"{column}_counts"] = dict(Counter(row[column] for row in rows))
+    return summary
+
+
+def encode_rows(rows: Iterable, token_budget: Optional[int] = None,
+                count_by: Iterable[str] = COUNT_BY_COLUMNS) -> dict:
+    """
+    Codifica filas (dicts o filas de cursor) en formato columnar para el contexto del LLM:
+
+        {"columns": [...], "rows": [[...], ...], "total_rows": n, "omitted_rows": k, "summary": {...}}
+
+    Los nombres de columna aparecen una sola vez en lugar de repetirse en cada fila. Las filas
+    se conservan en orden mientras quepan en `token_budget` (por defecto TOOL_RESULT_TOKEN_BUDGET);
+    siempre se incluye al menos una. `summary` se calcula sobre todas las filas, así que los
+    totales siguen siendo exactos cuando se omiten filas.
+    """
+    rows = [dict(row) for row in rows]
+    budget = TOKEN_BUDGET if token_budget is None else token_budget
+    columns = list(rows[0].keys()) if rows else []
+    summary = summarize_rows(rows, columns, count_by)
+
+    used = estimate_tokens({"columns": columns, "summary": summary})
+    kept = []
+    for row in rows:
+        values = [row[column] for column in columns]
+        cost = estimate_tokens(values) + 1
+        if kept and used + cost > budget:
+            break
+        kept.append(values)
+        used += cost
+
+    return {
+        "columns": columns,
+        "rows": kept,
+        "total_rows": len(rows),
+        "omitted_rows": len(rows) - len(kept),
+        "summary": summary,
+    }
+
+
+def decode_rows(table: dict) -> list:
+    """Reconstruye la lista de dicts a partir de un resultado de `encode_rows` (solo filas incluidas)."""
+    columns = table["columns"]
+    return [dict(zip(columns, values)) for values in table["rows"]]
+
+
+def _round(value):
+    return round(value, 2) if isinstance(value, float) else value
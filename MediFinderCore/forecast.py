@@ -0,0 +1,235 @@
+"""
+Proyección de quiebres de stock sobre la última foto del inventario (inventory_latest).
+
+La foto completa se carga en arrays de NumPy (una posición por centro y producto) y la
+proyección se calcula para todas las filas a la vez, sin recorrerlas en Python:
+
+* Consumo mensual: mezcla del CPMA (`avg_monthly_consumption`) y del consumo del último mes,
+  con peso RECENT_WEIGHT para el último mes; si falta uno de los dos se usa el otro.
+* Tendencia anual: ajuste log-lineal sobre los CPMA de hace 36, 24 y 12 meses y el actual
+  (los positivos, al menos dos), acotado a [MIN_ANNUAL_GROWTH, MAX_ANNUAL_GROWTH].
+* Días de cobertura: días hasta consumir `current_stock` con ese consumo creciendo (o
+  decreciendo) de forma continua según la tendencia, contados desde la fecha de reporte.
+
+La foto se lee con COPY ... TO STDOUT (CSV, NULL como 'nan') y np.loadtxt la convierte en C a
+una matriz de float64, sin crear un objeto de Python por fila; se recarga cuando cambia la
+versión de los datos (migración 003).
+"""
+import asyncio
+import datetime
+import io
+import math
+import os
+import threading
+import warnings
+from typing import Optional
+
+import numpy as np
+
+from . import answer_cache, async_db, db
+
+# Peso del consumo del último mes frente al CPMA en el consumo mensual proyectado.
+RECENT_WEIGHT = float(os.getenv("FORECAST_RECENT_WEIGHT", "0.4"))
+# Límites de la tendencia anual del consumo (0.5 = se reduce a la mitad en un año).
+MIN_ANNUAL_GROWTH = 0.5
+MAX_ANNUAL_GROWTH = 2.0
+DAYS_PER_YEAR = 365.25
+
+SNAPSHOT_QUERY = """
+    SELECT
+        il.center_id, il.product_id, mc.region_id, il.current_stock,
+        il.avg_monthly_consumption, il.last_month_consumption,
+        il.cpma_12_months_ago, il.cpma_24_months_ago, il.cpma_36_months_ago,
+        il.report_date - DATE '1970-01-01' AS report_day
+    FROM inventory_latest il
+    JOIN medical_centers mc ON il.center_id = mc.center_id
+"""
+SNAPSHOT_COPY = f"COPY ({SNAPSHOT_QUERY}) TO STDOUT WITH (FORMAT csv, NULL 'nan')"
+SNAPSHOT_COLUMNS = ("center_id", "product_id", "region_id", "current_stock", "avg_monthly_consumption",
+                    "last_month_consumption", "cpma_12_months_ago", "cpma_24_months_ago",
+                    "cpma_36_months_ago", "report_day")
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def parse_snapshot(text: str) -> np.ndarray:
+    """Matriz (filas x SNAPSHOT_COLUMNS) del CSV de SNAPSHOT_COPY; los NULL quedan como NaN."""
+    if not text:
+        return np.empty((0, len(SNAPSHOT_COLUMNS)))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # np.loadtxt avisa si no hay filas
+        return np.loadtxt(io.StringIO(text), delimiter=",", dtype=np.float64, ndmin=2)
+
+
+def annual_growth(cpma, cpma_12, cpma_24, cpma_36) -> np.ndarray:
+    """
+    Factor de crecimiento anual del consumo: exp de la pendiente de la recta de mínimos cuadrados
+    de log(CPMA) frente a los años (-3, -2, -1, 0), usando solo los CPMA positivos. Con menos
+    de dos puntos el factor es 1.
+    """
+    history = np.column_stack([cpma_36, cpma_24, cpma_12, cpma]).astype(np.float64)
+    years = np.array([-3.0, -2.0, -1.0, 0.0])
+    valid = history > 0  # NaN > 0 es False
+    logs = np.log(np.where(valid, history, 1.0))
+    n = valid.sum(axis=1)
+    sum_t = (valid * years).sum(axis=1)
+    sum_tt = (valid * years ** 2).sum(axis=1)
+    sum_y = np.where(valid, logs, 0.0).sum(axis=1)
+    sum_ty = np.where(valid, logs * years, 0.0).sum(axis=1)
+    denominator = n * sum_tt - sum_t ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(n >= 2, (n * sum_ty - sum_t * sum_y) / denominator, 0.0)
+    return np.clip(np.exp(np.nan_to_num(slope)), MIN_ANNUAL_GROWTH, MAX_ANNUAL_GROWTH)
+
+
+def monthly_consumption(cpma, last_month) -> np.ndarray:
+    """Consumo mensual proyectado: CPMA y último mes mezclados con RECENT_WEIGHT (NaN si faltan ambos)."""
+    cpma = np.asarray(cpma, dtype=np.float64)
+    last_month = np.asarray(last_month, dtype=np.float64)
+    blended = (1 - RECENT_WEIGHT) * cpma + RECENT_WEIGHT * last_month
+    return np.where(np.isnan(cpma), last_month, np.where(np.isnan(last_month), cpma, blended))
+
+
+def days_of_supply(stock, monthly_rate, growth) -> np.ndarray:
+    """
+    Días hasta agotar `stock` con un consumo diario inicial de monthly_rate * 12 / 365.25 que
+    varía de forma continua según `growth` por año. inf si no hay consumo o si, al decrecer,
+    el stock no llega a agotarse; 0 sin stock.
+    """
+    stock = np.asarray(stock, dtype=np.float64)
+    daily = np.asarray(monthly_rate, dtype=np.float64) * 12 / DAYS_PER_YEAR
+    rate = np.log(growth) / DAYS_PER_YEAR  # crecimiento continuo por día
+    with np.errstate(divide="ignore", invalid="ignore"):
+        flat = stock / daily
+        # Consumo acumulado daily * (e^(rate t) - 1) / rate = stock  ->  t = log(1 + stock rate / daily) / rate
+        argument = 1 + stock * rate / daily
+        curved = np.where(argument > 0, np.log(np.where(argument > 0, argument, 1.0)) / rate, np.inf)
+        days = np.where(np.abs(rate) < 1e-12, flat, curved)
+    days = np.where(np.isnan(daily) | (daily <= 0), np.inf, days)
+    return np.where(stock <= 0, 0.0, days)
+
+
+class StockForecast:
+    """
+    Proyección de todas las filas de inventory_latest, en arrays alineados por posición.
+
+    `reference_day` es la fecha de reporte más reciente (días desde 1970-01-01): la cobertura
+    restante de cada fila se cuenta desde ahí, descontando lo consumido desde su propio reporte.
+    """
+
+    def __init__(self, snapshot: np.ndarray, version: Optional[int] = None):
+        """`snapshot` es la matriz de `parse_snapshot`: una fila por centro x producto."""
+        self.version = version
+        columns = dict(zip(SNAPSHOT_COLUMNS, snapshot.T))
+        self.size = len(snapshot)
+        self.center_id = columns["center_id"].astype(np.int64)
+        self.product_id = columns["product_id"].astype(np.int64)
+        self.region_id = np.nan_to_num(columns["region_id"], nan=-1).astype(np.int64)
+        self.current_stock = columns["current_stock"]
+        self.report_day = columns["report_day"].astype(np.int64)
+        self.monthly_rate = monthly_consumption(columns["avg_monthly_consumption"], columns["last_month_consumption"])
+        self.annual_growth = annual_growth(columns["avg_monthly_consumption"], columns["cpma_12_months_ago"],
+                                           columns["cpma_24_months_ago"], columns["cpma_36_months_ago"])
+        self.days_of_supply = days_of_supply(self.current_stock, self.monthly_rate, self.annual_growth)
+        self.reference_day = int(self.report_day.max()) if self.size else 0
+        self.remaining_days = self.days_of_supply - (self.reference_day - self.report_day)
+
+    @property
+    def reference_date(self) -> datetime.date:
+        return EPOCH + datetime.timedelta(days=self.reference_day)
+
+    def at_risk(self, horizon_days: int, region_id: Optional[int] = None,
+                product_id: Optional[int] = None) -> np.ndarray:
+        """
+        Posiciones de las filas con stock que se agotan dentro de `horizon_days` desde la fecha
+        de referencia, de la más urgente a la menos urgente.
+        """
+        mask = (self.current_stock > 0) & (self.remaining_days <= horizon_days)
+        if region_id is not None:
+            mask &= self.region_id == region_id
+        if product_id is not None:
+            mask &= self.product_id == product_id
+        positions = np.flatnonzero(mask)
+        return positions[np.argsort(self.remaining_days[positions], kind="stable")]
+
+    def stockout_date(self, position: int) -> Optional[datetime.date]:
+        days = self.days_of_supply[position]
+        if not math.isfinite(days):
+            return None
+        return EPOCH + datetime.timedelta(days=int(self.report_day[position]) + math.floor(days))
+
+
+def read_snapshot() -> str:
+    """CSV de la foto actual (SNAPSHOT_COPY) leído con el pool síncrono."""
+    buffer = io.StringIO()
+    with db.get_cursor() as cur:
+        cur.copy_expert(SNAPSHOT_COPY, buffer)
+    return buffer.getvalue()
+
+
+async def aread_snapshot() -> str:
+    """CSV de la foto actual (SNAPSHOT_COPY) leído con el pool asíncrono."""
+    chunks = []
+    async with async_db.get_cursor() as cur:
+        async with cur.copy(SNAPSHOT_COPY) as copy:
+            async for data in copy:
+                chunks.append(bytes(data))
+    return b"".join(chunks).decode()
+
+
+_forecast: Optional[StockForecast] = None
+_forecast_lock = threading.Lock()
+# Un asyncio.Lock queda ligado a su event loop: se vuelve a crear si cambia (como el pool de async_db).
+_async_lock: Optional[asyncio.Lock] = None
+_async_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _cached(version: Optional[int]) -> Optional[StockForecast]:
+    forecast = _forecast
+    if forecast is not None and version is not None and forecast.version == version:
+        return forecast
+    return None
+
+
+def _store(text: str, version: Optional[int]) -> StockForecast:
+    global _forecast
+    forecast = StockForecast(parse_snapshot(text), version)
+    _forecast = forecast
+    return forecast
+
+
+def get_forecast() -> StockForecast:
+    """Proyección de la foto actual (pool síncrono); se recalcula si cambió la versión de los datos."""
+    version = answer_cache.data_version()
+    forecast = _cached(version)
+    if forecast is None:
+        with _forecast_lock:
+            forecast = _cached(version)
+            if forecast is None:
+                forecast = _store(read_snapshot(), version)
+    return forecast
+
+
+async def aget_forecast() -> StockForecast:
+    """
+    Proyección de la foto actual (pool asíncrono); se recalcula si cambió la versión de los datos.
+    Una sola llamada lee y proyecta la foto (las demás esperan al lock), y el parseo y la pasada
+    de NumPy corren en un hilo para no detener el event loop.
+    """
+    global _async_lock, _async_lock_loop
+    version = await answer_cache.adata_version()
+    forecast = _cached(version)
+    if forecast is None:
+        loop = asyncio.get_running_loop()
+        if _async_lock_loop is not loop:
+            _async_lock, _async_lock_loop = asyncio.Lock(), loop
+        async with _async_lock:
+            forecast = _cached(version)
+            if forecast is None:
+                forecast = await asyncio.to_thread(_store, await aread_snapshot(), version)
+    return forecast
+
+
+def invalidate():
+    """Descarta la proyección en memoria (se recalcula en el próximo uso)."""
+    global _forecast
+    _forecast = None
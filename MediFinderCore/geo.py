@@ -0,0 +1,117 @@
+import math
+import threading
+from typing import Iterable, Optional
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from . import catalog
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _to_unit_vectors(lat, lon) -> np.ndarray:
+    """Convierte latitudes/longitudes en grados a vectores unitarios 3D."""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def _chord_to_km(chord):
+    """Distancia de cuerda entre vectores unitarios -> distancia sobre la esfera (haversine) en km."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def _km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def nearest_pairs(point_lat, point_lon, query_lat, query_lon, k: int, max_km: float) -> tuple:
+    """
+    Para cada punto de consulta, sus `k` puntos más cercanos a `max_km` o menos. Devuelve tres
+    arrays alineados (posición de la consulta, posición del punto, distancia en km).
+    """
+    points = _to_unit_vectors(point_lat, point_lon)
+    k = min(k, len(points))
+    if k < 1 or len(query_lat) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=float)
+    chords, idx = cKDTree(points).query(_to_unit_vectors(query_lat, query_lon), k=k,
+                                        distance_upper_bound=_km_to_chord(max_km))
+    chords, idx = chords.reshape(len(query_lat), k), idx.reshape(len(query_lat), k)
+    found = np.isfinite(chords)  # Sin vecino dentro del radio: distancia inf
+    queries = np.nonzero(found)[0]
+    return queries, idx[found], _chord_to_km(chords[found])
+
+
+class CenterSpatialIndex:
+    """
+    Índice espacial (KD-tree) sobre las coordenadas de los centros médicos.
+
+    Los centros se proyectan a vectores unitarios 3D: la distancia euclídea entre ellos (cuerda)
+    crece igual que la distancia de gran círculo, así que un KD-tree ordinario responde
+    consultas de k vecinos y de radio con distancias haversine exactas.
+    """
+
+    def __init__(self, centers: Iterable[dict]):
+        located = [c for c in centers if c.get("latitude") is not None and c.get("longitude") is not None]
+        self.center_ids = np.array([c["center_id"] for c in located], dtype=np.int64)
+        self.size = len(located)
+        self._tree = cKDTree(_to_unit_vectors(
+            [c["latitude"] for c in located], [c["longitude"] for c in located])) if located else None
+
+    def nearest(self, lat: float, lon: float, k: int = 5, radius_km: Optional[float] = None,
+                allowed: Optional[set] = None) -> list:
+        """
+        Devuelve hasta `k` tuplas (center_id, distancia_km), de la más cercana a la más lejana.
+        Si se da `allowed`, solo se consideran esos center_id; si se da `radius_km`, solo los
+        centros dentro de ese radio.
+        """
+        if self._tree is None or k < 1:
+            return []
+        point = _to_unit_vectors([lat], [lon])[0]
+
+        if radius_km is not None:
+            idx = np.asarray(self._tree.query_ball_point(point, _km_to_chord(radius_km)), dtype=np.int64)
+            if idx.size == 0:
+                return []
+            chords = np.linalg.norm(self._tree.data[idx] - point, axis=1)
+            found = self._filter(idx, chords, allowed)
+            return found[:k]
+
+        # Sin radio: se amplía la búsqueda de vecinos hasta reunir k centros permitidos.
+        k_query = k if allowed is None else min(self.size, k * 4)
+        while True:
+            k_query = min(k_query, self.size)
+            chords, idx = self._tree.query(point, k=k_query)
+            chords, idx = np.atleast_1d(chords), np.atleast_1d(idx)
+            found = self._filter(idx, chords, allowed)
+            if len(found) >= k or k_query >= self.size:
+                return found[:k]
+            k_query *= 4
+
+    def _filter(self, idx: np.ndarray, chords: np.ndarray, allowed: Optional[set]) -> list:
+        order = np.argsort(chords, kind="stable")
+        ids = self.center_ids[idx[order]]
+        distances = _chord_to_km(chords[order])
+        return [(int(cid), float(dist)) for cid, dist in zip(ids, distances)
+                if allowed is None or cid in allowed]
+
+
+_index: Optional[CenterSpatialIndex] = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_center_index() -> CenterSpatialIndex:
+    """
+    Devuelve el índice espacial construido a partir del catálogo de centros en memoria.
+    Se reconstruye cuando el catálogo se recarga; no consulta la base de datos.
+    """
+    global _index, _index_version
+    with _index_lock:
+        if _index is None or _index_version != catalog.centers.version:
+            _index = CenterSpatialIndex(catalog.centers.all())
+            _index_version = catalog.centers.version
+        return _index
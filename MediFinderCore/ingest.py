@@ -0,0 +1,582 @@
+"""
+Carga masiva de los archivos mensuales de inventario del MINSA.
+
+Cada archivo CSV se transmite a PostgreSQL con COPY hacia una tabla temporal de staging y,
+desde ahí, se actualizan `regions`, `medical_centers`, `products` e `inventory` con sentencias
+set-based (sin INSERTs fila a fila):
+
+* `status_indicator` se calcula con `inventory_status_indicator()`, la misma regla que usa el
+  trigger `check_inventory_stock`, que queda desactivado durante la carga (migración 002).
+* Las filas de inventario cuyo `content_hash` no cambió no se reescriben.
+* Con el inventario particionado por mes (migración 005) se crean antes las particiones que falten.
+* El resumen de consumo por región, producto y mes (migración 007) se recalcula para los meses
+  del archivo en la misma transacción que el inventario.
+* Si el archivo cambió algo, la versión de los datos (migración 010) sube una sola vez, al
+  final de esa transacción, para que la caché de respuestas y los catálogos se renueven.
+* Con `--workers N` se cargan varios archivos en paralelo, cada uno en su propio proceso.
+* Los números se leen con el separador decimal de `--decimal` ('.' o ','; el otro es el de
+  miles). Las celdas vacías o con marcas de "sin dato" ('-', 'n/e'...) se cargan como NULL; una
+  fila con cualquier otro valor no numérico se rechaza sin detener el archivo y se informa su
+  línea (con `--rejects` se guardan todas en un CSV).
+
+Uso:
+    python -m MediFinderCore.ingest datos/ICI_2025_06.csv datos/ICI_2025_07.csv --workers 2
+    python -m MediFinderCore.ingest ICI_junio.csv --report-date 2025-06-01 --encoding LATIN1 --delimiter ';' \
+        --decimal ',' --rejects rechazos.csv
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import psycopg2
+from psycopg2 import sql
+
+from . import db
+from .catalog import normalize_name
+
+# Columnas reconocidas en los archivos de origen: nombre interno -> cabeceras aceptadas.
+# Las cabeceras se comparan sin distinguir mayúsculas, tildes ni espacios.
+SOURCE_COLUMNS = {
+    "center_code": ("center_code", "codigo_eess", "cod_ipress", "codigo_renaes", "cod_establecimiento"),
+    "center_name": ("center_name", "nombre_eess", "nombre_ipress", "establecimiento"),
+    "region_name": ("region_name", "region", "diresa", "departamento"),
+    "category": ("category", "categoria"),
+    "reporter_name": ("reporter_name", "nombre_reportante", "almacen"),
+    "institution_type": ("institution_type", "institucion", "tipo_institucion"),
+    "reporter_type": ("reporter_type", "tipo_reportante"),
+    "address": ("address", "direccion"),
+    "latitude": ("latitude", "latitud"),
+    "longitude": ("longitude", "longitud"),
+    "product_code": ("product_code", "codigo_medicamento", "cod_producto", "codigo_sismed"),
+    "product_name": ("product_name", "medicamento", "nombre_producto", "descripcion_producto"),
+    "product_type": ("product_type", "tipo_producto", "tipo"),
+    "dosage_form": ("dosage_form", "forma_farmaceutica"),
+    "strength": ("strength", "concentracion"),
+    "current_stock": ("current_stock", "stock", "stock_actual"),
+    "avg_monthly_consumption": ("avg_monthly_consumption", "cpma"),
+    "accumulated_consumption_4m": ("accumulated_consumption_4m", "consumo_acumulado_4m"),
+    "measurement": ("measurement", "medida", "meses_provision"),
+    "last_month_consumption": ("last_month_consumption", "consumo_ultimo_mes", "consumo_mes"),
+    "last_month_stock": ("last_month_stock", "stock_mes_anterior"),
+    "status_indicator": ("status_indicator", "situacion", "indicador"),
+    "cpma_12_months_ago": ("cpma_12_months_ago", "cpma_12"),
+    "cpma_24_months_ago": ("cpma_24_months_ago", "cpma_24"),
+    "cpma_36_months_ago": ("cpma_36_months_ago", "cpma_36"),
+    "accumulated_consumption_12m": ("accumulated_consumption_12m", "consumo_acumulado_12m"),
+    "report_date": ("report_date", "fecha_corte", "fecha_reporte", "periodo"),
+    "status": ("status", "estado"),
+}
+REQUIRED_COLUMNS = ("center_code", "product_code", "current_stock")
+# Columnas numéricas -> tipo al que se convierten.
+NUMERIC_COLUMNS = {
+    "latitude": "double precision",
+    "longitude": "double precision",
+    "current_stock": "integer",
+    "avg_monthly_consumption": "double precision",
+    "accumulated_consumption_4m": "integer",
+    "measurement": "double precision",
+    "last_month_consumption": "integer",
+    "last_month_stock": "integer",
+    "cpma_12_months_ago": "double precision",
+    "cpma_24_months_ago": "double precision",
+    "cpma_36_months_ago": "double precision",
+    "accumulated_consumption_12m": "integer",
+}
+
+# Clave del advisory lock que serializa la actualización de regiones, centros y productos
+# entre cargas paralelas (la tabla regions no tiene una clave única por nombre).
+DIMENSIONS_LOCK_KEY = 72_401_001
+
+# Meses posteriores al último del archivo para los que se crean particiones de inventario por adelantado.
+PARTITION_MONTHS_AHEAD = 2
+
+# Separador decimal aceptado -> separador de miles correspondiente.
+THOUSANDS_SEPARATORS = {".": ",", ",": "."}
+# Celdas numéricas que significan "sin dato" (se comparan en minúsculas y sin espacios alrededor).
+MISSING_NUMBER_MARKERS = ("-", "--", "n/e", "n/a", "na", "nd", "s/d", "sin dato")
+# Filas rechazadas que el CLI muestra por archivo cuando no se pide --rejects.
+REJECTS_SHOWN = 5
+
+
+class IngestError(Exception):
+    """El archivo de origen no tiene el formato esperado."""
+
+
+# Errores que se informan contra el archivo que los causó sin detener la carga de los demás:
+# formato, conexión, datos inválidos para PostgreSQL (fechas, números, codificación,
+# restricciones) y lectura del archivo.
+FILE_ERRORS = (IngestError, db.ConnectionUnavailable, psycopg2.Error, OSError, UnicodeError)
+
+
+def _header_key(header: str) -> str:
+    return normalize_name(header.lstrip("\ufeff")).replace(" ", "_")
+
+
+def map_header(header: list) -> list:
+    """
+    Traduce la cabecera del archivo a nombres internos. Las columnas desconocidas se
+    conservan en staging con un nombre neutro y se ignoran.
+    """
+    aliases = {alias: name for name, accepted in SOURCE_COLUMNS.items() for alias in accepted}
+    mapped, seen = [], set()
+    for position, column in enumerate(header):
+        name = aliases.get(_header_key(column))
+        if name is None or name in seen:
+            name = f"ignored_{position}"
+        seen.add(name)
+        mapped.append(name)
+    return mapped
+
+
+def _read_header(path: str, encoding: str, delimiter: str) -> list:
+    python_encoding = {"LATIN1": "latin-1", "WIN1252": "cp1252"}.get(encoding.upper(), encoding)
+    with open(path, newline="", encoding=python_encoding) as f:
+        header = next(csv.reader(f, delimiter=delimiter), None)
+    if not header:
+        raise IngestError(f"El archivo '{path}' está vacío.")
+    return header
+
+
+def number_pattern(decimal: str) -> str:
+    """
+    Expresión regular (válida en Python y en PostgreSQL) de un número escrito con el separador
+    `decimal`: dígitos con o sin separador de miles en grupos de tres ('1,234.5', '1234.5'),
+    decimales opcionales y exponente opcional. Con decimal '.', '12,5' no coincide.
+    """
+    if decimal not in THOUSANDS_SEPARATORS:
+        raise ValueError(f"Separador decimal no soportado: {decimal!r} (usa '.' o ',')")
+    d, t = re.escape(decimal), re.escape(THOUSANDS_SEPARATORS[decimal])
+    return rf"^[+-]?(([0-9]+|[0-9]{{1,3}}({t}[0-9]{{3}})+)({d}[0-9]*)?|{d}[0-9]+)([eE][+-]?[0-9]+)?$"
+
+
+def _num(column: str, cast: str, decimal: str) -> sql.Composable:
+    """
+    Expresión que convierte un texto de staging ('1,234.5', '', ' 7 ') en número, o NULL si no
+    es un número válido con el separador `decimal` (esas filas se rechazan, ver `_invalid_num`).
+    """
+    return sql.SQL(
+        "CASE WHEN btrim(s.{column}) ~ {pattern} "
+        "THEN replace(replace(btrim(s.{column}), {thousands}, ''), {decimal}, '.')::numeric::{cast} END"
+    ).format(column=sql.Identifier(column), pattern=sql.Literal(number_pattern(decimal)),
+             thousands=sql.Literal(THOUSANDS_SEPARATORS[decimal]), decimal=sql.Literal(decimal),
+             cast=sql.SQL(cast))
+
+
+def _invalid_num(column: str, decimal: str) -> sql.Composable:
+    """Expresión con 'columna: valor' si la celda no está vacía, no es una marca de "sin dato" ni un número; si no, NULL."""
+    return sql.SQL(
+        "CASE WHEN NULLIF(btrim(s.{column}), '') IS NOT NULL "
+        "AND lower(btrim(s.{column})) <> ALL({markers}::text[]) "
+        "AND btrim(s.{column}) !~ {pattern} THEN {name} || ': ' || btrim(s.{column}) END"
+    ).format(column=sql.Identifier(column), markers=sql.Literal(list(MISSING_NUMBER_MARKERS)),
+             pattern=sql.Literal(number_pattern(decimal)), name=sql.Literal(column))
+
+
+def _text(column: str, present: set) -> sql.Composable:
+    if column not in present:
+        return sql.SQL("NULL::text")
+    return sql.SQL("NULLIF(btrim(s.{}), '')").format(sql.Identifier(column))
+
+
+def load_file(path: str, report_date: Optional[str] = None, encoding: str = "UTF8",
+              delimiter: str = ",", decimal: str = ".") -> dict:
+    """
+    Carga un archivo CSV y devuelve un resumen con los conteos de filas. Las filas con valores
+    numéricos inválidos no se cargan y se devuelven en 'rejected_rows' (dicts con line,
+    center_code, product_code y values).
+    """
+    started = time.perf_counter()
+    number_pattern(decimal)  # Valida el separador antes de abrir una conexión
+    columns = map_header(_read_header(path, encoding, delimiter))
+    present = set(columns)
+    missing = [c for c in REQUIRED_COLUMNS if c not in present]
+    if "report_date" not in present and not report_date:
+        missing.append("report_date (o --report-date)")
+    if missing:
+        raise IngestError(f"Faltan columnas obligatorias en '{path}': {', '.join(missing)}")
+
+    def num(column):
+        cast = NUMERIC_COLUMNS[column]
+        return _num(column, cast, decimal) if column in present else sql.SQL("NULL::{}").format(sql.SQL(cast))
+
+    invalid_values = sql.SQL("array_remove(ARRAY[{}]::text[], NULL)").format(
+        sql.SQL(", ").join(_invalid_num(column, decimal) for column in NUMERIC_COLUMNS if column in present))
+
+    # La fecha de corte puede venir como AAAA-MM-DD o como periodo AAAAMM.
+    report_date_expr = (sql.SQL("{}::date").format(sql.Literal(report_date)) if report_date
+                        else sql.SQL("CASE WHEN btrim(s.report_date) ~ '^[0-9]{6}$' "
+                                     "THEN to_date(btrim(s.report_date), 'YYYYMM') "
+                                     "ELSE btrim(s.report_date)::date END"))
+
+    with db.get_connection() as conn:
+        try:
+            summary = _load_staged(conn, path, columns, present, num, invalid_values, report_date_expr,
+                                   encoding, delimiter)
+        finally:
+            # Las tablas temporales sobreviven al commit intermedio; se eliminan antes de devolver la conexión.
+            # Si la carga falló porque se cortó la conexión, la limpieza no debe ocultar ese error.
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                    with conn.cursor() as cur:
+                        cur.execute("DROP TABLE IF EXISTS staging_inventory, staging_parsed, staging_typed;")
+                    conn.commit()
+                except psycopg2.Error:
+                    conn.close()  # El pool descarta la conexión cerrada (y con ella las tablas temporales)
+
+    summary["file"] = path
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def _load_staged(conn, path, columns, present, num, invalid_values, report_date_expr,
+                 encoding, delimiter) -> dict:
+    file_columns = sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+    with conn.cursor() as cur:
+        # 1. Staging: todo como texto, transmitido con COPY directamente desde el archivo;
+        #    source_line numera las filas de datos en el orden del archivo
+        cur.execute(sql.SQL("CREATE TEMP TABLE staging_inventory ({}, source_line BIGSERIAL);").format(
+            sql.SQL(", ").join(sql.SQL("{} TEXT").format(sql.Identifier(c)) for c in columns)))
+        copy = sql.SQL(
+            "COPY staging_inventory ({}) FROM STDIN WITH (FORMAT csv, HEADER true, DELIMITER {}, ENCODING {})"
+        ).format(file_columns, sql.Literal(delimiter), sql.Literal(encoding))
+        with open(path, "rb") as f:
+            cur.copy_expert(copy.as_string(conn), f)
+        staged = cur.rowcount
+
+        # 2. Filas tipadas, con la lista de valores numéricos inválidos de cada una
+        parsed = sql.SQL("""
+            CREATE TEMP TABLE staging_parsed AS
+            SELECT
+                s.source_line,
+                {invalid_values} AS invalid_values,
+                btrim(s.center_code) AS center_code,
+                {center_name} AS center_name,
+                {region_name} AS region_name,
+                {category} AS category,
+                {reporter_name} AS reporter_name,
+                {institution_type} AS institution_type,
+                {reporter_type} AS reporter_type,
+                {address} AS address,
+                {latitude} AS latitude,
+                {longitude} AS longitude,
+                btrim(s.product_code) AS product_code,
+                {product_name} AS product_name,
+                upper(left({product_type}, 1)) AS product_type,
+                {dosage_form} AS dosage_form,
+                {strength} AS strength,
+                COALESCE({current_stock}, 0) AS current_stock,
+                {avg_monthly_consumption} AS avg_monthly_consumption,
+                {accumulated_consumption_4m} AS accumulated_consumption_4m,
+                {measurement} AS measurement,
+                {last_month_consumption} AS last_month_consumption,
+                {last_month_stock} AS last_month_stock,
+                {status_indicator} AS source_status_indicator,
+                {cpma_12_months_ago} AS cpma_12_months_ago,
+                {cpma_24_months_ago} AS cpma_24_months_ago,
+                {cpma_36_months_ago} AS cpma_36_months_ago,
+                {accumulated_consumption_12m} AS accumulated_consumption_12m,
+                {report_date} AS report_date,
+                COALESCE({status}, 'ACTIVO') AS status
+            FROM staging_inventory s
+            WHERE NULLIF(btrim(s.center_code), '') IS NOT NULL
+              AND NULLIF(btrim(s.product_code), '') IS NOT NULL;
+        """).format(
+            center_name=_text("center_name", present),
+            region_name=_text("region_name", present),
+            category=_text("category", present),
+            reporter_name=_text("reporter_name", present),
+            institution_type=_text("institution_type", present),
+            reporter_type=_text("reporter_type", present),
+            address=_text("address", present),
+            latitude=num("latitude"),
+            longitude=num("longitude"),
+            product_name=_text("product_name", present),
+            product_type=_text("product_type", present),
+            dosage_form=_text("dosage_form", present),
+            strength=_text("strength", present),
+            current_stock=num("current_stock"),
+            avg_monthly_consumption=num("avg_monthly_consumption"),
+            accumulated_consumption_4m=num("accumulated_consumption_4m"),
+            measurement=num("measurement"),
+            last_month_consumption=num("last_month_consumption"),
+            last_month_stock=num("last_month_stock"),
+            status_indicator=_text("status_indicator", present),
+            cpma_12_months_ago=num("cpma_12_months_ago"),
+            cpma_24_months_ago=num("cpma_24_months_ago"),
+            cpma_36_months_ago=num("cpma_36_months_ago"),
+            accumulated_consumption_12m=num("accumulated_consumption_12m"),
+            report_date=report_date_expr,
+            status=_text("status", present),
+            invalid_values=invalid_values,
+        )
+        cur.execute(parsed)
+        cur.execute("""
+            SELECT source_line + 1 AS line, center_code, product_code, array_to_string(invalid_values, '; ') AS values
+            FROM staging_parsed
+            WHERE cardinality(invalid_values) > 0
+            ORDER BY source_line;
+        """)
+        rejected = [dict(zip(("line", "center_code", "product_code", "values"), row)) for row in cur.fetchall()]
+
+        # Una fila válida por centro/producto/fecha (la última del archivo si se repite)
+        cur.execute("""
+            CREATE TEMP TABLE staging_typed AS
+            SELECT DISTINCT ON (center_code, product_code, report_date) *
+            FROM staging_parsed
+            WHERE cardinality(invalid_values) = 0
+            ORDER BY center_code, product_code, report_date, source_line DESC;
+        """)
+        cur.execute("ANALYZE staging_typed;")
+
+        # 3. Dimensiones: se serializan entre cargas paralelas con un advisory lock
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (DIMENSIONS_LOCK_KEY,))
+        cur.execute("""
+            INSERT INTO regions (name)
+            SELECT DISTINCT s.region_name
+            FROM staging_typed s
+            WHERE s.region_name IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM regions r WHERE upper(r.name) = upper(s.region_name));
+        """)
+        new_regions = cur.rowcount
+        cur.execute("""
+            INSERT INTO medical_centers AS mc (
+                code, name, region_id, category, reporter_name, institution_type,
+                reporter_type, address, latitude, longitude
+            )
+            SELECT DISTINCT ON (s.center_code)
+                s.center_code, COALESCE(s.center_name, s.center_code), r.region_id, s.category,
+                s.reporter_name, s.institution_type, s.reporter_type, s.address, s.latitude, s.longitude
+            FROM staging_typed s
+            LEFT JOIN regions r ON upper(r.name) = upper(s.region_name)
+            ORDER BY s.center_code, s.report_date DESC, r.region_id
+            ON CONFLICT (code) DO UPDATE SET
+                name = EXCLUDED.name,
+                region_id = COALESCE(EXCLUDED.region_id, mc.region_id),
+                category = COALESCE(EXCLUDED.category, mc.category),
+                reporter_name = COALESCE(EXCLUDED.reporter_name, mc.reporter_name),
+                institution_type = COALESCE(EXCLUDED.institution_type, mc.institution_type),
+                reporter_type = COALESCE(EXCLUDED.reporter_type, mc.reporter_type),
+                address = COALESCE(EXCLUDED.address, mc.address),
+                latitude = COALESCE(EXCLUDED.latitude, mc.latitude),
+                longitude = COALESCE(EXCLUDED.longitude, mc.longitude)
+            WHERE (mc.name, mc.region_id, mc.category, mc.reporter_name, mc.institution_type,
+                   mc.reporter_type, mc.address, mc.latitude, mc.longitude)
+               IS DISTINCT FROM
+                  (EXCLUDED.name, COALESCE(EXCLUDED.region_id, mc.region_id),
+                   COALESCE(EXCLUDED.category, mc.category), COALESCE(EXCLUDED.reporter_name, mc.reporter_name),
+                   COALESCE(EXCLUDED.institution_type, mc.institution_type),
+                   COALESCE(EXCLUDED.reporter_type, mc.reporter_type), COALESCE(EXCLUDED.address, mc.address),
+                   COALESCE(EXCLUDED.latitude, mc.latitude), COALESCE(EXCLUDED.longitude, mc.longitude));
+        """)
+        changed_centers = cur.rowcount
+        cur.execute("""
+            INSERT INTO products AS p (code, name, type_id, dosage_form, strength)
+            SELECT DISTINCT ON (s.product_code)
+                s.product_code, COALESCE(s.product_name, s.product_code), pt.type_id, s.dosage_form, s.strength
+            FROM staging_typed s
+            LEFT JOIN product_types pt ON pt.code = s.product_type
+            ORDER BY s.product_code, s.report_date DESC
+            ON CONFLICT (code) DO UPDATE SET
+                name = EXCLUDED.name,
+                type_id = COALESCE(EXCLUDED.type_id, p.type_id),
+                dosage_form = COALESCE(EXCLUDED.dosage_form, p.dosage_form),
+                strength = COALESCE(EXCLUDED.strength, p.strength)
+            WHERE (p.name, p.type_id, p.dosage_form, p.strength)
+               IS DISTINCT FROM
+                  (EXCLUDED.name, COALESCE(EXCLUDED.type_id, p.type_id),
+                   COALESCE(EXCLUDED.dosage_form, p.dosage_form), COALESCE(EXCLUDED.strength, p.strength));
+        """)
+        changed_products = cur.rowcount
+
+        # 4. Particiones mensuales del inventario (migración 005) para los meses del archivo y los siguientes
+        cur.execute("SELECT to_regproc('ensure_inventory_partitions') IS NOT NULL;")
+        if cur.fetchone()[0]:
+            cur.execute("""
+                SELECT ensure_inventory_partitions(
+                    min(report_date), (max(report_date) + make_interval(months => %s))::date)
+                FROM staging_typed;
+            """, (PARTITION_MONTHS_AHEAD,))
+    # Se confirma aquí para liberar el advisory lock antes de la parte pesada.
+    conn.commit()
+
+    with conn.cursor() as cur:
+        # 5. Inventario: upsert set-based, omitiendo filas con el mismo hash de contenido
+        cur.execute("SET LOCAL medifinder.bulk_load = 'on';")
+        cur.execute("""
+            WITH source AS (
+                SELECT
+                    mc.center_id, p.product_id, s.*,
+                    inventory_status_indicator(
+                        s.current_stock, s.avg_monthly_consumption, s.source_status_indicator
+                    ) AS status_indicator,
+                    md5(row(
+                        s.current_stock, s.avg_monthly_consumption, s.accumulated_consumption_4m,
+                        s.measurement, s.last_month_consumption, s.last_month_stock,
+                        s.source_status_indicator, s.cpma_12_months_ago, s.cpma_24_months_ago,
+                        s.cpma_36_months_ago, s.accumulated_consumption_12m, s.status
+                    )::text) AS content_hash,
+                    -- Se evalúa con la foto previa al upsert (RETURNING no admite xmax en tablas particionadas)
+                    EXISTS (
+                        SELECT 1 FROM inventory i
+                        WHERE i.center_id = mc.center_id AND i.product_id = p.product_id
+                          AND i.report_date = s.report_date
+                    ) AS existed
+                FROM staging_typed s
+                JOIN medical_centers mc ON mc.code = s.center_code
+                JOIN products p ON p.code = s.product_code
+            ),
+            upserted AS (
+                INSERT INTO inventory AS i (
+                    center_id, product_id, current_stock, avg_monthly_consumption,
+                    accumulated_consumption_4m, measurement, last_month_consumption, last_month_stock,
+                    status_indicator, cpma_12_months_ago, cpma_24_months_ago, cpma_36_months_ago,
+                    accumulated_consumption_12m, report_date, status, content_hash
+                )
+                SELECT
+                    center_id, product_id, current_stock, avg_monthly_consumption,
+                    accumulated_consumption_4m, measurement, last_month_consumption, last_month_stock,
+                    status_indicator, cpma_12_months_ago, cpma_24_months_ago, cpma_36_months_ago,
+                    accumulated_consumption_12m, report_date, status, content_hash
+                FROM source
+                ORDER BY center_id, product_id, report_date
+                ON CONFLICT (center_id, product_id, report_date) DO UPDATE SET
+                    current_stock = EXCLUDED.current_stock,
+                    avg_monthly_consumption = EXCLUDED.avg_monthly_consumption,
+                    accumulated_consumption_4m = EXCLUDED.accumulated_consumption_4m,
+                    measurement = EXCLUDED.measurement,
+                    last_month_consumption = EXCLUDED.last_month_consumption,
+                    last_month_stock = EXCLUDED.last_month_stock,
+                    status_indicator = EXCLUDED.status_indicator,
+                    cpma_12_months_ago = EXCLUDED.cpma_12_months_ago,
+                    cpma_24_months_ago = EXCLUDED.cpma_24_months_ago,
+                    cpma_36_months_ago = EXCLUDED.cpma_36_months_ago,
+                    accumulated_consumption_12m = EXCLUDED.accumulated_consumption_12m,
+                    status = EXCLUDED.status,
+                    content_hash = EXCLUDED.content_hash
+                WHERE i.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+                RETURNING center_id, product_id, report_date
+            )
+            SELECT
+                (SELECT count(*) FROM staging_typed),
+                count(*) FILTER (WHERE NOT s.existed),
+                count(*) FILTER (WHERE s.existed)
+            FROM upserted u
+            JOIN source s USING (center_id, product_id, report_date);
+        """)
+        typed_rows, inserted, updated = cur.fetchone()
+
+        # 6. Resumen de consumo (migración 007) de los meses del archivo, si cambió alguna fila
+        rollup_rows = 0
+        if inserted or updated:
+            cur.execute("SELECT to_regproc('refresh_consumption_rollup') IS NOT NULL;")
+            if cur.fetchone()[0]:
+                cur.execute("SELECT refresh_consumption_rollup(min(report_date), max(report_date)) FROM staging_typed;")
+                rollup_rows = cur.fetchone()[0]
+
+        # 7. Versión de los datos (migración 010): una vez por archivo y como última sentencia,
+        #    así el bloqueo de la fila de data_version solo dura lo que tarda el commit
+        if inserted or updated or new_regions or changed_centers or changed_products:
+            cur.execute("SELECT to_regproc('next_data_version') IS NOT NULL;")
+            if cur.fetchone()[0]:
+                cur.execute("SELECT next_data_version();")
+
+    conn.commit()
+    return {
+        "staged_rows": staged,
+        "inventory_inserted": inserted,
+        "inventory_updated": updated,
+        "inventory_unchanged": typed_rows - inserted - updated,
+        "new_regions": new_regions,
+        "centers_upserted": changed_centers,
+        "products_upserted": changed_products,
+        "rollup_rows": rollup_rows,
+        "rejected_rows": rejected,
+    }
+
+
+def _load_file_or_error(path: str, report_date: Optional[str], encoding: str, delimiter: str,
+                        decimal: str) -> dict:
+    """`load_file`, devolviendo {'file', 'error'} en lugar de lanzar los errores de FILE_ERRORS."""
+    try:
+        return load_file(path, report_date, encoding, delimiter, decimal)
+    except FILE_ERRORS as e:
+        return {"file": path, "error": str(e).strip() or type(e).__name__}
+
+
+def _load_file_worker(args) -> dict:
+    try:
+        return _load_file_or_error(*args)
+    finally:
+        db.close_pool()
+
+
+def load_files(paths: list, report_date: Optional[str] = None, encoding: str = "UTF8",
+               delimiter: str = ",", workers: int = 1, decimal: str = ".") -> list:
+    """
+    Carga varios archivos, en paralelo si `workers` > 1 (un proceso y una conexión por archivo).
+    Devuelve un resumen por archivo, en el orden de `paths`; cada archivo se carga en sus propias
+    transacciones, así que si uno falla los demás siguen y su resumen solo trae 'file' y 'error'.
+    """
+    jobs = [(path, report_date, encoding, delimiter, decimal) for path in paths]
+    if workers <= 1 or len(jobs) <= 1:
+        return [_load_file_or_error(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_load_file_worker, job) for job in jobs]
+        results = []
+        for path, future in zip(paths, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:  # p. ej. el proceso del archivo terminó de forma abrupta
+                results.append({"file": path, "error": str(e).strip() or type(e).__name__})
+        return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Archivos CSV a cargar.")
+    parser.add_argument("--report-date", help="Fecha de corte (AAAA-MM-DD) si el archivo no trae la columna.")
+    parser.add_argument("--encoding", default="UTF8", help="Codificación del archivo para COPY (UTF8, LATIN1...).")
+    parser.add_argument("--delimiter", default=",", help="Separador de columnas.")
+    parser.add_argument("--decimal", default=".", choices=sorted(THOUSANDS_SEPARATORS),
+                        help="Separador decimal de los números; el otro se toma como separador de miles.")
+    parser.add_argument("--rejects", help="CSV donde guardar las filas rechazadas por valores numéricos inválidos.")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Procesos para cargar archivos en paralelo.")
+    args = parser.parse_args(argv)
+
+    results = load_files(args.files, args.report_date, args.encoding, args.delimiter, args.workers, args.decimal)
+    failed = 0
+    rejected = []
+    for result in results:
+        if "error" in result:
+            print(f"Error en la carga de {result['file']}: {result['error']}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"{result['file']}: {result['staged_rows']} filas leídas, "
+              f"{result['inventory_inserted']} insertadas, {result['inventory_updated']} actualizadas, "
+              f"{result['inventory_unchanged']} sin cambios, {result['centers_upserted']} centros y "
+              f"{result['products_upserted']} productos actualizados ({result['seconds']} s)")
+        rows = result["rejected_rows"]
+        if rows:
+            print(f"{result['file']}: {len(rows)} filas rechazadas por valores numéricos inválidos", file=sys.stderr)
+            for row in rows[:0 if args.rejects else REJECTS_SHOWN]:
+                print(f"  línea {row['line']} ({row['center_code']} / {row['product_code']}): {row['values']}",
+                      file=sys.stderr)
+            rejected.extend({"file": result["file"], **row} for row in rows)
+    if args.rejects and rejected:
+        with open(args.rejects, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["file", "line", "center_code", "product_code", "values"])
+            writer.writeheader()
+            writer.writerows(rejected)
+        print(f"Filas rechazadas guardadas en {args.rejects}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+import atexit
+import contextvars
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+# Instrumentación de herramientas: "false" deja los decoradores sin efecto (se devuelve la función original).
+ENABLED = os.getenv("TOOL_METRICS_ENABLED", "true").lower() == "true"
+# Spans de OpenTelemetry por llamada (requiere opentelemetry-api y un proveedor configurado).
+TRACING_ENABLED = ENABLED and os.getenv("TOOL_TRACING_ENABLED", "false").lower() == "true"
+# Directorio compartido donde cada proceso (adk api_server, Watcher, frontend) vuelca sus métricas
+# para que el endpoint /metrics del frontend las agregue. Sin definir, cada proceso ve solo las suyas.
+METRICS_DIR = os.getenv("TOOL_METRICS_DIR")
+# Segundos mínimos entre dos volcados de un mismo proceso a METRICS_DIR.
+FLUSH_INTERVAL = float(os.getenv("TOOL_METRICS_FLUSH_SECONDS", "5"))
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Histogramas: nombre -> (descripción, límites de los buckets, etiquetas)
+HISTOGRAMS = {
+    "medifinder_tool_duration_seconds": ("Duración total de la llamada a la herramienta.", DURATION_BUCKETS, ("tool", "status")),
+    "medifinder_tool_db_connect_seconds": ("Tiempo esperando una conexión del pool por llamada.", DURATION_BUCKETS, ("tool",)),
+    "medifinder_tool_db_query_seconds": ("Tiempo ejecutando consultas SQL por llamada.", DURATION_BUCKETS, ("tool",)),
+    "medifinder_tool_rows": ("Filas devueltas por llamada.", ROWS_BUCKETS, ("tool",)),
+    "medifinder_tool_result_bytes": ("Tamaño del resultado serializado como JSON, en bytes.", BYTES_BUCKETS, ("tool",)),
+}
+
+
+class _Call:
+    """Tiempos de base de datos acumulados durante una llamada instrumentada."""
+    __slots__ = ("connect", "query")
+
+    def __init__(self):
+        self.connect = 0.0
+        self.query = 0.0
+
+
+_current_call: contextvars.ContextVar[Optional[_Call]] = contextvars.ContextVar("medifinder_tool_call", default=None)
+
+
+class Registry:
+    """
+    Histogramas acumulativos al estilo Prometheus, seguros para hilos.
+    Cada serie (métrica + valores de etiquetas) guarda los conteos por bucket, la suma y el total.
+    """
+
+    def __init__(self):
+        self._series = {}  # (métrica, etiquetas) -> [conteos por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, metric: str, labels: tuple, value: float):
+        bounds = HISTOGRAMS[metric][1]
+        with self._lock:
+            series = self._series.get((metric, labels))
+            if series is None:
+                series = self._series[(metric, labels)] = [[0] * len(bounds), 0.0, 0]
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> dict:
+        """Copia serializable en JSON: {"métrica|[etiquetas]": {"buckets", "sum", "count"}}."""
+        with self._lock:
+            return {_series_key(metric, labels): {"buckets": list(buckets), "sum": total, "count": count}
+                    for (metric, labels), (buckets, total, count) in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+registry = Registry()
+_last_flush = 0.0
+
+
+def _series_key(metric: str, labels: tuple) -> str:
+    return f"{metric}|{json.dumps(list(labels), ensure_ascii=False)}"
+
+
+def _parse_key(key: str) -> tuple:
+    metric, labels = key.split("|", 1)
+    return metric, tuple(json.loads(labels))
+
+
+# --- Ganchos para MediFinderCore.db / async_db ---
+
+def add_connect_time(seconds: float):
+    call = _current_call.get()
+    if call is not None:
+        call.connect += seconds
+
+
+def add_query_time(seconds: float, query=None, params=None):
+    call = _current_call.get()
+    if call is not None:
+        call.query += seconds
+    captured = _captured_queries.get()
+    if captured is not None and query is not None:
+        captured.append((query, params, seconds))
+
+
+_captured_queries: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("medifinder_captured_queries", default=None)
+
+
+@contextmanager
+def capture_queries():
+    """Dentro del bloque, guarda en la lista devuelta cada (consulta, parámetros, segundos) ejecutada por los cursores instrumentados."""
+    captured = []
+    token = _captured_queries.set(captured)
+    try:
+        yield captured
+    finally:
+        _captured_queries.reset(token)
+
+
+@contextmanager
+def detached():
+    """
+    Suspende la llamada en curso dentro del bloque. Las tareas creadas aquí (por ejemplo, los
+    trabajadores del pool asíncrono) copian el contexto y, si no, sumarían su tiempo a esa llamada.
+    """
+    token = _current_call.set(None)
+    try:
+        yield
+    finally:
+        _current_call.reset(token)
+
+
+# --- Decorador ---
+
+def result_rows(result) -> int:
+    """Filas que devuelve una herramienta (tablas columnares, listas o un único registro)."""
+    if not isinstance(result, dict):
+        return 0
+    total = 0
+    for key, value in result.items():
+        if isinstance(value, dict) and "total_rows" in value:
+            total += value["total_rows"]
+        elif key == "reports" and isinstance(value, list):
+            total += sum(report.get("total_rows", 0) for report in value if isinstance(report, dict))
+        elif isinstance(value, list):
+            total += len(value)
+        elif key in ("data", "details") and value:
+            total += 1
+    return total
+
+
+def _result_bytes(result) -> int:
+    return len(json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def _span(name: str):
+    if not TRACING_ENABLED:
+        return nullcontext()
+    return _tracer().start_as_current_span(f"tool {name}", attributes={"medifinder.tool": name})
+
+
+@functools.lru_cache(maxsize=1)
+def _tracer():
+    from opentelemetry import trace
+    return trace.get_tracer("medifinder.tools")
+
+
+def _record(name: str, call: _Call, elapsed: float, result, status: str, span):
+    rows = result_rows(result)
+    size = _result_bytes(result) if result is not None else 0
+    registry.observe("medifinder_tool_duration_seconds", (name, status), elapsed)
+    registry.observe("medifinder_tool_db_connect_seconds", (name,), call.connect)
+    registry.observe("medifinder_tool_db_query_seconds", (name,), call.query)
+    registry.observe("medifinder_tool_rows", (name,), rows)
+    registry.observe("medifinder_tool_result_bytes", (name,), size)
+    if span is not None:
+        span.set_attribute("medifinder.status", status)
+        span.set_attribute("medifinder.rows", rows)
+        span.set_attribute("medifinder.result_bytes", size)
+        span.set_attribute("medifinder.db_connect_ms", round(call.connect * 1000, 3))
+        span.set_attribute("medifinder.db_query_ms", round(call.query * 1000, 3))
+    if METRICS_DIR and time.monotonic() - _last_flush > FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError as e:
+            print(f"No se pudieron volcar las métricas en {METRICS_DIR}: {e}")
+
+
+def _status(result) -> str:
+    return str(result.get("status", "ok")) if isinstance(result, dict) else "ok"
+
+
+def instrument(func):
+    """
+    Decorador para herramientas (síncronas o asíncronas): registra duración, tiempo de conexión
+    y de consultas, filas devueltas, bytes del resultado y 'status'. Con TOOL_METRICS_ENABLED=false
+    devuelve `func` sin envolver, así que no añade ningún coste.
+
+    Solo se registra la llamada más externa: si una herramienta instrumentada llama a otra, la
+    interior se ejecuta sin registrar nada propio y sus tiempos de base de datos cuentan en la
+    exterior, así que duración, filas y bytes no se cuentan dos veces.
+    """
+    if not ENABLED:
+        return func
+    name = func.__name__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if _current_call.get() is not None:  # Llamada anidada
+                return await func(*args, **kwargs)
+            call = _Call()
+            token = _current_call.set(call)
+            start = time.perf_counter()
+            result, status = None, "exception"
+            with _span(name) as span:
+                try:
+                    result = await func(*args, **kwargs)
+                    status = _status(result)
+                    return result
+                finally:
+                    _current_call.reset(token)
+                    _record(name, call, time.perf_counter() - start, result, status, span)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current_call.get() is not None:  # Llamada anidada
+            return func(*args, **kwargs)
+        call = _Call()
+        token = _current_call.set(call)
+        start = time.perf_counter()
+        result, status = None, "exception"
+        with _span(name) as span:
+            try:
+                result = func(*args, **kwargs)
+                status = _status(result)
+                return result
+            finally:
+                _current_call.reset(token)
+                _record(name, call, time.perf_counter() - start, result, status, span)
+    return wrapper
+
+
+# --- Exportación ---
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"tool-metrics-{pid}.json")
+
+
+def flush():
+    """Vuelca las métricas de este proceso a METRICS_DIR (escritura atómica)."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+if ENABLED and METRICS_DIR:
+    atexit.register(flush)
+
+
+def merge(*snapshots: dict) -> dict:
+    """Suma varias instantáneas de `Registry.snapshot`."""
+    merged = {}
+    for snapshot in snapshots:
+        for key, series in snapshot.items():
+            target = merged.setdefault(key, {"buckets": [0] * len(series["buckets"]), "sum": 0.0, "count": 0})
+            target["buckets"] = [a + b for a, b in zip(target["buckets"], series["buckets"])]
+            target["sum"] += series["sum"]
+            target["count"] += series["count"]
+    return merged
+
+
+def collect() -> dict:
+    """Métricas de este proceso más las que otros procesos volcaron en METRICS_DIR."""
+    snapshots = [registry.snapshot()]
+    if METRICS_DIR:
+        own = _snapshot_path(os.getpid())
+        for path in sorted(glob.glob(os.path.join(METRICS_DIR, "tool-metrics-*.json"))):
+            if path == own:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return merge(*snapshots)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, le: Optional[str] = None) -> str:
+    pairs = list(zip(names, values)) + ([("le", le)] if le is not None else [])
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render_prometheus(snapshot: Optional[dict] = None) -> str:
+    """Texto en el formato de exposición de Prometheus (histogramas con buckets acumulativos)."""
+    snapshot = collect() if snapshot is None else snapshot
+    by_metric = {}
+    for key, series in snapshot.items():
+        metric, labels = _parse_key(key)
+        by_metric.setdefault(metric, []).append((labels, series))
+
+    lines = []
+    for metric, (description, bounds, label_names) in HISTOGRAMS.items():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, series in sorted(by_metric.get(metric, [])):
+            cumulative = 0
+            for bound, count in zip(bounds, series["buckets"]):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_format_labels(label_names, labels, str(bound))} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(label_names, labels, '+Inf')} {series['count']}")
+            lines.append(f"{metric}_sum{_format_labels(label_names, labels)} {series['sum']}")
+            lines.append(f"{metric}_count{_format_labels(label_names, labels)} {series['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _quantile(bounds: tuple, buckets: list, count: int, q: float) -> Optional[float]:
+    """Estimación de un cuantil a partir de los buckets (límite superior del bucket que lo contiene)."""
+    if not count:
+        return None
+    rank, cumulative = q * count, 0
+    for bound, bucket in zip(bounds, buckets):
+        cumulative += bucket
+        if cumulative >= rank:
+            return bound
+    return float("inf")
+
+
+def _subtract(snapshot: dict, since: dict) -> dict:
+    result = {}
+    for key, series in snapshot.items():
+        before = since.get(key, {"buckets": [0] * len(series["buckets"]), "sum": 0.0, "count": 0})
+        result[key] = {"buckets": [a - b for a, b in zip(series["buckets"], before["buckets"])],
+                       "sum": series["sum"] - before["sum"], "count": series["count"] - before["count"]}
+    return result
+
+
+def format_summary(snapshot: Optional[dict] = None, since: Optional[dict] = None) -> str:
+    """
+    Tabla de texto por herramienta (llamadas, errores, duración media y p95, tiempo de base de
+    datos, filas y bytes). Con `since` solo cuenta lo ocurrido después de esa instantánea.
+    """
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    if since:
+        snapshot = _subtract(snapshot, since)
+
+    tools = {}
+    for key, series in snapshot.items():
+        metric, labels = _parse_key(key)
+        if not series["count"]:
+            continue
+        tool = tools.setdefault(labels[0], {"calls": 0, "errors": 0, "sum": 0.0, "buckets": [0] * len(DURATION_BUCKETS)})
+        if metric == "medifinder_tool_duration_seconds":
+            tool["calls"] += series["count"]
+            tool["sum"] += series["sum"]
+            tool["buckets"] = [a + b for a, b in zip(tool["buckets"], series["buckets"])]
+            if labels[1] in ("error", "exception"):
+                tool["errors"] += series["count"]
+        else:
+            tool[metric] = series["sum"]
+
+    if not tools:
+        return "Métricas de herramientas: sin llamadas."
+    lines = [f"{'herramienta':<44}{'llamadas':>9}{'errores':>8}{'media ms':>10}{'p95 ms':>10}"
+             f"{'bd ms':>9}{'filas':>8}{'bytes':>10}"]
+    for name, tool in sorted(tools.items()):
+        p95 = _quantile(DURATION_BUCKETS, tool["buckets"], tool["calls"], 0.95)
+        p95_text = f">{DURATION_BUCKETS[-1] * 1000:g}" if p95 == float("inf") else f"<={p95 * 1000:g}"
+        db_ms = (tool.get("medifinder_tool_db_connect_seconds", 0) + tool.get("medifinder_tool_db_query_seconds", 0)) * 1000
+        lines.append(f"{name:<44}{tool['calls']:>9}{tool['errors']:>8}{tool['sum'] / tool['calls'] * 1000:>10.1f}"
+                     f"{p95_text:>10}{db_ms:>9.1f}{int(tool.get('medifinder_tool_rows', 0)):>8}"
+                     f"{int(tool.get('medifinder_tool_result_bytes', 0)):>10}")
+    return "\n".join(lines)
@@ -0,0 +1,170 @@
+"""
+Aplica las migraciones de DB/migrations en orden numérico y registra cada una en `schema_migrations`.
+
+Cada archivo .sql se ejecuta en su propia transacción. Algunas migraciones tienen además un paso
+en Python (`POST_STEPS`) para mover datos en varias transacciones cortas sin bloquear la
+aplicación; por ejemplo, la 005 copia el inventario mes a mes a la tabla particionada.
+
+Uso:
+    python -m MediFinderCore.migrate                   # aplica las pendientes
+    python -m MediFinderCore.migrate --list            # muestra el estado de cada migración
+    python -m MediFinderCore.migrate --fake-through 004   # marca como aplicadas (sin ejecutarlas) hasta la 004
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+from . import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "DB", "migrations")
+
+# Espera máxima por el bloqueo del intercambio de tablas de la 005 antes de reintentar.
+SWAP_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+SWAP_ATTEMPTS = 5
+
+
+def migration_files() -> list:
+    """Nombres (sin .sql) de las migraciones disponibles, en orden."""
+    return sorted(name[:-4] for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql"))
+
+
+def _ensure_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(100) PRIMARY KEY,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def applied() -> set:
+    with db.get_cursor() as cur:
+        _ensure_table(cur)
+        cur.execute("SELECT version FROM schema_migrations;")
+        return {row[0] for row in cur.fetchall()}
+
+
+def _record(cur, version: str):
+    cur.execute("INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT DO NOTHING;", (version,))
+
+
+def partition_inventory(conn) -> dict:
+    """
+    Paso de la migración 005: copia el inventario sin particionar a inventory_part mes a mes
+    (una transacción por mes, mientras los triggers replican las escrituras nuevas) y después
+    intercambia las tablas. No hace nada si el inventario ya está particionado.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'inventory'::regclass;")
+        if cur.fetchone()[0] == 'p':
+            return {"copied_rows": 0, "months": 0}
+        cur.execute("""
+            SELECT m::date FROM generate_series(
+                (SELECT date_trunc('month', min(report_date)) FROM inventory),
+                (SELECT max(report_date) FROM inventory),
+                interval '1 month') m;
+        """)
+        months = [row[0] for row in cur.fetchall()]
+    conn.commit()
+
+    copied = 0
+    for month in months:
+        with conn.cursor() as cur:
+            cur.execute("SELECT inventory_partitioning_backfill(%s);", (month,))
+            copied += cur.fetchone()[0]
+        conn.commit()
+        print(f"  inventario {month:%Y-%m}: {copied} filas copiadas")
+
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL lock_timeout = %s;", (SWAP_LOCK_TIMEOUT,))
+                cur.execute("SELECT inventory_partitioning_swap();")
+                removed = cur.fetchone()[0]
+                cur.execute("ANALYZE inventory;")
+            conn.commit()
+            break
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            if attempt == SWAP_ATTEMPTS:
+                raise
+            print(f"  inventario ocupado, reintentando el intercambio ({attempt}/{SWAP_ATTEMPTS})")
+            time.sleep(attempt)
+    print("  inventario particionado; la tabla anterior queda como inventory_unpartitioned")
+    return {"copied_rows": copied, "removed_rows": removed, "months": len(months)}
+
+
+# Pasos en Python que se ejecutan tras el .sql de una migración, con sus propias transacciones.
+POST_STEPS = {
+    "005_inventory_partitioning": partition_inventory,
+}
+
+
+def apply(version: str):
+    """Aplica una migración: el .sql en una transacción y después su paso en Python, si lo tiene."""
+    with open(os.path.join(MIGRATIONS_DIR, f"{version}.sql"), encoding="utf-8") as f:
+        script = f.read()
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(script)
+        conn.commit()
+        step = POST_STEPS.get(version)
+        if step:
+            step(conn)
+        with conn.cursor() as cur:
+            _record(cur, version)
+
+
+def migrate() -> list:
+    """Aplica las migraciones pendientes en orden y devuelve las aplicadas."""
+    done = applied()
+    pending = [version for version in migration_files() if version not in done]
+    for version in pending:
+        print(f"Aplicando {version}...")
+        started = time.perf_counter()
+        apply(version)
+        print(f"  {version} aplicada ({time.perf_counter() - started:.1f} s)")
+    return pending
+
+
+def fake_through(last: str) -> list:
+    """Registra como aplicadas, sin ejecutarlas, las migraciones hasta `last` (p. ej. '004')."""
+    versions = [version for version in migration_files() if version.split("_", 1)[0] <= last]
+    with db.get_cursor() as cur:
+        _ensure_table(cur)
+        for version in versions:
+            _record(cur, version)
+    return versions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--list", action="store_true", help="Mostrar las migraciones y si están aplicadas.")
+    parser.add_argument("--fake-through", metavar="NNN",
+                        help="Marcar como aplicadas, sin ejecutarlas, las migraciones hasta NNN "
+                             "(bases de datos migradas antes a mano con psql).")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.list:
+            done = applied()
+            for version in migration_files():
+                print(f"[{'x' if version in done else ' '}] {version}")
+        elif args.fake_through:
+            for version in fake_through(args.fake_through):
+                print(f"{version} marcada como aplicada")
+        elif not migrate():
+            print("No hay migraciones pendientes.")
+    except (db.ConnectionUnavailable, psycopg2.Error) as e:
+        print(f"Error en la migración: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
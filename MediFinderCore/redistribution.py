@@ -0,0 +1,118 @@
+"""
+Redistribución de stock dentro de una región: qué centros con sobrestock pueden abastecer a
+qué centros con substock o desabastecidos, por producto.
+
+Cada centro con 'Sobrestock' ofrece lo que tiene por encima de OVERSTOCK_MONTHS meses de
+consumo (el umbral del propio indicador), y cada centro con 'Substock' o 'Desabastecido'
+pide lo que le falta para TARGET_MONTHS meses. El reparto es un problema de transporte: se
+mueve la mayor cantidad posible de unidades y, entre los repartos que la mueven, el de menor
+distancia total (unidades x km). Cada receptor solo se empareja con sus DONORS_PER_RECEIVER
+donantes más cercanos (KD-tree por producto), y todos los productos de la región se resuelven
+en un único programa lineal disperso (símplex dual de HiGHS); con ofertas y pedidos enteros
+la solución es entera.
+"""
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+from . import geo
+
+# Meses de consumo que conserva un centro que cede stock (por encima empieza el 'Sobrestock').
+OVERSTOCK_MONTHS = 3
+# Meses de consumo que se intenta reponer a un centro con substock o desabastecido.
+TARGET_MONTHS = 2
+DONOR_STATUSES = ("Sobrestock",)
+RECEIVER_STATUSES = ("Substock", "Desabastecido")
+# Donantes más cercanos que se consideran para cada receptor (acota el tamaño del problema).
+DONORS_PER_RECEIVER = 4
+
+
+def _candidate_pairs(products: np.ndarray, lat: np.ndarray, lon: np.ndarray, donors: np.ndarray,
+                     receivers: np.ndarray, max_distance_km: float) -> tuple:
+    """
+    Pares (donante, receptor) del mismo producto a `max_distance_km` o menos, limitados a los
+    DONORS_PER_RECEIVER donantes más cercanos de cada receptor. Devuelve las posiciones dentro
+    de `donors` y de `receivers`, y la distancia de cada par.
+    """
+    donor_order = donors[np.argsort(products[donors], kind="stable")]
+    receiver_order = receivers[np.argsort(products[receivers], kind="stable")]
+    shared = np.intersect1d(products[donor_order], products[receiver_order])
+    d_low = np.searchsorted(products[donor_order], shared, side="left")
+    d_high = np.searchsorted(products[donor_order], shared, side="right")
+    r_low = np.searchsorted(products[receiver_order], shared, side="left")
+    r_high = np.searchsorted(products[receiver_order], shared, side="right")
+    donor_position = np.empty(len(products), dtype=np.int64)
+    donor_position[donors] = np.arange(donors.size)
+    receiver_position = np.empty(len(products), dtype=np.int64)
+    receiver_position[receivers] = np.arange(receivers.size)
+
+    pair_donors, pair_receivers, distances = [], [], []
+    for dl, dh, rl, rh in zip(d_low, d_high, r_low, r_high):
+        product_donors, product_receivers = donor_order[dl:dh], receiver_order[rl:rh]
+        queries, points, km = geo.nearest_pairs(lat[product_donors], lon[product_donors],
+                                                lat[product_receivers], lon[product_receivers],
+                                                DONORS_PER_RECEIVER, max_distance_km)
+        pair_donors.append(donor_position[product_donors[points]])
+        pair_receivers.append(receiver_position[product_receivers[queries]])
+        distances.append(km)
+    if not distances:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+    return np.concatenate(pair_donors), np.concatenate(pair_receivers), np.concatenate(distances)
+
+
+def plan_transfers(rows: list, max_distance_km: float) -> list:
+    """
+    Transferencias óptimas entre las filas dadas (center_id, product_id, latitude, longitude,
+    current_stock, avg_monthly_consumption, status_indicator) de una región. Devuelve
+    [{product_id, from_center_id, to_center_id, quantity, distance_km, to_status, to_need}],
+    sin ordenar; solo se emparejan centros a `max_distance_km` o menos.
+    """
+    if not rows:
+        return []
+    columns = ("center_id", "product_id", "latitude", "longitude", "current_stock", "avg_monthly_consumption")
+    values = {column: np.array([row[column] for row in rows], dtype=np.float64) for column in columns}
+    status = np.array([row["status_indicator"] for row in rows], dtype=object)
+    stock, cpma = values["current_stock"], values["avg_monthly_consumption"]
+
+    spare = np.floor(stock - OVERSTOCK_MONTHS * cpma)
+    need = np.ceil(TARGET_MONTHS * cpma - stock)
+    is_donor = np.isin(status, DONOR_STATUSES) & (spare > 0)
+    is_receiver = np.isin(status, RECEIVER_STATUSES) & (need > 0)
+    donors, receivers = np.flatnonzero(is_donor), np.flatnonzero(is_receiver)
+    if not donors.size or not receivers.size:
+        return []
+
+    pair_donors, pair_receivers, distances = _candidate_pairs(
+        values["product_id"], values["latitude"], values["longitude"], donors, receivers, max_distance_km)
+    if not distances.size:
+        return []
+
+    # Cada unidad movida vale más que cualquier distancia permitida: primero se maximiza lo
+    # transferido y, a igual cantidad, se minimizan los km recorridos.
+    n_pairs = distances.size
+    constraints = sparse.vstack([
+        sparse.csr_matrix((np.ones(n_pairs), (pair_donors, np.arange(n_pairs))), shape=(donors.size, n_pairs)),
+        sparse.csr_matrix((np.ones(n_pairs), (pair_receivers, np.arange(n_pairs))), shape=(receivers.size, n_pairs)),
+    ]).tocsr()
+    result = linprog(distances - (max_distance_km + 1), A_ub=constraints,
+                     b_ub=np.concatenate([spare[donors], need[receivers]]), bounds=(0, None), method="highs-ds")
+    if result.status != 0:
+        return []
+
+    quantities = np.rint(result.x)
+    moved = np.flatnonzero(quantities > 0)
+    from_rows, to_rows = donors[pair_donors[moved]], receivers[pair_receivers[moved]]
+    return [{
+        "product_id": int(values["product_id"][source]),
+        "from_center_id": int(values["center_id"][source]),
+        "to_center_id": int(values["center_id"][target]),
+        "quantity": int(quantity),
+        "distance_km": round(float(distance), 1),
+        "to_status": status[target],
+        "to_need": int(need[target]),
+    } for source, target, quantity, distance in zip(from_rows, to_rows, quantities[moved], distances[moved])]
+
+
+def rank_transfers(transfers: list) -> list:
+    """Orden de presentación: primero los desabastecidos, luego las mayores cantidades y las más cercanas."""
+    return sorted(transfers, key=lambda t: (t["to_status"] != "Desabastecido", -t["quantity"], t["distance_km"]))
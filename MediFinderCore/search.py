@@ -0,0 +1,206 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import psycopg
+import psycopg2
+
+from . import async_db, catalog, db
+
+# Similitud mínima por palabra (pg_trgm word_similarity, 0-1) para que un producto sea candidato.
+SEARCH_THRESHOLD = float(os.getenv("MEDICINE_SEARCH_THRESHOLD", "0.5"))
+# Puntuación mínima y ventaja sobre el segundo candidato para dar por segura la mejor coincidencia.
+CONFIDENT_SCORE = float(os.getenv("MEDICINE_SEARCH_CONFIDENT_SCORE", "0.8"))
+CONFIDENT_MARGIN = float(os.getenv("MEDICINE_SEARCH_CONFIDENT_MARGIN", "0.1"))
+# Candidatos que se piden para resolver un nombre (los demás se devuelven como alternativas).
+RESOLVE_CANDIDATES = 5
+
+# Búsqueda por trigramas sobre el nombre normalizado (migración 004). Tanto el operador <%
+# como el LIKE de respaldo los resuelve el índice GIN idx_products_name_normalized.
+# score: 1 para la coincidencia exacta; si no, la similitud del término con la parte más
+# parecida del nombre. Los empates se rompen por la similitud con el nombre completo, con
+# lo que gana la presentación más corta ("PARACETAMOL 500 mg TAB" antes que "... JBE").
+RANKED_SEARCH_QUERY = """
+    SELECT product_id, name, score
+    FROM (
+        SELECT
+            p.product_id, p.name,
+            CASE WHEN medifinder_normalize_name(p.name) = %(term)s THEN 1.0
+                 ELSE word_similarity(%(term)s, medifinder_normalize_name(p.name)) END AS score,
+            similarity(%(term)s, medifinder_normalize_name(p.name)) AS name_similarity
+        FROM products p
+        WHERE %(term)s <%% medifinder_normalize_name(p.name)
+           OR medifinder_normalize_name(p.name) LIKE %(pattern)s
+    ) ranked
+    ORDER BY score DESC, name_similarity DESC, name
+    LIMIT %(limit)s;
+"""
+
+# El umbral de <% es un parámetro de pg_trgm; se fija solo para la transacción actual.
+SET_THRESHOLD_QUERY = "SELECT set_config('pg_trgm.word_similarity_threshold', %(threshold)s, true);"
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _params(term: str, limit: int) -> dict:
+    return {"term": term, "pattern": _like_pattern(term), "limit": limit, "threshold": str(SEARCH_THRESHOLD)}
+
+
+def _ranked_in_memory(term: str, limit: int) -> list:
+    """
+    Respaldo sin pg_trgm ni migración 004: candidatos del catálogo cuyo nombre contiene el
+    término, puntuados por la fracción del nombre que cubre (exacto = 1), los que empiezan por
+    el término primero.
+    """
+    candidates = []
+    for row in catalog.products.all():
+        name = catalog.normalize_name(row["name"])
+        if term not in name:
+            continue
+        score = 1.0 if name == term else len(term) / len(name)
+        candidates.append({"product_id": row["product_id"], "name": row["name"], "score": score,
+                           "_prefix": name.startswith(term)})
+    candidates.sort(key=lambda c: (c["score"] < 1.0, not c["_prefix"], -c["score"], c["name"]))
+    return [{k: v for k, v in c.items() if k != "_prefix"} for c in candidates[:limit]]
+
+
+def _as_candidates(rows) -> list:
+    return [{"product_id": row["product_id"], "name": row["name"], "score": round(float(row["score"]), 3)}
+            for row in rows]
+
+
+def _build_match(candidates: list) -> dict:
+    """
+    {"best": candidato o None, "confident": bool, "candidates": [...]}. La mejor coincidencia es
+    segura si es exacta, o si supera CONFIDENT_SCORE y aventaja al segundo en CONFIDENT_MARGIN.
+    """
+    best = candidates[0] if candidates else None
+    confident = False
+    if best:
+        runner_up = candidates[1]["score"] if len(candidates) > 1 else 0.0
+        confident = best["score"] >= 1.0 and runner_up < 1.0 or (
+            best["score"] >= CONFIDENT_SCORE and best["score"] - runner_up >= CONFIDENT_MARGIN)
+    return {"best": best, "confident": confident, "candidates": candidates}
+
+
+class MedicineSearch:
+    """
+    Búsqueda de medicamentos por similitud de trigramas (pg_trgm), normalizando tildes,
+    mayúsculas y espacios.
+
+    `search` devuelve candidatos ordenados por puntuación; `match` además indica la mejor
+    coincidencia y si es segura. Los resultados de `match` se recuerdan por término en un LRU
+    acotado que se vacía cuando el catálogo de productos se recarga (nueva versión de los datos,
+    TTL o `catalog.invalidate()`).
+    Si la base de datos no tiene pg_trgm o la migración 004, se ordena en memoria sobre el catálogo.
+    """
+
+    def __init__(self, lru_size: int = catalog.CATALOG_LRU_SIZE):
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._lru_version = None
+        self._lock = threading.Lock()
+        self.trigram_available = True
+
+    def _cached(self, key: str) -> Optional[dict]:
+        with self._lock:
+            if self._lru_version != catalog.products.version:
+                self._lru.clear()
+                self._lru_version = catalog.products.version
+            match = self._lru.get(key)
+            if match is not None:
+                self._lru.move_to_end(key)
+            return match
+
+    def _remember(self, key: str, match: dict):
+        with self._lock:
+            self._lru[key] = match
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def search(self, term: str, limit: int = 20) -> list:
+        """Candidatos [{product_id, name, score}] ordenados de mejor a peor (pool síncrono)."""
+        key = catalog.normalize_name(term)
+        if not key:
+            return []
+        catalog.products.refresh()
+        if self.trigram_available:
+            try:
+                with db.get_cursor() as cur:
+                    params = _params(key, limit)
+                    cur.execute(SET_THRESHOLD_QUERY, params)
+                    cur.execute(RANKED_SEARCH_QUERY, params)
+                    return _as_candidates(cur.fetchall())
+            except psycopg2.errors.UndefinedFunction:
+                self.trigram_available = False
+        return _ranked_in_memory(key, limit)
+
+    async def asearch(self, term: str, limit: int = 20) -> list:
+        """Candidatos [{product_id, name, score}] ordenados de mejor a peor (pool asíncrono)."""
+        key = catalog.normalize_name(term)
+        if not key:
+            return []
+        await catalog.products.arefresh()
+        if self.trigram_available:
+            try:
+                async with async_db.get_cursor() as cur:
+                    params = _params(key, limit)
+                    await cur.execute(SET_THRESHOLD_QUERY, params)
+                    await cur.execute(RANKED_SEARCH_QUERY, params)
+                    return _as_candidates(await cur.fetchall())
+            except psycopg.errors.UndefinedFunction:
+                self.trigram_available = False
+        return _ranked_in_memory(key, limit)
+
+    def match(self, term: str) -> dict:
+        """Mejor coincidencia para `term` con sus alternativas (pool síncrono)."""
+        key = catalog.normalize_name(term)
+        catalog.products.refresh()
+        match = self._cached(key)
+        if match is None:
+            match = _build_match(self.search(key, RESOLVE_CANDIDATES))
+            self._remember(key, match)
+        return match
+
+    async def amatch(self, term: str) -> dict:
+        """Mejor coincidencia para `term` con sus alternativas (pool asíncrono)."""
+        key = catalog.normalize_name(term)
+        await catalog.products.arefresh()
+        match = self._cached(key)
+        if match is None:
+            match = _build_match(await self.asearch(key, RESOLVE_CANDIDATES))
+            self._remember(key, match)
+        return match
+
+
+medicines = MedicineSearch()
+
+
+def match_medicine(name: str) -> dict:
+    return medicines.match(name)
+
+
+async def amatch_medicine(name: str) -> dict:
+    return await medicines.amatch(name)
+
+
+def match_note(match: dict) -> dict:
+    """
+    Campos para añadir a la respuesta de una herramienta cuando la coincidencia no es segura:
+    el medicamento elegido y las alternativas, para que el agente pueda confirmarlo con el
+    usuario en lugar de repetir la búsqueda con otros términos.
+    """
+    if match["confident"] or not match["best"]:
+        return {}
+    return {
+        "matched_medicine": match["best"]["name"],
+        "other_matches": [candidate["name"] for candidate in match["candidates"][1:]],
+    }
@@ -0,0 +1,137 @@
+"""
+Marcas de agua del Watcher: qué cambió en el inventario de cada región desde su último análisis.
+
+Los triggers de las migraciones 009 y 011 guardan en inventory_pair_versions el id de la
+última transacción que escribió cada centro x producto de inventory_latest (y un TRUNCATE
+registra la suya en inventory_latest_truncations), sin ningún contador compartido por región.
+El Watcher guarda en watcher_watermarks, por región, la foto de transacciones
+(pg_current_snapshot) de la consulta que listó los cambios que analizó, y la fecha de reporte
+más reciente que vio; en la siguiente ejecución solo cuentan los pares cuya transacción no es
+visible en esa foto: las confirmadas después y las que seguían en curso al tomarla.
+
+Uso:
+    python -m MediFinderCore.watermarks            # regiones con cambios pendientes
+    python -m MediFinderCore.watermarks --reset    # borra las marcas (la próxima ejecución analiza todo)
+"""
+import argparse
+import sys
+
+import psycopg2
+
+from . import async_db, db
+
+LOW_STOCK_STATUSES = ("Substock", "Desabastecido")
+
+# Cambios que una foto guardada no veía (el >= xmin acota el recorrido del índice por región)
+CHANGED_SINCE = """
+    (w.snapshot IS NULL OR ({xid} >= pg_snapshot_xmin(w.snapshot)
+                             AND NOT pg_visible_in_snapshot({xid}, w.snapshot)))
+"""
+CHANGED_REGIONS_QUERY = f"""
+    SELECT
+        r.region_id, r.name AS region_name, pg_current_snapshot()::text AS snapshot,
+        w.processed_at AS watermark_processed_at, w.report_date AS watermark_report_date,
+        changes.changed_pairs, changes.changed_low_stock_pairs, changes.report_date
+    FROM regions r
+    LEFT JOIN watcher_watermarks w ON r.region_id = w.region_id
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(*)::int AS changed_pairs,
+            (COUNT(*) FILTER (WHERE il.status_indicator = ANY(%(low_stock)s)))::int AS changed_low_stock_pairs,
+            MAX(il.report_date) AS report_date
+        FROM inventory_pair_versions pv
+        LEFT JOIN inventory_latest il ON pv.center_id = il.center_id AND pv.product_id = il.product_id
+        WHERE pv.region_id = r.region_id AND {CHANGED_SINCE.format(xid="pv.change_xid")}
+    ) changes
+    WHERE changes.changed_pairs > 0
+        OR w.snapshot IS NULL
+        OR EXISTS (SELECT 1 FROM inventory_latest_truncations t WHERE {CHANGED_SINCE.format(xid="t.change_xid")})
+    ORDER BY r.name;
+"""
+TOTAL_REGIONS_QUERY = "SELECT COUNT(*) AS total FROM regions;"
+# Nunca se vuelve a una foto anterior (dos ejecuciones que terminan en otro orden)
+ADVANCE_QUERY = """
+    INSERT INTO watcher_watermarks AS w (region_id, snapshot, report_date)
+    SELECT * FROM unnest(%s::int[], %s::pg_snapshot[], %s::date[])
+    ON CONFLICT (region_id) DO UPDATE SET
+        snapshot = CASE WHEN pg_snapshot_xmax(EXCLUDED.snapshot) >= pg_snapshot_xmax(w.snapshot)
+                        THEN EXCLUDED.snapshot ELSE w.snapshot END,
+        report_date = COALESCE(EXCLUDED.report_date, w.report_date),
+        processed_at = CURRENT_TIMESTAMP;
+"""
+
+
+def _advance_params(regions: list) -> tuple:
+    return ([region["region_id"] for region in regions], [region["snapshot"] for region in regions],
+            [region["report_date"] or region.get("watermark_report_date") for region in regions])
+
+
+def changed_regions() -> tuple:
+    """
+    (regiones con cambios desde su marca, total de regiones). Cada región es un dict con
+    region_id, region_name, snapshot (la foto que hay que guardar al terminar),
+    watermark_processed_at (None si nunca se analizó), changed_pairs, changed_low_stock_pairs
+    (pares cambiados que hoy están en bajo stock) y report_date (la más reciente de esos pares).
+    """
+    with db.get_cursor() as cur:
+        cur.execute(CHANGED_REGIONS_QUERY, {"low_stock": list(LOW_STOCK_STATUSES)})
+        regions = [dict(row) for row in cur.fetchall()]
+        cur.execute(TOTAL_REGIONS_QUERY)
+        return regions, cur.fetchone()["total"]
+
+
+async def achanged_regions() -> tuple:
+    """Versión asíncrona de `changed_regions`."""
+    async with async_db.get_cursor() as cur:
+        await cur.execute(CHANGED_REGIONS_QUERY, {"low_stock": list(LOW_STOCK_STATUSES)})
+        regions = await cur.fetchall()
+        await cur.execute(TOTAL_REGIONS_QUERY)
+        return regions, (await cur.fetchone())["total"]
+
+
+def advance(regions: list):
+    """Guarda como analizadas las fotos de `regions` (dicts de `changed_regions`)."""
+    if regions:
+        with db.get_cursor() as cur:
+            cur.execute(ADVANCE_QUERY, _advance_params(regions))
+
+
+async def aadvance(regions: list):
+    """Versión asíncrona de `advance`."""
+    if regions:
+        async with async_db.get_cursor() as cur:
+            await cur.execute(ADVANCE_QUERY, _advance_params(regions))
+
+
+def reset():
+    """Borra todas las marcas: la próxima ejecución incremental analiza todas las regiones."""
+    with db.get_cursor() as cur:
+        cur.execute("DELETE FROM watcher_watermarks;")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reset", action="store_true", help="Borrar las marcas de agua de todas las regiones")
+    args = parser.parse_args(argv)
+    try:
+        if args.reset:
+            reset()
+            print("Marcas de agua borradas: la próxima ejecución del Watcher analizará todas las regiones.")
+            return 0
+        regions, total = changed_regions()
+    except (db.ConnectionUnavailable, psycopg2.Error) as e:
+        print(f"Error al leer las marcas de agua: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_pool()
+    print(f"{len(regions)} de {total} regiones con cambios desde su último análisis")
+    for region in regions:
+        processed_at = region["watermark_processed_at"]
+        last = f"analizada el {processed_at:%Y-%m-%d %H:%M}" if processed_at else "nunca analizada"
+        print(f"  {region['region_name']:<20} {last}: "
+              f"{region['changed_pairs']} pares cambiados, {region['changed_low_stock_pairs']} en bajo stock")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
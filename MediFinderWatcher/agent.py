@@ -1,11 +1,17 @@
+import asyncio
+import json
+import os
 from typing import AsyncGenerator
 from google.adk.agents import Agent, BaseAgent
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event
 from dotenv import load_dotenv
+import psycopg
 
-from .tools import query_tools
-from .tools import analytics_tools
+from MediFinderCore import encoding, metrics, watermarks
+from MediFinderCore.db import ConnectionUnavailable
+from .tools import async_query_tools
+from .tools import async_analytics_tools
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
@@ -13,6 +19,12 @@ load_dotenv()
 # -- Modelo a usar --
 MODEL = "gemini-2.0-flash"
 
+# -- Número máximo de regiones analizadas a la vez (1 = una por una) --
+REGION_CONCURRENCY = int(os.getenv("WATCHER_REGION_CONCURRENCY", "5"))
+
+# -- Modo incremental: solo se analizan las regiones con cambios desde la última ejecución --
+INCREMENTAL = os.getenv("WATCHER_INCREMENTAL", "true").lower() not in ("0", "false", "no")
+
 # =================================================================
 #  1. AGENTES ESPECIALISTAS (TRABAJADORES)
 # =================================================================
@@ -23,7 +35,7 @@ RegionFetcherAgent = Agent(
     model=MODEL,
     description="Obtiene una lista de todas las regiones de la base de datos.",
     instruction="Llama a la herramienta 'list_all_regions' para obtener la lista completa de regiones. Guarda el resultado en la clave de estado 'region_list'.",
-    tools=[query_tools.list_all_regions],
+    tools=[async_query_tools.list_all_regions],
     output_key="region_list"
 )
 
@@ -33,14 +45,16 @@ RegionAnalyzerAgent = Agent(
     model=MODEL,
     description="Para una región dada, encuentra la medicina más consumida y luego genera un reporte de bajo stock para esa medicina.",
     instruction=(
-        "Recibirás un nombre de región en la clave de estado 'current_region'.\n"
-        "Paso 1: Usa la herramienta 'find_most_consumed_medicine_by_region' con la región actual para encontrar la medicina más consumida. Guarda el nombre de la medicina en la clave de estado 'top_medicine'.\n"
+        "La región actual (clave de estado 'current_region') es: {current_region}\n"
+        "Medicina más consumida, si ya fue calculada (clave de estado 'top_medicine'): {top_medicine?}\n"
+        "Paso 1: Si la clave 'top_medicine' ya tiene valor, úsala y pasa al paso 2. Si no, usa la herramienta 'find_most_consumed_medicine_by_region' con la región actual para encontrar la medicina más consumida. Guarda el nombre de la medicina en la clave de estado 'top_medicine'.\n"
         "Paso 2: Usa la herramienta 'generate_low_stock_report' con la región actual y la medicina de la clave 'top_medicine' para obtener el reporte de stock. Guarda este reporte en la clave 'stock_report'."
     ),
     tools=[
-        analytics_tools.find_most_consumed_medicine_by_region,
-        analytics_tools.generate_low_stock_report
-    ]
+        async_analytics_tools.find_most_consumed_medicine_by_region,
+        async_analytics_tools.generate_low_stock_report
+    ],
+    output_key="stock_report"
 )
 
 # Agente 3: Decide si notificar y actúa.
@@ -49,7 +63,8 @@ NotificationAgent = Agent(
     model=MODEL,
     description="Analiza un reporte de stock y decide si enviar una notificación por correo.",
     instruction=(
-        "Recibirás un reporte de stock en la clave de estado 'stock_report'.\n"
+        "La región actual (clave de estado 'current_region') es: {current_region}\n"
+        "Reporte de stock (clave de estado 'stock_report'): {stock_report?}\n"
         "Si el reporte contiene datos (es decir, no está vacío y el status es 'success'), entonces hay un problema de stock.\n"
         "En ese caso, llama a la herramienta 'send_notification_email' con los siguientes argumentos:\n"
         "- recipient_email: 'analista.salud@minsa.gob.pe'\n"
@@ -57,61 +72,242 @@ NotificationAgent = Agent(
         "- body: Un resumen del reporte de stock que recibiste.\n"
         "Si el reporte no contiene datos (status 'no_issues_found'), no hagas nada."
     ),
-    tools=[analytics_tools.send_notification_email]
+    tools=[async_analytics_tools.send_notification_email]
 )
 
 # =================================================================
 #  2. AGENTE ORQUESTADOR (EL JEFE DE PROYECTO)
 # =================================================================
 
+class _RegionDone:
+    """Marca el final de los eventos de una región en su cola."""
+
+    def __init__(self, error: BaseException = None):
+        self.error = error
+
+
 class MasterOrchestratorAgent(BaseAgent):
     """
     Este agente personalizado no usa un LLM. Su lógica está escrita en Python
     para controlar un flujo de trabajo complejo: obtener una lista, y luego
     iterar sobre ella, llamando a otros agentes para cada ítem.
+
+    Antes de llamar a los LLM, una sola consulta (`get_national_low_stock_overview`) cuenta los
+    registros en 'Substock'/'Desabastecido' y la medicina más consumida de cada región; solo las
+    regiones con problemas pasan al analizador y al notificador. Si esa consulta falla, se
+    vuelve al flujo original: RegionFetcher y análisis de todas las regiones.
+
+    En modo incremental (`incremental`), antes de todo se leen las marcas de agua de las
+    migraciones 009 y 011 (`MediFinderCore/watermarks.py`): solo siguen las regiones cuyo
+    inventario cambió desde su último análisis y que tienen, entre los centros x productos cambiados,
+    alguno hoy en 'Substock'/'Desabastecido'. La marca de cada región avanza cuando termina su
+    análisis, o enseguida si se descarta; si las marcas no se pueden leer, se analiza todo.
+
+    Las regiones se analizan en paralelo, como máximo `region_concurrency` a la vez.
+    Cada región corre sobre su propia copia de la sesión (con su 'current_region',
+    'stock_report', etc.) y en su propia rama, así que las regiones no se pisan el
+    estado ni ven la conversación de las demás. Los eventos de cada región se
+    emiten juntos y en el orden de la lista de regiones.
     """
     name: str = "MasterOrchestrator"
     description: str = "Orquesta el flujo de análisis de stock para todas las regiones."
+    region_concurrency: int = REGION_CONCURRENCY
+    prefilter_regions: bool = True
+    incremental: bool = INCREMENTAL
 
     async def _run_async_impl(
         self, ctx: InvocationContext
     ) -> AsyncGenerator[Event, None]:
         
         yield Event(author=self.name, content_parts=["Iniciando flujo de trabajo de análisis de stock..."])
+        metrics_before = metrics.registry.snapshot()
+        try:
+            async for event in self._run_workflow(ctx):
+                yield event
+        finally:
+            if metrics.ENABLED:
+                print(f"\nMétricas de herramientas de esta ejecución del Watcher:\n"
+                      f"{metrics.format_summary(since=metrics_before)}")
 
-        # --- PASO 1: Obtener todas las regiones ---
-        fetcher = self.find_agent("RegionFetcher")
-        async for event in fetcher.run_async(ctx):
-            yield event # Pasamos los eventos del sub-agente para ver su progreso
+    async def _run_workflow(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        """Selección de regiones y análisis en paralelo; `_run_async_impl` añade el resumen de métricas."""
+        # --- PASO 0: Modo incremental: regiones con cambios desde la última ejecución ---
+        pending = None  # nombre de región -> cambios pendientes (None = se analiza todo)
+        changes = await _changed_regions() if self.incremental else None
+        if changes is not None:
+            changed, total_regions = changes
+            pending = {
+                region["region_name"]: region for region in changed
+                # Sin pares registrados (p. ej. tras un TRUNCATE) no se sabe qué cambió: se analiza
+                if region["changed_low_stock_pairs"] > 0 or region["changed_pairs"] == 0
+            }
+            await _save_watermarks([region for region in changed if region["region_name"] not in pending])
+            yield Event(author=self.name, content_parts=[
+                f"Modo incremental: {len(changed)} de {total_regions} regiones con cambios desde la última "
+                f"ejecución; {len(pending)} con registros cambiados en bajo stock."])
+            if not pending:
+                yield Event(author=self.name, content_parts=["No hay cambios que analizar. Finalizando flujo."])
+                return
 
-        region_list_result = ctx.session.state.get("region_list", {})
-        regions = region_list_result.get("regions", [])
+        # --- PASO 1: Obtener las regiones a analizar ---
+        overview = await async_analytics_tools.get_national_low_stock_overview() if self.prefilter_regions else None
 
-        if not regions:
-            yield Event(author=self.name, content_parts=["No se encontraron regiones. Finalizando flujo."])
-            return
+        if overview is not None and overview["status"] != "error" and not _overview_truncated(overview):
+            # Pre-filtro determinista: solo las regiones con registros en bajo stock pasan a los LLM.
+            all_regions = encoding.decode_rows(overview["regions"]) if "regions" in overview else []
+            regions = [
+                (row["region_name"], {"top_medicine": row["top_medicine"] or ""})
+                for row in all_regions if row["low_stock_count"] > 0
+                and (pending is None or row["region_name"] in pending)
+            ]
+            total_regions = overview["regions"]["total_rows"] if "regions" in overview else 0
+            yield Event(author=self.name, content_parts=[
+                f"Pre-filtro: {len(regions)} de {total_regions} regiones con problemas de bajo stock."])
+            if not regions:
+                yield Event(author=self.name, content_parts=["No hay regiones con problemas de bajo stock. Finalizando flujo."])
+                return
+        else:
+            fetcher = self.find_agent("RegionFetcher")
+            async for event in fetcher.run_async(ctx):
+                yield event # Pasamos los eventos del sub-agente para ver su progreso
 
-        yield Event(author=self.name, content_parts=[f"Se encontraron {len(regions)} regiones. Iniciando análisis para cada una..."])
+            regions = [(region, {}) for region in _parse_region_list(ctx.session.state.get("region_list", {}))]
+            if pending is not None:
+                regions = [(region, region_state) for region, region_state in regions if region in pending]
 
-        # --- PASO 2: Iterar sobre cada región y procesarla ---
-        for region in regions:
-            yield Event(author=self.name, content_parts=[f"--- Procesando Región: {region} ---"])
-            
-            # Guardamos la región actual en el estado para que los sub-agentes la usen
-            ctx.session.state["current_region"] = region
+            if not regions:
+                yield Event(author=self.name, content_parts=["No se encontraron regiones. Finalizando flujo."])
+                return
 
-            # a) Analizar la región para encontrar la medicina y su stock
-            analyzer = self.find_agent("RegionAnalyzer")
-            async for event in analyzer.run_async(ctx):
-                yield event
+            yield Event(author=self.name, content_parts=[f"Se encontraron {len(regions)} regiones. Iniciando análisis para cada una..."])
 
-            # b) Decidir si notificar basado en el análisis
-            notifier = self.find_agent("NotificationAgent")
-            async for event in notifier.run_async(ctx):
-                yield event
+        if pending is not None:
+            # Las regiones con cambios que no pasaron el filtro quedan al día sin analizarse
+            selected = {region for region, _ in regions}
+            await _save_watermarks([region for name, region in pending.items() if name not in selected])
+
+        # --- PASO 2: Procesar las regiones (en paralelo, con un máximo de regiones a la vez) ---
+        semaphore = asyncio.Semaphore(max(1, self.region_concurrency))
+        queues = [asyncio.Queue() for _ in regions]
+        tasks = [
+            asyncio.create_task(self._run_region_into_queue(
+                ctx, region, region_state, queue, semaphore, pending.get(region) if pending else None))
+            for (region, region_state), queue in zip(regions, queues)
+        ]
+        try:
+            for queue in queues:
+                while True:
+                    item = await queue.get()
+                    if isinstance(item, _RegionDone):
+                        if item.error is not None:
+                            raise item.error
+                        break
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         yield Event(author=self.name, content_parts=["\nFlujo de trabajo de análisis completado para todas las regiones."])
 
+    async def _run_region_into_queue(self, ctx: InvocationContext, region: str, region_state: dict,
+                                     queue: asyncio.Queue, semaphore: asyncio.Semaphore, changes: dict = None):
+        """
+        Procesa una región y deja sus eventos en `queue`, terminando con un `_RegionDone`. En
+        modo incremental, `changes` es la marca de agua a guardar si el análisis termina bien.
+        """
+        error = None
+        try:
+            async with semaphore:
+                async for event in self._run_region(ctx, region, region_state):
+                    queue.put_nowait(event)
+            if changes is not None:
+                await _save_watermarks([changes])
+        except Exception as e:
+            error = e
+        finally:
+            queue.put_nowait(_RegionDone(error))
+
+    async def _run_region(self, ctx: InvocationContext, region: str,
+                          region_state: dict) -> AsyncGenerator[Event, None]:
+        """Analiza una región y decide si notificar, sobre un contexto aislado del resto."""
+        region_ctx = _region_context(ctx, self.name, region, region_state)
+        yield Event(author=self.name, branch=region_ctx.branch,
+                    content_parts=[f"--- Procesando Región: {region} ---"])
+
+        # a) Analizar la región para encontrar la medicina y su stock
+        # b) Decidir si notificar basado en el análisis
+        for agent_name in ("RegionAnalyzer", "NotificationAgent"):
+            agent = self.find_agent(agent_name)
+            async for event in agent.run_async(region_ctx):
+                # El runner solo registra los eventos en la sesión real cuando se emiten,
+                # así que se registran aquí en la copia para que el agente vea su propio historial.
+                _append_to_region_session(region_ctx, event)
+                yield event
+
+
+async def _changed_regions():
+    """`watermarks.achanged_regions()`, o None si no se puede leer (sin migraciones 009 y 011, sin conexión...)."""
+    try:
+        return await watermarks.achanged_regions()
+    except (ConnectionUnavailable, psycopg.Error) as e:
+        print(f"Modo incremental no disponible, se analizan todas las regiones: {e}")
+        return None
+
+
+async def _save_watermarks(regions: list):
+    """Avanza las marcas de agua de `regions`; si falla, esas regiones se vuelven a analizar la próxima vez."""
+    try:
+        await watermarks.aadvance(regions)
+    except (ConnectionUnavailable, psycopg.Error) as e:
+        print(f"No se pudieron guardar las marcas de agua: {e}")
+
+
+def _overview_truncated(overview: dict) -> bool:
+    """
+    True si el presupuesto de tokens dejó fuera regiones que podrían tener problemas. Las regiones
+    vienen ordenadas por 'low_stock_count' descendente, así que basta mirar la última incluida.
+    """
+    table = overview.get("regions")
+    if not table or not table["omitted_rows"]:
+        return False
+    return encoding.decode_rows(table)[-1]["low_stock_count"] > 0
+
+
+def _parse_region_list(region_list) -> list:
+    """Extrae los nombres de región del resultado de 'list_all_regions' (dict o texto JSON)."""
+    if isinstance(region_list, str):
+        try:
+            region_list = json.loads(region_list)
+        except ValueError:
+            return []
+    if not isinstance(region_list, dict):
+        return []
+    return list(region_list.get("regions", []))
+
+
+def _region_context(ctx: InvocationContext, orchestrator_name: str, region: str,
+                    region_state: dict) -> InvocationContext:
+    """Copia el contexto con una sesión (más `region_state`) y una rama propias para `region`."""
+    session = ctx.session.model_copy(update={
+        "state": {**ctx.session.state, **region_state, "current_region": region},
+        "events": list(ctx.session.events),
+    })
+    parent_branch = f"{ctx.branch}." if ctx.branch else ""
+    return ctx.model_copy(update={
+        "session": session,
+        "branch": f"{parent_branch}{orchestrator_name}.{region}",
+    })
+
+
+def _append_to_region_session(region_ctx: InvocationContext, event: Event):
+    """Aplica un evento a la sesión aislada de una región (como hace el runner con la sesión real)."""
+    if event.partial:
+        return
+    if event.actions and event.actions.state_delta:
+        region_ctx.session.state.update(event.actions.state_delta)
+    region_ctx.session.events.append(event)
+
 
 # =================================================================
 #  3. AGENTE RAÍZ (PUNTO DE ENTRADA)
@@ -0,0 +1,779 @@
+import asyncio
+import base64
+import datetime
+import json
+from typing import Optional
+
+import psycopg
+
+from MediFinderCore import async_db, catalog, encoding, forecast, metrics, redistribution, search
+
+# Máximo de filas que get_consumption_trends devuelve por llamada (o por página en modo "raw").
+MAX_TRENDS_LIMIT = 200
+# Máximo de filas y de días de horizonte de forecast_stockouts.
+MAX_FORECAST_LIMIT = 200
+MAX_FORECAST_HORIZON_DAYS = 365
+# Máximo de transferencias y de distancia de suggest_stock_transfers.
+MAX_TRANSFERS_LIMIT = 100
+MAX_TRANSFER_DISTANCE_KM = 1000
+# Máximo de filas de get_consumption_anomalies.
+MAX_ANOMALIES_LIMIT = 200
+
+# Versiones asíncronas (psycopg 3) de las herramientas de analytics_tools.py.
+# Las consultas y los resultados deben mantenerse idénticos en ambos módulos.
+
+# --- Herramientas de Análisis (Para el Agente de Gestores) ---
+
+@metrics.instrument
+async def generate_low_stock_report(region_name: str) -> dict:
+    """
+    Genera un reporte de medicamentos con bajo stock o desabastecidos para una región específica.
+    Bajo stock se define por el indicador 'Substock' o 'Desabastecido'.
+    """
+    try:
+        # 1. Resolver el region_id desde el catálogo en memoria
+        region_result = await catalog.aresolve_region(region_name)
+        if not region_result:
+            return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
+        region_id = region_result['region_id']
+
+        async with async_db.get_cursor() as cur:
+            # 2. Obtener el reporte de los últimos registros de inventario (inventory_latest)
+            query = """
+                SELECT
+                    p.name as medicine_name,
+                    mc.name as center_name,
+                    il.current_stock,
+                    il.status_indicator
+                FROM inventory_latest il
+                JOIN products p ON il.product_id = p.product_id
+                JOIN medical_centers mc ON il.center_id = mc.center_id
+                WHERE mc.region_id = %s AND il.status_indicator IN ('Substock', 'Desabastecido')
+                ORDER BY mc.name, p.name;
+            """
+            await cur.execute(query, (region_id,))
+            results = await cur.fetchall()
+
+            if results:
+                return {"status": "success", "report": encoding.encode_rows(results)}
+            
+            return {"status": "no_issues_found", "message": f"No se encontraron problemas de bajo stock o desabastecimiento en la región '{region_name}'."}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+
+@metrics.instrument
+async def generate_low_stock_reports(region_names: list[str], max_rows_per_region: Optional[int] = None) -> dict:
+    """
+    Genera los reportes de bajo stock ('Substock' o 'Desabastecido') de varias regiones a la vez.
+    `region_names` es una lista de regiones, o ["all"] para todas. Con `max_rows_per_region`
+    se devuelven como máximo esas filas por región (los medicamentos desabastecidos primero);
+    `total_rows` indica cuántas filas tenía la región antes del límite. El presupuesto de tokens
+    de los resultados se reparte entre las regiones.
+    """
+    if isinstance(region_names, str):
+        region_names = [region_names]
+    if max_rows_per_region is not None and max_rows_per_region < 1:
+        return {"status": "error", "error_message": "max_rows_per_region debe ser mayor que 0."}
+
+    try:
+        # 1. Resolver los region_id desde el catálogo en memoria ("all" = todas las regiones)
+        all_regions = any(name.strip().lower() in ("all", "todas") for name in region_names)
+        region_ids, not_found = [], []
+        if not all_regions:
+            for name in region_names:
+                region_result = await catalog.aresolve_region(name)
+                if not region_result:
+                    not_found.append(name)
+                elif region_result['region_id'] not in region_ids:
+                    region_ids.append(region_result['region_id'])
+            if not region_ids:
+                return {"status": "region_not_found",
+                        "error_message": f"Regiones no encontradas: {', '.join(not_found)}."}
+        else:
+            await catalog.regions.arefresh()
+
+        async with async_db.get_cursor() as cur:
+            # 2. Un solo recorrido de inventory_latest para todas las regiones pedidas
+            query = """
+                SELECT region_id, medicine_name, center_name, current_stock, status_indicator, total_rows
+                FROM (
+                    SELECT
+                        mc.region_id,
+                        p.name AS medicine_name,
+                        mc.name AS center_name,
+                        il.current_stock,
+                        il.status_indicator,
+                        COUNT(*) OVER (PARTITION BY mc.region_id) AS total_rows,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY mc.region_id
+                            ORDER BY il.status_indicator = 'Desabastecido' DESC, mc.name, p.name
+                        ) AS row_number
+                    FROM inventory_latest il
+                    JOIN products p ON il.product_id = p.product_id
+                    JOIN medical_centers mc ON il.center_id = mc.center_id
+                    WHERE il.status_indicator IN ('Substock', 'Desabastecido')
+                      AND (%(all_regions)s OR mc.region_id = ANY(%(region_ids)s))
+                ) ranked
+                WHERE %(max_rows)s::int IS NULL OR row_number <= %(max_rows)s::int
+                ORDER BY region_id, row_number;
+            """
+            await cur.execute(query, {"all_regions": all_regions, "region_ids": region_ids,
+                                "max_rows": max_rows_per_region})
+            results = await cur.fetchall()
+
+        # 3. Agrupar por región, en el orden pedido (o alfabético para "all")
+        grouped = {}
+        for row in results:
+            row_dict = dict(row)
+            region_id = row_dict.pop('region_id')
+            total_rows = row_dict.pop('total_rows')
+            entry = grouped.setdefault(region_id, {"total_rows": total_rows, "report": []})
+            entry["report"].append(row_dict)
+
+        if all_regions:
+            region_ids = [region['region_id'] for region in catalog.regions.all()]
+        reports, without_issues = [], []
+        region_budget = encoding.TOKEN_BUDGET // max(1, len(grouped))
+        for region_id in region_ids:
+            region_name = catalog.regions.get(region_id)['name']
+            if region_id in grouped:
+                entry = grouped[region_id]
+                report = encoding.encode_rows(entry["report"], token_budget=region_budget)
+                reports.append({"region_name": region_name, "total_rows": entry["total_rows"],
+                                "truncated": len(report["rows"]) < entry["total_rows"],
+                                "report": report})
+            else:
+                without_issues.append(region_name)
+
+        response = {"status": "success" if reports else "no_issues_found", "reports": reports,
+                    "regions_without_issues": without_issues}
+        if not_found:
+            response["regions_not_found"] = not_found
+        return response
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+
+@metrics.instrument
+async def get_national_low_stock_overview() -> dict:
+    """
+    Resume en una sola consulta la situación de stock de todas las regiones, según los últimos
+    registros de inventario: cuántos registros están en 'Substock' o 'Desabastecido' y cuál es
+    el medicamento de mayor consumo mensual promedio de cada región. Las regiones con más
+    problemas van primero.
+    """
+    try:
+        async with async_db.get_cursor() as cur:
+            query = """
+                WITH per_product AS (
+                    SELECT
+                        mc.region_id,
+                        il.product_id,
+                        COUNT(*) FILTER (WHERE il.status_indicator = 'Substock') AS substock_count,
+                        COUNT(*) FILTER (WHERE il.status_indicator = 'Desabastecido') AS stockout_count,
+                        SUM(il.avg_monthly_consumption) AS total_monthly_consumption
+                    FROM inventory_latest il
+                    JOIN medical_centers mc ON il.center_id = mc.center_id
+                    GROUP BY mc.region_id, il.product_id
+                ),
+                ranked AS (
+                    SELECT
+                        per_product.*,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY region_id
+                            ORDER BY total_monthly_consumption DESC NULLS LAST, product_id
+                        ) AS consumption_rank
+                    FROM per_product
+                )
+                SELECT
+                    r.name AS region_name,
+                    SUM(ranked.substock_count)::int AS substock_count,
+                    SUM(ranked.stockout_count)::int AS stockout_count,
+                    SUM(ranked.substock_count + ranked.stockout_count)::int AS low_stock_count,
+                    MAX(p.name) FILTER (WHERE ranked.consumption_rank = 1) AS top_medicine,
+                    MAX(ranked.total_monthly_consumption) FILTER (WHERE ranked.consumption_rank = 1)
+                        AS top_medicine_consumption
+                FROM ranked
+                JOIN regions r ON ranked.region_id = r.region_id
+                JOIN products p ON ranked.product_id = p.product_id
+                GROUP BY r.name
+                ORDER BY low_stock_count DESC, r.name;
+            """
+            await cur.execute(query)
+            results = await cur.fetchall()
+
+            if results:
+                return {"status": "success", "regions": encoding.encode_rows(results)}
+
+            return {"status": "no_data_found", "message": "No se encontraron registros de inventario."}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+
+CONSUMPTION_TREND_MODES = ("monthly", "latest", "top_centers", "raw")
+
+# Primer día de la ventana de los últimos %(months)s meses, contados desde el último mes con
+# reportes ('-infinity' si months es NULL). Como condición sobre report_date permite que
+# PostgreSQL descarte al ejecutar la consulta las particiones mensuales de inventory (migración 005).
+_TRENDS_WINDOW_START = """
+    (SELECT COALESCE((date_trunc('month', max(report_date)) - make_interval(months => %(months)s - 1))::date,
+                     '-infinity'::date)
+     FROM inventory)
+"""
+
+# Consultas de get_consumption_trends por modo. Las fechas se formatean en SQL para
+# devolver las filas tal cual, sin recorrerlas en Python.
+_CONSUMPTION_TREND_QUERIES = {
+    # Totales de la región por fecha de reporte (un punto por mes)
+    "monthly": f"""
+        SELECT
+            to_char(i.report_date, 'YYYY-MM-DD') AS report_date,
+            COUNT(*) AS centers_reporting,
+            SUM(i.avg_monthly_consumption) AS avg_monthly_consumption,
+            SUM(i.last_month_consumption) AS last_month_consumption,
+            SUM(i.accumulated_consumption_12m) AS accumulated_consumption_12m
+        FROM inventory i
+        JOIN medical_centers mc ON i.center_id = mc.center_id
+        WHERE i.product_id = %(product_id)s AND mc.region_id = %(region_id)s
+          AND i.report_date >= {_TRENDS_WINDOW_START}
+        GROUP BY i.report_date
+        ORDER BY i.report_date DESC
+        LIMIT %(limit)s;
+    """,
+    # Último reporte de cada centro de la región
+    "latest": """
+        SELECT
+            mc.name AS center_name,
+            to_char(il.report_date, 'YYYY-MM-DD') AS report_date,
+            il.avg_monthly_consumption,
+            il.last_month_consumption,
+            il.accumulated_consumption_12m
+        FROM inventory_latest il
+        JOIN medical_centers mc ON il.center_id = mc.center_id
+        WHERE il.product_id = %(product_id)s AND mc.region_id = %(region_id)s
+        ORDER BY mc.name
+        LIMIT %(limit)s;
+    """,
+    # Centros con mayor consumo mensual promedio según su último reporte
+    "top_centers": """
+        SELECT
+            mc.name AS center_name,
+            to_char(il.report_date, 'YYYY-MM-DD') AS report_date,
+            il.avg_monthly_consumption,
+            il.last_month_consumption,
+            il.accumulated_consumption_12m
+        FROM inventory_latest il
+        JOIN medical_centers mc ON il.center_id = mc.center_id
+        WHERE il.product_id = %(product_id)s AND mc.region_id = %(region_id)s
+          AND il.avg_monthly_consumption IS NOT NULL
+        ORDER BY il.avg_monthly_consumption DESC, mc.name
+        LIMIT %(limit)s;
+    """,
+    # Historial completo por centro, paginado por clave (center_name, center_id, report_date)
+    "raw": f"""
+        SELECT
+            mc.center_id,
+            mc.name AS center_name,
+            to_char(i.report_date, 'YYYY-MM-DD') AS report_date,
+            i.avg_monthly_consumption,
+            i.last_month_consumption,
+            i.accumulated_consumption_12m
+        FROM inventory i
+        JOIN medical_centers mc ON i.center_id = mc.center_id
+        WHERE i.product_id = %(product_id)s AND mc.region_id = %(region_id)s
+          AND i.report_date >= {_TRENDS_WINDOW_START}
+          AND (%(after_name)s::text IS NULL
+               OR (mc.name, mc.center_id) > (%(after_name)s::text, %(after_center)s::int)
+               OR ((mc.name, mc.center_id) = (%(after_name)s::text, %(after_center)s::int)
+                   AND i.report_date < %(after_date)s::date))
+        ORDER BY mc.name, mc.center_id, i.report_date DESC
+        LIMIT %(limit)s;
+    """,
+}
+
+
+def _encode_trends_cursor(row: dict) -> str:
+    payload = json.dumps([row['center_name'], row['center_id'], row['report_date']])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_trends_cursor(cursor: str) -> tuple:
+    center_name, center_id, report_date = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return center_name, int(center_id), report_date
+
+
+@metrics.instrument
+async def get_consumption_trends(medicine_name: str, region_name: str, mode: str = "monthly",
+                           limit: int = 24, cursor: Optional[str] = None,
+                           months: Optional[int] = None) -> dict:
+    """
+    Analiza las tendencias de consumo de un medicamento específico en una región.
+    Modos (`mode`):
+      - "monthly" (por defecto): totales de la región por mes, los `limit` meses más recientes.
+      - "latest": último reporte de cada centro (hasta `limit` centros).
+      - "top_centers": los `limit` centros con mayor consumo mensual promedio.
+      - "raw": historial por centro y fecha, en páginas de `limit` filas; si hay más filas
+        se devuelve `next_cursor`, que se pasa como `cursor` para pedir la página siguiente.
+    `months` limita "monthly" y "raw" a los últimos `months` meses con reportes
+    (en "monthly", por defecto, los últimos `limit` meses; en "raw", todo el historial).
+    """
+    if mode not in CONSUMPTION_TREND_MODES:
+        return {"status": "error",
+                "error_message": f"Modo '{mode}' no válido. Usa uno de: {', '.join(CONSUMPTION_TREND_MODES)}."}
+    if not 1 <= limit <= MAX_TRENDS_LIMIT:
+        return {"status": "error", "error_message": f"limit debe estar entre 1 y {MAX_TRENDS_LIMIT}."}
+    if months is not None and months < 1:
+        return {"status": "error", "error_message": "months debe ser 1 o mayor."}
+    if months is None and mode == "monthly":
+        months = limit
+    after_name = after_center = after_date = None
+    if cursor and mode == "raw":
+        try:
+            after_name, after_center, after_date = _decode_trends_cursor(cursor)
+        except (ValueError, TypeError):
+            return {"status": "error", "error_message": "El cursor de paginación no es válido."}
+
+    try:
+        # 1. Resolver product_id (búsqueda por similitud) y region_id (catálogo en memoria)
+        match = await search.amatch_medicine(medicine_name)
+        product_result = match['best']
+        if not product_result:
+            return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+        product_id = product_result['product_id']
+
+        region_result = await catalog.aresolve_region(region_name)
+        if not region_result:
+            return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
+        region_id = region_result['region_id']
+
+        async with async_db.get_cursor() as cur:
+            # 2. Agregar en SQL según el modo (en "raw" se pide una fila extra para saber si hay más)
+            params = {"product_id": product_id, "region_id": region_id,
+                      "limit": limit + 1 if mode == "raw" else limit,
+                      "after_name": after_name, "after_center": after_center, "after_date": after_date,
+                      "months": months}
+            await cur.execute(_CONSUMPTION_TREND_QUERIES[mode], params)
+            trends = [dict(row) for row in await cur.fetchall()]
+
+        if not trends:
+            return {"status": "no_data_found", "message": f"No se encontraron datos de consumo para '{medicine_name}' en la región '{region_name}'."}
+
+        if mode != "raw":
+            return {"status": "success", "mode": mode, "trends": encoding.encode_rows(trends), **search.match_note(match)}
+
+        # En "raw" la página termina en la última fila que cabe en el presupuesto de tokens,
+        # y el cursor continúa desde ahí.
+        has_more = len(trends) > limit
+        del trends[limit:]
+        table = encoding.encode_rows([{k: v for k, v in row.items() if k != 'center_id'} for row in trends])
+        response = {"status": "success", "mode": mode, "trends": table, **search.match_note(match)}
+        if has_more or table["omitted_rows"]:
+            response["next_cursor"] = _encode_trends_cursor(trends[len(table["rows"]) - 1])
+        return response
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+# Rankings de consumo: se leen de consumption_rollup (migración 007), un total por región,
+# producto y mes, en lugar de sumar todo el historial de inventory. El consumo de cada fila es el
+# promedio mensual del periodo: la suma de los totales mensuales entre los meses con datos.
+_ROLLUP_PERIOD = """
+    month BETWEEN COALESCE(%(first_month)s::date, '-infinity'::date)
+              AND COALESCE(%(last_month)s::date, 'infinity'::date)
+"""
+
+_MOST_CONSUMED_MEDICINE_QUERY = f"""
+    SELECT
+        p.name AS medicine_name,
+        SUM(cr.avg_monthly_consumption) / w.months AS total_monthly_consumption,
+        to_char(w.first_month, 'YYYY-MM') AS first_month,
+        to_char(w.last_month, 'YYYY-MM') AS last_month
+    FROM consumption_rollup cr
+    JOIN products p ON cr.product_id = p.product_id
+    CROSS JOIN (
+        SELECT COUNT(DISTINCT month) AS months, MIN(month) AS first_month, MAX(month) AS last_month
+        FROM consumption_rollup
+        WHERE region_id = %(region_id)s AND {_ROLLUP_PERIOD}
+    ) w
+    WHERE cr.region_id = %(region_id)s AND {_ROLLUP_PERIOD}
+    GROUP BY p.name, w.months, w.first_month, w.last_month
+    ORDER BY total_monthly_consumption DESC, p.name
+    LIMIT %(top_k)s;
+"""
+
+_TOP_CONSUMING_REGION_QUERY = f"""
+    SELECT
+        r.name AS region_name,
+        SUM(cr.avg_monthly_consumption) / w.months AS total_monthly_consumption,
+        to_char(w.first_month, 'YYYY-MM') AS first_month,
+        to_char(w.last_month, 'YYYY-MM') AS last_month
+    FROM consumption_rollup cr
+    JOIN regions r ON cr.region_id = r.region_id
+    CROSS JOIN (
+        SELECT COUNT(DISTINCT month) AS months, MIN(month) AS first_month, MAX(month) AS last_month
+        FROM consumption_rollup
+        WHERE product_id = %(product_id)s AND {_ROLLUP_PERIOD}
+    ) w
+    WHERE cr.product_id = %(product_id)s AND {_ROLLUP_PERIOD}
+    GROUP BY r.name, w.months, w.first_month, w.last_month
+    ORDER BY total_monthly_consumption DESC, r.name
+    LIMIT %(top_k)s;
+"""
+
+# Máximo de posiciones que devuelven los rankings de consumo.
+MAX_RANKING_TOP_K = 50
+
+
+def _ranking_params(top_k: int, start_month: Optional[str], end_month: Optional[str]) -> dict:
+    """
+    Valida top_k y el periodo ('AAAA-MM', ambos extremos incluidos) y devuelve los parámetros
+    de la consulta. Lanza ValueError con el mensaje para el usuario.
+    """
+    if not 1 <= top_k <= MAX_RANKING_TOP_K:
+        raise ValueError(f"top_k debe estar entre 1 y {MAX_RANKING_TOP_K}.")
+    months = {}
+    for name, value in (("start_month", start_month), ("end_month", end_month)):
+        try:
+            months[name] = datetime.datetime.strptime(value[:7], "%Y-%m").date() if value else None
+        except ValueError:
+            raise ValueError(f"{name} debe tener el formato AAAA-MM.") from None
+    if months["start_month"] and months["end_month"] and months["start_month"] > months["end_month"]:
+        raise ValueError("start_month no puede ser posterior a end_month.")
+    return {"top_k": top_k, "first_month": months["start_month"], "last_month": months["end_month"]}
+
+
+def _ranking_response(rows: list, top_k: int) -> dict:
+    """El primero en `data` y, si se pidió más de uno, el ranking completo en formato columnar."""
+    ranking = [{k: v for k, v in row.items() if k not in ('first_month', 'last_month')} for row in rows]
+    response = {"status": "success", "data": ranking[0],
+                "period": {"start_month": rows[0]['first_month'], "end_month": rows[0]['last_month']}}
+    if top_k > 1:
+        response["ranking"] = encoding.encode_rows(ranking)
+    return response
+
+
+@metrics.instrument
+async def find_most_consumed_medicine_by_region(region_name: str, top_k: int = 1, start_month: Optional[str] = None,
+                                          end_month: Optional[str] = None) -> dict:
+    """
+    Encuentra los medicamentos con mayor consumo mensual promedio en una región específica.
+    `top_k` es el número de medicamentos del ranking (1 por defecto). `start_month` y `end_month`
+    ('AAAA-MM', incluidos) acotan el periodo; por defecto se usa todo el historial.
+    """
+    try:
+        params = _ranking_params(top_k, start_month, end_month)
+    except ValueError as e:
+        return {"status": "error", "error_message": str(e)}
+
+    try:
+        # 1. Resolver el region_id desde el catálogo en memoria
+        region_result = await catalog.aresolve_region(region_name)
+        if not region_result:
+            return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
+        params["region_id"] = region_result['region_id']
+
+        async with async_db.get_cursor() as cur:
+            # 2. Ranking de productos de la región desde el resumen mensual de consumo
+            await cur.execute(_MOST_CONSUMED_MEDICINE_QUERY, params)
+            results = [dict(row) for row in await cur.fetchall()]
+
+            if results:
+                return _ranking_response(results, top_k)
+            
+            return {"status": "no_data_found", "message": f"No se encontraron datos de consumo para la región '{region_name}'."}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+
+@metrics.instrument
+async def find_top_consuming_region_for_medicine(medicine_name: str, top_k: int = 1, start_month: Optional[str] = None,
+                                           end_month: Optional[str] = None) -> dict:
+    """
+    Encuentra las regiones que más consumen un medicamento específico, según su consumo mensual promedio.
+    `top_k` es el número de regiones del ranking (1 por defecto). `start_month` y `end_month`
+    ('AAAA-MM', incluidos) acotan el periodo; por defecto se usa todo el historial.
+    """
+    try:
+        params = _ranking_params(top_k, start_month, end_month)
+    except ValueError as e:
+        return {"status": "error", "error_message": str(e)}
+
+    try:
+        # 1. Resolver el product_id con la búsqueda por similitud
+        match = await search.amatch_medicine(medicine_name)
+        product_result = match['best']
+        if not product_result:
+            return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+        params["product_id"] = product_result['product_id']
+
+        async with async_db.get_cursor() as cur:
+            # 2. Ranking de regiones para ese producto desde el resumen mensual de consumo
+            await cur.execute(_TOP_CONSUMING_REGION_QUERY, params)
+            results = [dict(row) for row in await cur.fetchall()]
+
+            if results:
+                return {**_ranking_response(results, top_k), **search.match_note(match)}
+            
+            return {"status": "no_data_found", "message": f"No se encontraron datos de consumo para el medicamento '{medicine_name}'."}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+@metrics.instrument
+async def forecast_stockouts(region_name: Optional[str] = None, medicine_name: Optional[str] = None,
+                       horizon_days: int = 30, limit: int = 50) -> dict:
+    """
+    Proyecta qué centros se quedarán sin stock en los próximos `horizon_days` días (por defecto,
+    30), contados desde la última fecha de reporte, a partir del consumo reciente y de su tendencia
+    anual. Se puede filtrar por región, por medicamento o por ambos; sin filtros abarca todo el país.
+    Devuelve hasta `limit` filas, de la más urgente a la menos urgente, con los días de cobertura
+    restantes y la fecha estimada de quiebre.
+    """
+    if not 1 <= horizon_days <= MAX_FORECAST_HORIZON_DAYS:
+        return {"status": "error", "error_message": f"horizon_days debe estar entre 1 y {MAX_FORECAST_HORIZON_DAYS}."}
+    if not 1 <= limit <= MAX_FORECAST_LIMIT:
+        return {"status": "error", "error_message": f"limit debe estar entre 1 y {MAX_FORECAST_LIMIT}."}
+
+    try:
+        # 1. Resolver los filtros (región en el catálogo en memoria, medicamento por similitud)
+        region_id = product_id = None
+        match = None
+        if region_name:
+            region_result = await catalog.aresolve_region(region_name)
+            if not region_result:
+                return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
+            region_id = region_result['region_id']
+        if medicine_name:
+            match = await search.amatch_medicine(medicine_name)
+            product_result = match['best']
+            if not product_result:
+                return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+            product_id = product_result['product_id']
+
+        # 2. Proyección vectorizada de la última foto del inventario (en memoria por versión de datos)
+        projection = await forecast.aget_forecast()
+        positions = projection.at_risk(horizon_days, region_id, product_id)
+        note = search.match_note(match) if match else {}
+        if positions.size == 0:
+            return {"status": "no_issues_found", **note,
+                    "message": f"No se proyectan quiebres de stock en los próximos {horizon_days} días."}
+
+        await catalog.products.arefresh()
+        await catalog.regions.arefresh()
+        await catalog.centers.arefresh()
+        rows = []
+        for position in positions[:limit]:
+            product = catalog.products.get(int(projection.product_id[position])) or {}
+            center = catalog.centers.get(int(projection.center_id[position])) or {}
+            region = catalog.regions.get(int(projection.region_id[position])) or {}
+            stockout = projection.stockout_date(position)
+            rows.append({
+                "medicine_name": product.get('name'),
+                "center_name": center.get('name'),
+                "region_name": region.get('name'),
+                "current_stock": int(projection.current_stock[position]),
+                "monthly_consumption": round(float(projection.monthly_rate[position]), 2),
+                "days_of_supply": round(max(float(projection.remaining_days[position]), 0.0), 1),
+                "stockout_date": stockout.isoformat() if stockout else None,
+            })
+        return {"status": "success", "reference_date": projection.reference_date.isoformat(),
+                "horizon_days": horizon_days, "at_risk_total": int(positions.size),
+                "forecast": encoding.encode_rows(rows), **note}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+# Centros de la región con sobrestock o con substock/desabastecido (con consumo y coordenadas),
+# candidatos a ceder o recibir stock en suggest_stock_transfers.
+_TRANSFER_CANDIDATES_QUERY = """
+    SELECT
+        il.center_id, il.product_id, mc.latitude, mc.longitude,
+        il.current_stock, il.avg_monthly_consumption, il.status_indicator
+    FROM inventory_latest il
+    JOIN medical_centers mc ON il.center_id = mc.center_id
+    WHERE mc.region_id = %(region_id)s
+      AND il.status_indicator IN ('Sobrestock', 'Substock', 'Desabastecido')
+      AND il.avg_monthly_consumption > 0
+      AND mc.latitude IS NOT NULL AND mc.longitude IS NOT NULL
+      AND (%(product_id)s::int IS NULL OR il.product_id = %(product_id)s::int);
+"""
+
+
+@metrics.instrument
+async def suggest_stock_transfers(region_name: str, medicine_name: Optional[str] = None,
+                            max_distance_km: float = 100, limit: int = 20) -> dict:
+    """
+    Propone transferencias de stock dentro de una región: desde centros con 'Sobrestock' hacia
+    centros del mismo medicamento con 'Substock' o 'Desabastecido', a `max_distance_km` o menos.
+    Reparte la mayor cantidad posible recorriendo la menor distancia; cada centro cede solo lo
+    que excede 3 meses de consumo y recibe lo que le falta para 2. Con `medicine_name` se limita
+    a ese medicamento. Devuelve las `limit` transferencias principales (los desabastecidos primero)
+    y los totales de todas.
+    """
+    if not 0 < max_distance_km <= MAX_TRANSFER_DISTANCE_KM:
+        return {"status": "error", "error_message": f"max_distance_km debe estar entre 0 y {MAX_TRANSFER_DISTANCE_KM}."}
+    if not 1 <= limit <= MAX_TRANSFERS_LIMIT:
+        return {"status": "error", "error_message": f"limit debe estar entre 1 y {MAX_TRANSFERS_LIMIT}."}
+
+    try:
+        # 1. Resolver la región (catálogo en memoria) y, si se indica, el medicamento (por similitud)
+        region_result = await catalog.aresolve_region(region_name)
+        if not region_result:
+            return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
+        product_id = None
+        match = None
+        if medicine_name:
+            match = await search.amatch_medicine(medicine_name)
+            product_result = match['best']
+            if not product_result:
+                return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+            product_id = product_result['product_id']
+
+        async with async_db.get_cursor() as cur:
+            # 2. Centros que pueden ceder o necesitan stock en la región
+            await cur.execute(_TRANSFER_CANDIDATES_QUERY, {"region_id": region_result['region_id'], "product_id": product_id})
+            candidates = await cur.fetchall()
+
+        # 3. Reparto óptimo de todos los productos a la vez (programa lineal disperso)
+        # El programa lineal puede tardar segundos en una región grande: corre en un hilo para no
+        # detener el event loop (las demás sesiones y regiones del Watcher siguen atendiéndose)
+        transfers = await asyncio.to_thread(
+            lambda: redistribution.rank_transfers(redistribution.plan_transfers(candidates, max_distance_km)))
+        note = search.match_note(match) if match else {}
+        if not transfers:
+            return {"status": "no_transfers_found", **note,
+                    "message": f"No hay centros con sobrestock que puedan abastecer a centros con substock "
+                               f"a menos de {max_distance_km} km en la región '{region_name}'."}
+
+        await catalog.products.arefresh()
+        await catalog.centers.arefresh()
+
+        def name(table, row_id):
+            return (table.get(row_id) or {}).get('name')
+
+        rows = [{
+            "medicine_name": name(catalog.products, t['product_id']),
+            "from_center": name(catalog.centers, t['from_center_id']),
+            "to_center": name(catalog.centers, t['to_center_id']),
+            "quantity": t['quantity'],
+            "distance_km": t['distance_km'],
+            "to_status": t['to_status'],
+            "to_need": t['to_need'],
+        } for t in transfers[:limit]]
+        return {"status": "success", "total_transfers": len(transfers),
+                "total_units": sum(t['quantity'] for t in transfers),
+                "centers_supplied": len({(t['product_id'], t['to_center_id']) for t in transfers}),
+                "transfers": encoding.encode_rows(rows), **note}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+# Anomalías de consumo precalculadas (migración 008, MediFinderCore/anomalies.py), de la más
+# grave a la más leve; los índices por región y por producto devuelven las primeras sin ordenar.
+_CONSUMPTION_ANOMALIES_QUERY = """
+    SELECT
+        p.name AS medicine_name,
+        mc.name AS center_name,
+        r.name AS region_name,
+        to_char(ca.report_date, 'YYYY-MM-DD') AS report_date,
+        ca.last_month_consumption,
+        round(ca.baseline::numeric, 1)::float AS baseline,
+        round(ca.ratio::numeric, 2)::float AS ratio,
+        round(ca.robust_z::numeric, 1)::float AS robust_z,
+        ca.severity,
+        ca.direction,
+        to_char(ca.detected_at, 'YYYY-MM-DD HH24:MI') AS detected_at
+    FROM consumption_anomalies ca
+    JOIN products p ON ca.product_id = p.product_id
+    JOIN medical_centers mc ON ca.center_id = mc.center_id
+    LEFT JOIN regions r ON ca.region_id = r.region_id
+    WHERE ca.severity >= %(min_severity)s
+      AND (%(region_id)s::int IS NULL OR ca.region_id = %(region_id)s::int)
+      AND (%(product_id)s::int IS NULL OR ca.product_id = %(product_id)s::int)
+    ORDER BY ca.severity DESC, abs(ca.robust_z) DESC
+    LIMIT %(limit)s;
+"""
+
+
+@metrics.instrument
+async def get_consumption_anomalies(region_name: Optional[str] = None, medicine_name: Optional[str] = None,
+                              min_severity: int = 2, limit: int = 50) -> dict:
+    """
+    Lista los consumos anómalos detectados: centros cuyo consumo del último mes se aleja mucho de
+    su historial de CPMA (alzas o caídas). Se puede filtrar por región, por medicamento o por ambos;
+    sin filtros abarca todo el país. `min_severity` (1 leve, 2 moderada, 3 grave) fija la severidad
+    mínima. Cada fila trae la línea base, la razón frente a ella y el z robusto; las anomalías se
+    recalculan en lote, así que `detected_at` indica cuándo.
+    """
+    if min_severity not in (1, 2, 3):
+        return {"status": "error", "error_message": "min_severity debe ser 1, 2 o 3."}
+    if not 1 <= limit <= MAX_ANOMALIES_LIMIT:
+        return {"status": "error", "error_message": f"limit debe estar entre 1 y {MAX_ANOMALIES_LIMIT}."}
+
+    try:
+        # 1. Resolver los filtros (región en el catálogo en memoria, medicamento por similitud)
+        region_id = product_id = None
+        match = None
+        if region_name:
+            region_result = await catalog.aresolve_region(region_name)
+            if not region_result:
+                return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
+            region_id = region_result['region_id']
+        if medicine_name:
+            match = await search.amatch_medicine(medicine_name)
+            product_result = match['best']
+            if not product_result:
+                return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+            product_id = product_result['product_id']
+
+        async with async_db.get_cursor() as cur:
+            # 2. Leer las anomalías precalculadas, de la más grave a la más leve
+            await cur.execute(_CONSUMPTION_ANOMALIES_QUERY, {"min_severity": min_severity, "region_id": region_id,
+                                                       "product_id": product_id, "limit": limit})
+            results = await cur.fetchall()
+
+        note = search.match_note(match) if match else {}
+        if results:
+            return {"status": "success", "anomalies": encoding.encode_rows(results), **note}
+
+        return {"status": "no_anomalies_found", **note,
+                "message": "No se detectaron consumos anómalos con esos filtros."}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+@metrics.instrument
+async def send_notification_email(recipient_email: str, subject: str, body: str) -> dict:
+    """
+    Simula el envío de un correo electrónico de notificación a un analista.
+    En una aplicación real, esto se integraría con un servicio de correo.
+    """
+    print("--- SIMULANDO ENVÍO DE CORREO ---")
+    print(f"Para: {recipient_email}")
+    print(f"Asunto: {subject}")
+    print(f"Cuerpo: {body}")
+    print("---------------------------------")
+    return {"status": "success", "message": "Notificación por correo simulada exitosamente."}
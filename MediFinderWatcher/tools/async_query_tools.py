@@ -0,0 +1,245 @@
+import psycopg
+from typing import Optional
+
+from MediFinderCore import answer_cache, async_db, catalog, encoding, geo, metrics, search
+
+# Versiones asíncronas (psycopg 3) de las herramientas de query_tools.py.
+# Las consultas y los resultados deben mantenerse idénticos en ambos módulos.
+
+# --- Herramientas de Consulta (Para el Agente Público) ---
+
+# Marca de "sin entrada en la caché" para respuestas que pueden ser None.
+_NOT_CACHED = object()
+
+@metrics.instrument
+async def find_medicine_details_by_name(medicine_name: str) -> dict:
+    """
+    Busca detalles específicos de medicamentos que coincidan con un nombre dado, ordenados
+    de la coincidencia más parecida a la menos parecida (columna 'score', de 0 a 1).
+    Proporciona detalles como código, descripción, dosis y concentración.
+    """
+    try:
+        candidates = await search.medicines.asearch(medicine_name, limit=20)
+        if not candidates:
+            return {"status": "not_found", "medicines": []}
+        scores = {candidate['product_id']: candidate['score'] for candidate in candidates}
+        async with async_db.get_cursor() as cur:
+            query = """
+                SELECT product_id, code, name, description, dosage_form, strength
+                FROM products
+                WHERE product_id = ANY(%s)
+                ORDER BY array_position(%s::int[], product_id);
+            """
+            ranked_ids = list(scores)
+            await cur.execute(query, (ranked_ids, ranked_ids))
+            results = [{**dict(row), "score": scores[row['product_id']]} for row in await cur.fetchall()]
+            return {"status": "success", "medicines": encoding.encode_rows(results)}
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+@metrics.instrument
+async def find_centers_with_stock_by_medicine(medicine_name: str) -> dict:
+    """
+    Encuentra centros médicos en TODAS las regiones que tienen stock (>0) de un medicamento.
+    """
+    # Esta función es un caso especial de la búsqueda por región, sin filtro de región.
+    return await find_centers_with_stock_by_medicine_region(medicine_name, region_name=None)
+
+@metrics.instrument
+async def find_centers_with_stock_by_medicine_region(medicine_name: str, region_name: Optional[str] = None) -> dict:
+    """
+    Encuentra centros médicos con stock (>0) de un medicamento, opcionalmente filtrando por región.
+    """
+    try:
+        # 1. Resolver el product_id con la búsqueda por similitud
+        match = await search.amatch_medicine(medicine_name)
+        product = match['best']
+        if not product:
+            return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+        product_id = product['product_id']
+
+        # 2. Resolver la región si se proporciona
+        region_id = None
+        if region_name:
+            region_result = await catalog.aresolve_region(region_name)
+            if not region_result:
+                return {"status": "region_not_found", "error_message": f"Región '{region_name}' no encontrada."}
+            region_id = region_result['region_id']
+
+        # 3. Reutilizar la respuesta si los datos no cambiaron desde que se calculó
+        version = await answer_cache.adata_version()
+        cache_key = ("centers_with_stock", product_id, region_id)
+        centers_found = answer_cache.answers.get(cache_key, version)
+        if centers_found is None:
+            # Consulta sobre el último registro de cada centro (inventory_latest)
+            query_sql = """
+                SELECT
+                    mc.name AS center_name, mc.address, r.name AS region_name,
+                    il.current_stock, il.report_date, il.status_indicator,
+                    mc.latitude, mc.longitude
+                FROM inventory_latest il
+                JOIN medical_centers mc ON il.center_id = mc.center_id
+                JOIN regions r ON mc.region_id = r.region_id
+                WHERE il.product_id = %s AND il.current_stock > 0
+            """
+            params = [product_id]
+            if region_id is not None:
+                query_sql += " AND mc.region_id = %s"
+                params.append(region_id)
+            query_sql += " ORDER BY mc.center_id;"
+
+            async with async_db.get_cursor() as cur:
+                await cur.execute(query_sql, tuple(params))
+                centers_found = []
+                for row in await cur.fetchall():
+                    row_dict = dict(row)
+                    row_dict['report_date'] = row_dict['report_date'].isoformat() if row_dict.get('report_date') else None
+                    centers_found.append(row_dict)
+            answer_cache.answers.put(cache_key, version, centers_found)
+
+        if centers_found:
+            return {"status": "success", "centers": encoding.encode_rows(centers_found), **search.match_note(match)}
+
+        message = f"No se encontraron centros con stock para '{medicine_name}'."
+        if region_name:
+            message += f" en la región '{region_name}'."
+        return {"status": "no_centers_found", "centers": [], "message": message}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+@metrics.instrument
+async def find_nearest_centers_with_stock(medicine_name: str, lat: float, lon: float, k: int = 5, radius_km: Optional[float] = None) -> dict:
+    """
+    Encuentra los `k` centros médicos más cercanos a unas coordenadas (lat, lon) que tienen stock (>0)
+    de un medicamento, opcionalmente limitados a un radio en kilómetros. Devuelve la distancia en km.
+    """
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return {"status": "error", "error_message": f"Coordenadas inválidas: ({lat}, {lon})."}
+    if k < 1 or (radius_km is not None and radius_km <= 0):
+        return {"status": "error", "error_message": "'k' y 'radius_km' deben ser positivos."}
+
+    try:
+        # 1. Resolver el product_id y cargar los catálogos que alimentan el índice espacial
+        match = await search.amatch_medicine(medicine_name)
+        product = match['best']
+        if not product:
+            return {"status": "medicine_not_found", "error_message": f"Medicamento '{medicine_name}' no encontrado."}
+        await catalog.centers.arefresh()
+        await catalog.regions.arefresh()
+
+        # 2. Centros con stock según el último registro de inventario (reutilizado mientras no cambien los datos)
+        version = await answer_cache.adata_version()
+        cache_key = ("stock_by_center", product['product_id'])
+        stock_by_center = answer_cache.answers.get(cache_key, version)
+        if stock_by_center is None:
+            async with async_db.get_cursor() as cur:
+                query = """
+                    SELECT il.center_id, il.current_stock, il.report_date, il.status_indicator
+                    FROM inventory_latest il
+                    WHERE il.product_id = %s AND il.current_stock > 0;
+                """
+                await cur.execute(query, (product['product_id'],))
+                stock_by_center = {row['center_id']: dict(row) for row in await cur.fetchall()}
+            answer_cache.answers.put(cache_key, version, stock_by_center)
+
+        # 3. Intersectar el índice espacial con los centros que tienen stock
+        nearest = geo.get_center_index().nearest(lat, lon, k=k, radius_km=radius_km, allowed=stock_by_center.keys())
+        centers_found = []
+        for center_id, distance_km in nearest:
+            # El índice puede ser de un catálogo anterior (centro eliminado o recarga en curso)
+            center = catalog.centers.get(center_id)
+            if center is None:
+                continue
+            region = catalog.regions.get(center['region_id'])
+            stock = stock_by_center[center_id]
+            centers_found.append({
+                "center_name": center['name'], "address": center['address'],
+                "region_name": region['name'] if region else None,
+                "distance_km": round(distance_km, 2),
+                "current_stock": stock['current_stock'],
+                "report_date": stock['report_date'].isoformat() if stock.get('report_date') else None,
+                "status_indicator": stock['status_indicator'],
+                "latitude": center['latitude'], "longitude": center['longitude'],
+            })
+        if centers_found:
+            return {"status": "success", "medicine_name": product['name'], "centers": encoding.encode_rows(centers_found),
+                    **search.match_note(match)}
+
+        message = f"No se encontraron centros con stock para '{medicine_name}' cerca de ({lat}, {lon})."
+        if radius_km is not None:
+            message += f" Radio de búsqueda: {radius_km} km."
+        return {"status": "no_centers_found", "centers": [], "message": message}
+
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+@metrics.instrument
+async def get_stock_details_for_medicine_at_center(medicine_name: str, center_name: str) -> dict:
+    """
+    Obtiene los detalles de stock más recientes para un medicamento en un centro médico específico.
+    """
+    try:
+        # Resolver producto (por similitud) y centro (en memoria) para consultar el inventario por IDs exactos
+        match = await search.amatch_medicine(medicine_name)
+        product = match['best']
+        center = await catalog.aresolve_center(center_name)
+        if not product or not center:
+            return {"status": "stock_not_found", "error_message": f"No se encontró stock para '{medicine_name}' en '{center_name}'."}
+
+        version = await answer_cache.adata_version()
+        cache_key = ("stock_details", product['product_id'], center['center_id'])
+        stock_result = answer_cache.answers.get(cache_key, version, default=_NOT_CACHED)
+        if stock_result is _NOT_CACHED:
+            async with async_db.get_cursor() as cur:
+                query = """
+                    SELECT
+                        il.current_stock, il.report_date, il.status_indicator, il.avg_monthly_consumption
+                    FROM inventory_latest il
+                    WHERE il.product_id = %s AND il.center_id = %s;
+                """
+                await cur.execute(query, (product['product_id'], center['center_id']))
+                row = await cur.fetchone()
+                stock_result = dict(row) if row else None
+            answer_cache.answers.put(cache_key, version, stock_result)
+
+        if stock_result:
+            details = {"medicine_name": product['name'], "center_name": center['name'], **stock_result}
+            details['report_date'] = details['report_date'].isoformat() if details.get('report_date') else None
+            return {"status": "success", "details": details}
+
+        return {"status": "stock_not_found", "error_message": f"No se encontró stock para '{medicine_name}' en '{center_name}'."}
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+@metrics.instrument
+async def list_all_regions() -> dict:
+    """Lista todas las regiones disponibles en la base de datos."""
+    try:
+        await catalog.regions.arefresh()
+        return {"status": "success", "regions": [row['name'] for row in catalog.regions.all()]}
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
+
+@metrics.instrument
+async def search_medicines_by_name(search_term: str) -> dict:
+    """Busca medicamentos disponibles por nombre, del más parecido al menos parecido (limitado a 20 resultados)."""
+    try:
+        results = await search.medicines.asearch(search_term, limit=20)
+        if results:
+            return {"status": "success", "medicines": [row['name'] for row in results]}
+        return {"status": "not_found", "medicines": []}
+    except async_db.ConnectionUnavailable:
+        return {"status": "error", "error_message": "La conexión a la base de datos falló."}
+    except psycopg.Error as e:
+        return {"status": "error", "error_message": f"Error de base de datos: {e}"}
@@ -0,0 +1,89 @@
+"""
+Benchmark de concurrencia de las herramientas de base de datos.
+
+Lanza N "sesiones" en paralelo sobre un mismo event loop, como hace 'adk api_server',
+y compara las herramientas síncronas (psycopg2, bloquean el loop) con las asíncronas
+(psycopg 3, ceden el loop mientras esperan a PostgreSQL).
+
+Cada sesión simula una consulta lenta de una base de datos remota con 'pg_sleep'
+y después llama a las herramientas reales. Con herramientas asíncronas las N sesiones
+deberían terminar en un tiempo cercano al de una sola; con las síncronas, en N veces ese tiempo.
+
+Uso (requiere una base de datos MediFinder con datos):
+    python -m benchmarks.async_concurrency --sessions 20 --latency-ms 200 \
+        --medicine amoxicilina --region tumbes
+
+Sale con código 1 si las sesiones asíncronas tardan más de --max-ratio veces una sesión aislada.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from MediFinderCore import async_db, db
+from MediFinderAgent.tools import async_analytics_tools, async_query_tools, analytics_tools, query_tools
+
+
+def sync_session(medicine: str, region: str, latency: float):
+    with db.get_cursor() as cur:
+        cur.execute("SELECT pg_sleep(%s);", (latency,))
+    query_tools.find_centers_with_stock_by_medicine_region(medicine, region)
+    analytics_tools.generate_low_stock_report(region)
+
+
+async def async_session(medicine: str, region: str, latency: float):
+    async with async_db.get_cursor() as cur:
+        await cur.execute("SELECT pg_sleep(%s);", (latency,))
+    await async_query_tools.find_centers_with_stock_by_medicine_region(medicine, region)
+    await async_analytics_tools.generate_low_stock_report(region)
+
+
+async def run_sync_sessions(n: int, medicine: str, region: str, latency: float) -> float:
+    async def session():
+        # Así se comporta una herramienta síncrona dentro del runner: bloquea el loop.
+        sync_session(medicine, region, latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(n)))
+    return time.perf_counter() - start
+
+
+async def run_async_sessions(n: int, medicine: str, region: str, latency: float) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(async_session(medicine, region, latency) for _ in range(n)))
+    return time.perf_counter() - start
+
+
+async def main(args) -> int:
+    latency = args.latency_ms / 1000
+    # Calentamiento: abre ambos pools para no medir el establecimiento de conexiones.
+    sync_session(args.medicine, args.region, 0)
+    await async_session(args.medicine, args.region, 0)
+
+    single = await run_async_sessions(1, args.medicine, args.region, latency)
+    sync_total = await run_sync_sessions(args.sessions, args.medicine, args.region, latency)
+    async_total = await run_async_sessions(args.sessions, args.medicine, args.region, latency)
+    await async_db.close_pool()
+    db.close_pool()
+
+    ratio = async_total / single
+    print(f"Sesiones en paralelo:       {args.sessions}")
+    print(f"Una sesión aislada:         {single:.3f} s")
+    print(f"Herramientas síncronas:     {sync_total:.3f} s ({sync_total / single:.1f}x una sesión)")
+    print(f"Herramientas asíncronas:    {async_total:.3f} s ({ratio:.1f}x una sesión)")
+    print(f"Aceleración async vs sync:  {sync_total / async_total:.1f}x")
+
+    if ratio > args.max_ratio:
+        print(f"FALLO: las sesiones asíncronas tardaron {ratio:.1f}x una sesión (máximo {args.max_ratio}x).")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--medicine", default="amoxicilina")
+    parser.add_argument("--region", default="tumbes")
+    parser.add_argument("--max-ratio", type=float, default=2.0)
+    sys.exit(asyncio.run(main(parser.parse_args())))
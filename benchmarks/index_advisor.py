@@ -0,0 +1,291 @@
+"""
+Asesor de índices para las consultas de las herramientas.
+
+1. Repite la carga de trabajo de benchmarks.tool_latency (--iterations llamadas por herramienta)
+   y mide su latencia. Si pg_stat_statements está disponible se reinicia antes y se listan las
+   sentencias más costosas; si no, se agregan las consultas capturadas por los cursores.
+2. Compara idx_scan de pg_stat_user_indexes antes y después de la carga: los índices de las
+   tablas de las herramientas que no se usaron son candidatos a eliminar. No se proponen las
+   claves primarias ni las únicas (garantizan la integridad y los ON CONFLICT de la carga de datos).
+3. Repite cada consulta con EXPLAIN (como benchmarks.query_plans) y propone un índice por cada
+   Seq Scan con filtro sobre una tabla grande: columnas de igualdad primero y luego una de rango.
+4. Con --try crea los índices propuestos, repite la carga y muestra la latencia antes y después
+   por herramienta; al terminar los elimina, salvo con --keep.
+
+Uso:
+    python -m benchmarks.index_advisor --iterations 10
+    python -m benchmarks.index_advisor --try --output index_advice.json
+
+pg_stat_statements necesita `shared_preload_libraries = 'pg_stat_statements'` en el servidor
+y `CREATE EXTENSION pg_stat_statements;` en la base de datos.
+"""
+import argparse
+import datetime
+import json
+import re
+import sys
+
+import psycopg2
+
+from MediFinderCore import catalog, db, metrics
+from benchmarks import query_plans, tool_latency
+
+# Tablas que leen las herramientas; los índices de las demás no se evalúan.
+TOOL_TABLES = ("inventory", "inventory_latest", "medical_centers", "products", "regions")
+# Prefijo de los índices que crea --try (y que se eliminan al terminar).
+TRIAL_PREFIX = "advisor_"
+
+_EQUALITY = re.compile(r"(?<![.\w])([a-z_][a-z0-9_]*)\)?\s*=\s*(?!ANY)")
+_RANGE = re.compile(r"(?<![.\w])([a-z_][a-z0-9_]*)\)?\s*(?:>=|<=|>|<|=\s*ANY)")
+
+
+def statement_stats_available() -> bool:
+    try:
+        with db.get_cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_stat_statements LIMIT 1;")
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def index_usage() -> dict:
+    """idx_scan acumulado por índice de las tablas de las herramientas (particiones sumadas en su índice)."""
+    with db.get_cursor() as cur:
+        cur.execute("SELECT pg_stat_clear_snapshot();")
+        cur.execute("""
+            SELECT
+                COALESCE(pg_partition_root(s.indexrelid), s.indexrelid)::regclass::text AS index_name,
+                COALESCE(pg_partition_root(s.relid), s.relid)::regclass::text AS table_name,
+                SUM(s.idx_scan) AS scans
+            FROM pg_stat_user_indexes s
+            WHERE s.schemaname = 'public'
+            GROUP BY 1, 2;
+        """)
+        return {row["index_name"]: {"table": row["table_name"], "scans": int(row["scans"])}
+                for row in cur.fetchall() if row["table_name"] in TOOL_TABLES}
+
+
+def index_catalog() -> dict:
+    """Definición, tamaño, columnas y si respalda una clave primaria o única, por índice (no particiones)."""
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT
+                i.indexrelid::regclass::text AS index_name,
+                i.indrelid::regclass::text AS table_name,
+                pg_get_indexdef(i.indexrelid) AS definition,
+                COALESCE((SELECT SUM(pg_relation_size(t.relid)) FROM pg_partition_tree(i.indexrelid) t),
+                         pg_relation_size(i.indexrelid)) AS bytes,
+                EXISTS (SELECT 1 FROM pg_constraint c
+                        WHERE c.conindid = i.indexrelid AND c.contype IN ('p', 'u')) AS constraint_backed,
+                ARRAY(SELECT a.attname FROM unnest(i.indkey) WITH ORDINALITY k(attnum, position)
+                      JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                      ORDER BY k.position)::text[] AS columns
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE NOT c.relispartition AND i.indrelid::regclass::text = ANY(%s);
+        """, (list(TOOL_TABLES),))
+        return {row["index_name"]: dict(row) for row in cur.fetchall()}
+
+
+def table_columns() -> dict:
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT table_name, array_agg(column_name::text) AS columns
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = ANY(%s)
+            GROUP BY table_name;
+        """, (list(TOOL_TABLES),))
+        return {row["table_name"]: set(row["columns"]) for row in cur.fetchall()}
+
+
+def replay(cases: dict, iterations: int, use_statements: bool) -> tuple:
+    """Ejecuta la carga y devuelve (latencias por herramienta, sentencias más costosas)."""
+    if use_statements:
+        with db.get_cursor() as cur:
+            cur.execute("SELECT pg_stat_statements_reset();")
+    with metrics.capture_queries() as captured:
+        results = tool_latency.run_sync(cases, iterations, warm=False)
+    # Los contadores de cada conexión se publican al cerrarla
+    db.close_pool()
+    if use_statements:
+        with db.get_cursor() as cur:
+            cur.execute("""
+                SELECT query, calls, total_exec_time AS total_ms, mean_exec_time AS mean_ms, rows,
+                       shared_blks_hit + shared_blks_read AS shared_buffers
+                FROM pg_stat_statements
+                WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                  AND query !~* 'pg_stat_statements'
+                ORDER BY total_exec_time DESC
+                LIMIT 15;
+            """)
+            statements = [dict(row) for row in cur.fetchall()]
+    else:
+        statements = _aggregate_captured(captured)
+    return results, statements
+
+
+def _aggregate_captured(captured: list) -> list:
+    by_query = {}
+    for query, _, seconds in captured:
+        text = query_plans._one_line(query if isinstance(query, str) else repr(query))
+        entry = by_query.setdefault(text, {"query": text, "calls": 0, "total_ms": 0.0})
+        entry["calls"] += 1
+        entry["total_ms"] += seconds * 1000
+    statements = sorted(by_query.values(), key=lambda entry: entry["total_ms"], reverse=True)[:15]
+    for entry in statements:
+        entry["mean_ms"] = entry["total_ms"] / entry["calls"]
+    return statements
+
+
+def unused_indexes(before: dict, after: dict, indexes: dict) -> list:
+    """Índices sin ningún escaneo durante la carga, sin contar los de claves primarias o únicas."""
+    unused = []
+    for name, usage in after.items():
+        info = indexes.get(name)
+        if info is None or info["constraint_backed"] or name.startswith(TRIAL_PREFIX):
+            continue
+        if usage["scans"] - before.get(name, {}).get("scans", 0) == 0:
+            unused.append({"index": name, "table": usage["table"], "bytes": int(info["bytes"] or 0),
+                           "definition": info["definition"]})
+    return sorted(unused, key=lambda entry: entry["bytes"], reverse=True)
+
+
+def _ordered_unique(items) -> list:
+    return list(dict.fromkeys(items))
+
+
+def missing_indexes(cases: dict, min_rows: int) -> list:
+    """Índices propuestos para los Seq Scan con filtro sobre tablas grandes de las consultas capturadas."""
+    roots, sizes = query_plans.relations()
+    columns = table_columns()
+    indexes = index_catalog()
+    proposals = {}
+    for query_id, tool, query, params in query_plans.capture_tool_queries(cases):
+        plan = query_plans.explain(query, params)["plan"]
+        for node in query_plans._walk(plan):
+            if node["Node Type"] != "Seq Scan" or "Filter" not in node:
+                continue
+            relation = node["Relation Name"]
+            table = roots.get(relation, relation)
+            if table not in columns:
+                continue
+            known = columns[table]
+            equality = [c for c in _ordered_unique(_EQUALITY.findall(node["Filter"])) if c in known]
+            ranges = [c for c in _ordered_unique(_RANGE.findall(node["Filter"])) if c in known and c not in equality]
+            proposed = equality + ranges[:1]
+            if not proposed:
+                continue
+            key = (table, tuple(proposed))
+            entry = proposals.setdefault(key, {"table": table, "columns": proposed, "rows_scanned": 0,
+                                               "queries": [], "filter": node["Filter"]})
+            entry["rows_scanned"] += int(sizes.get(relation, 0))
+            if query_id not in entry["queries"]:
+                entry["queries"].append(query_id)
+    result = []
+    for entry in proposals.values():
+        if entry["rows_scanned"] < min_rows:
+            continue
+        covering = [name for name, info in indexes.items()
+                    if info["table_name"] == entry["table"] and info["columns"][:len(entry["columns"])] == entry["columns"]]
+        entry["existing"] = covering
+        entry["statement"] = (f"CREATE INDEX {_trial_name(entry['table'], entry['columns'])} "
+                              f"ON {entry['table']} ({', '.join(entry['columns'])});")
+        result.append(entry)
+    return sorted(result, key=lambda entry: entry["rows_scanned"], reverse=True)
+
+
+def _trial_name(table: str, columns: list) -> str:
+    return f"{TRIAL_PREFIX}{table}_{'_'.join(columns)}"[:63]
+
+
+def _run_ddl(statements: list):
+    with db.get_cursor() as cur:
+        for statement in statements:
+            cur.execute(statement)
+
+
+def latency_delta(before: dict, after: dict) -> dict:
+    return {label: {"before_p50_ms": before[label]["p50_ms"], "after_p50_ms": after[label]["p50_ms"],
+                    "before_p95_ms": before[label]["p95_ms"], "after_p95_ms": after[label]["p95_ms"]}
+            for label in before}
+
+
+def main(args) -> int:
+    if not metrics.ENABLED:
+        print("La captura de consultas usa los cursores instrumentados: ejecuta sin TOOL_METRICS_ENABLED=false.")
+        return 2
+    catalog.invalidate()
+    cases = tool_latency.tool_cases(tool_latency.sample_arguments())
+    use_statements = statement_stats_available()
+    if not use_statements:
+        print("AVISO: pg_stat_statements no está disponible; se usan los tiempos medidos en el cliente.")
+
+    usage_before = index_usage()
+    latencies, statements = replay(cases, args.iterations, use_statements)
+    usage_after = index_usage()
+    indexes = index_catalog()
+    unused = unused_indexes(usage_before, usage_after, indexes)
+    missing = missing_indexes(cases, args.large_table_rows)
+
+    print("Sentencias más costosas:")
+    for entry in statements[:10]:
+        print(f"  {entry['total_ms']:>10.1f} ms {entry['calls']:>6} llamadas  {entry['query'][:110]}")
+    print("\nÍndices sin uso durante la carga de las herramientas:")
+    for entry in unused:
+        print(f"  {entry['index']} ({entry['table']}, {entry['bytes'] // 1024} kB)")
+    if not unused:
+        print("  ninguno")
+    print("\nÍndices propuestos:")
+    for entry in missing:
+        existing = f"  (ya existe {', '.join(entry['existing'])}, el planificador no lo eligió)" if entry["existing"] else ""
+        print(f"  {entry['statement']}  -- {entry['rows_scanned']} filas recorridas; {', '.join(entry['queries'])}{existing}")
+    if not missing:
+        print("  ninguno")
+
+    trial = None
+    to_try = [entry for entry in missing if not entry["existing"]]
+    if args.try_indexes and to_try:
+        names = [_trial_name(entry["table"], entry["columns"]) for entry in to_try]
+        # Referencia medida justo antes, en las mismas condiciones que la repetición con los índices
+        before, _ = replay(cases, args.iterations, False)
+        _run_ddl([entry["statement"] for entry in to_try] +
+                 [f"ANALYZE {table};" for table in _ordered_unique(entry["table"] for entry in to_try)])
+        try:
+            after, _ = replay(cases, args.iterations, False)
+        finally:
+            if not args.keep:
+                _run_ddl([f"DROP INDEX IF EXISTS {name};" for name in names])
+        trial = {"indexes": names, "kept": args.keep, "latency": latency_delta(before, after)}
+        print(f"\nLatencia con los índices propuestos ({'conservados' if args.keep else 'eliminados al terminar'}):")
+        print(f"{'herramienta':<46}{'p50 antes':>11}{'p50 después':>13}")
+        for label, row in trial["latency"].items():
+            print(f"{label:<46}{row['before_p50_ms']:>11.2f}{row['after_p50_ms']:>13.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "git_commit": tool_latency.git_commit(),
+                "dataset": tool_latency.dataset_stats(),
+                "pg_stat_statements": use_statements,
+                "latency": latencies,
+                "statements": statements,
+                "unused_indexes": unused,
+                "missing_indexes": missing,
+                "trial": trial,
+            }, f, indent=2, ensure_ascii=False, default=str)
+        print(f"\nInforme en {args.output}")
+    db.close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="Llamadas por herramienta en cada repetición")
+    parser.add_argument("--large-table-rows", type=int, default=10000,
+                        help="Filas recorridas por Seq Scan a partir de las cuales se propone un índice")
+    parser.add_argument("--try", dest="try_indexes", action="store_true",
+                        help="Crear los índices propuestos y medir la latencia antes y después")
+    parser.add_argument("--keep", action="store_true", help="Con --try, conservar los índices creados")
+    parser.add_argument("--output", help="Guardar el informe en este JSON")
+    sys.exit(main(parser.parse_args()))
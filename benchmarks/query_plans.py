@@ -0,0 +1,217 @@
+"""
+Control de regresiones en los planes de las consultas SQL de las herramientas.
+
+Ejecuta cada herramienta de query_tools y analytics_tools (los mismos casos que
+benchmarks.tool_latency, sobre los datos cargados, por ejemplo los de benchmarks.synthetic_data),
+captura cada consulta que lanza y la repite con EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+De cada plan se guarda el coste estimado, el tiempo de ejecución, los buffers compartidos,
+los índices usados, las particiones leídas y los Seq Scan sobre tablas grandes (un Seq Scan sobre
+una partición cuenta como hecho sobre su tabla).
+
+Uso:
+    python -m benchmarks.query_plans --write-baseline query_plan_baseline.json
+    python -m benchmarks.query_plans --baseline query_plan_baseline.json
+
+Con --baseline sale con código 1 si alguna consulta:
+  * hace un Seq Scan sobre una tabla grande (--large-table-rows filas o más entre las particiones
+    recorridas) que no hacía en la línea base,
+  * lee más de --max-buffer-ratio veces los buffers de la línea base, o
+  * tarda más de --max-time-ratio veces lo que tardaba (por encima de --time-floor-ms).
+--max-buffers y --max-ms fijan además presupuestos absolutos por consulta, con o sin línea base.
+"""
+import argparse
+import datetime
+import json
+import re
+import sys
+
+from psycopg2 import sql
+
+from MediFinderCore import db, metrics
+from MediFinderAgent.tools import analytics_tools, query_tools
+from benchmarks import tool_latency
+
+EXPLAIN_PREFIX = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+
+def capture_tool_queries(cases: dict) -> list:
+    """
+    Ejecuta cada caso (una vez para cargar catálogos y otra, con las cachés vacías, para capturar)
+    y devuelve [(id, caso, consulta, parámetros)], con id = 'caso#n' (n = orden de la consulta en el caso).
+    """
+    modules = {"query": query_tools, "analytics": analytics_tools}
+    captured = []
+    for label, (module, function, args, kwargs) in cases.items():
+        tool = getattr(modules[module], function)
+        tool(*args, **kwargs)
+        tool_latency.clear_caches()
+        with metrics.capture_queries() as queries:
+            tool(*args, **kwargs)
+        seen = set()
+        for query, params, _ in queries:
+            key = (repr(query), json.dumps(params, default=str))
+            if key in seen:
+                continue
+            seen.add(key)
+            captured.append((f"{label}#{len(seen)}", label, query, params))
+    return captured
+
+
+def relations() -> tuple:
+    """
+    ({partición: tabla o índice particionado}, {tabla: filas estimadas}) del esquema public, para
+    informar por tabla y no por mes, y para medir cuántas filas recorre cada Seq Scan.
+    """
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT c.relname, pg_partition_root(c.oid)::regclass::text, c.relkind, GREATEST(c.reltuples, 0)
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind IN ('r', 'i') AND n.nspname = 'public';
+        """)
+        rows = cur.fetchall()
+    roots = {name: root for name, root, _, _ in rows if root and root != name}
+    sizes = {name: tuples for name, _, kind, tuples in rows if kind == 'r'}
+    return roots, sizes
+
+
+def large_seq_scans(seq_scans: list, roots: dict, sizes: dict, min_rows: int) -> list:
+    """Tablas con Seq Scan que suman al menos `min_rows` filas (las particiones cuentan como su tabla)."""
+    scanned = {}
+    for name in seq_scans:
+        table = roots.get(name, name)
+        scanned[table] = scanned.get(table, 0) + sizes.get(name, 0)
+    return sorted(table for table, rows in scanned.items() if rows >= min_rows)
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def explain(query, params) -> dict:
+    """Plan real de `query` (texto o sql.Composable) y su resumen. Se revierte la transacción, así que no deja efectos."""
+    with db.get_connection() as conn:
+        try:
+            text = query.as_string(conn) if isinstance(query, sql.Composable) else query
+            with conn.cursor() as cur:
+                cur.execute(EXPLAIN_PREFIX + text, params)
+                result = cur.fetchone()[0][0]
+        finally:
+            conn.rollback()
+    plan = result["Plan"]
+    nodes = list(_walk(plan))
+    return {
+        "query": _one_line(text),
+        "total_cost": plan["Total Cost"],
+        "plan_rows": plan["Plan Rows"],
+        "actual_rows": plan.get("Actual Rows"),
+        "execution_ms": round(result.get("Execution Time", 0.0), 3),
+        "planning_ms": round(result.get("Planning Time", 0.0), 3),
+        "shared_buffers": plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0),
+        "seq_scans": sorted({node["Relation Name"] for node in nodes
+                             if node["Node Type"] == "Seq Scan" and "Relation Name" in node}),
+        # Relaciones que se llegaron a leer (las particiones podadas no aparecen o no se ejecutan)
+        "relations_read": sorted({node["Relation Name"] for node in nodes
+                                  if "Relation Name" in node and node.get("Actual Loops", 1) > 0}),
+        "indexes": sorted({node["Index Name"] for node in nodes if "Index Name" in node}),
+        "plan": plan,
+    }
+
+
+def check(current: dict, baseline: dict, args) -> list:
+    """Problemas de una consulta respecto a la línea base y a los presupuestos absolutos."""
+    problems = []
+    new_seq_scans = [table for table in current["large_seq_scans"]
+                     if table not in (baseline or {}).get("large_seq_scans", [])]
+    if baseline is not None and new_seq_scans:
+        problems.append(f"Seq Scan nuevo sobre {', '.join(new_seq_scans)}")
+    if baseline is not None and baseline["shared_buffers"]:
+        ratio = current["shared_buffers"] / baseline["shared_buffers"]
+        if ratio > args.max_buffer_ratio:
+            problems.append(f"buffers {baseline['shared_buffers']} -> {current['shared_buffers']} ({ratio:.1f}x)")
+    if baseline is not None and current["execution_ms"] > args.time_floor_ms and baseline["execution_ms"]:
+        ratio = current["execution_ms"] / baseline["execution_ms"]
+        if ratio > args.max_time_ratio:
+            problems.append(f"tiempo {baseline['execution_ms']} -> {current['execution_ms']} ms ({ratio:.1f}x)")
+    if args.max_buffers is not None and current["shared_buffers"] > args.max_buffers:
+        problems.append(f"{current['shared_buffers']} buffers (máximo {args.max_buffers})")
+    if args.max_ms is not None and current["execution_ms"] > args.max_ms:
+        problems.append(f"{current['execution_ms']} ms (máximo {args.max_ms})")
+    return problems
+
+
+def _one_line(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip()
+
+
+def main(args) -> int:
+    if not metrics.ENABLED:
+        print("La captura de consultas usa los cursores instrumentados: ejecuta sin TOOL_METRICS_ENABLED=false.")
+        return 2
+    cases = tool_latency.tool_cases(tool_latency.sample_arguments())
+    roots, sizes = relations()
+    plans = {}
+    for query_id, tool, query, params in capture_tool_queries(cases):
+        summary = explain(query, params)
+        summary.update({
+            "tool": tool, "params": params,
+            "large_seq_scans": large_seq_scans(summary["seq_scans"], roots, sizes, args.large_table_rows),
+            "indexes": sorted({roots.get(name, name) for name in summary["indexes"]}),
+            "partitions_read": sum(name in roots for name in summary["relations_read"]),
+        })
+        plans[query_id] = summary
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["queries"]
+
+    failures = 0
+    print(f"{'consulta':<50}{'coste':>12}{'ms':>10}{'buffers':>10}{'partic.':>9}  seq scans grandes / índices")
+    for query_id, summary in plans.items():
+        print(f"{query_id:<50}{summary['total_cost']:>12.1f}{summary['execution_ms']:>10.2f}"
+              f"{summary['shared_buffers']:>10}{summary['partitions_read']:>9}  {', '.join(summary['large_seq_scans']) or '-'} / {', '.join(summary['indexes']) or '-'}")
+        before = baseline.get(query_id) if baseline is not None else None
+        if baseline is not None and before is None:
+            print("    (sin línea base)")
+            continue
+        if before is not None and before["query"] != summary["query"]:
+            print("    AVISO: la consulta cambió desde la línea base")
+        problems = check(summary, before, args)
+        for problem in problems:
+            print(f"    FALLO: {problem}")
+        failures += bool(problems)
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "git_commit": tool_latency.git_commit(),
+                "dataset": tool_latency.dataset_stats(),
+                "large_table_rows": args.large_table_rows,
+                "queries": plans,
+            }, f, indent=2, ensure_ascii=False, default=str)
+        print(f"Línea base guardada en {args.write_baseline}")
+    db.close_pool()
+
+    if failures:
+        print(f"{failures} consulta(s) con regresiones en el plan.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", help="JSON de planes con el que comparar")
+    parser.add_argument("--write-baseline", help="Guardar los planes actuales en este JSON")
+    parser.add_argument("--large-table-rows", type=int, default=10000,
+                        help="Filas recorridas a partir de las cuales un Seq Scan sobre una tabla cuenta como regresión")
+    parser.add_argument("--max-buffer-ratio", type=float, default=2.0)
+    parser.add_argument("--max-time-ratio", type=float, default=3.0)
+    parser.add_argument("--time-floor-ms", type=float, default=5.0,
+                        help="Tiempos por debajo de este valor no se comparan (ruido)")
+    parser.add_argument("--max-buffers", type=int, help="Presupuesto absoluto de buffers por consulta")
+    parser.add_argument("--max-ms", type=float, help="Presupuesto absoluto de tiempo por consulta")
+    sys.exit(main(parser.parse_args()))
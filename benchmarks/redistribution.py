@@ -0,0 +1,68 @@
+"""
+Benchmark del optimizador de transferencias de stock (MediFinderCore.redistribution).
+
+Genera una región sintética (centros repartidos en un área de unos 200 x 200 km, una fracción
+de los productos en cada centro, con 'Sobrestock', 'Substock' y 'Desabastecido' en las
+proporciones dadas) y mide cuánto tarda plan_transfers en resolverla entera, cuántas
+transferencias propone y qué parte de lo que falta cubre. No necesita base de datos.
+
+Uso:
+    python -m benchmarks.redistribution --centers 100 500 1000 --products 1000 --density 0.3
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from MediFinderCore import redistribution
+
+STATUSES = ("Sobrestock", "Substock", "Desabastecido", "Normostock")
+
+
+def synthetic_region(centers: int, products: int, density: float, shares: tuple, seed: int) -> list:
+    """Filas como las de la consulta de candidatos de suggest_stock_transfers."""
+    rng = np.random.default_rng(seed)
+    lat, lon = rng.uniform(-13, -11, centers), rng.uniform(-78, -76, centers)
+    center, product = np.nonzero(rng.random((centers, products)) < density)
+    cpma = rng.gamma(2.0, 30.0, center.size).round(2)
+    status = rng.choice(len(STATUSES), center.size, p=shares)
+    months = np.select([status == 0, status == 1, status == 2],
+                       [rng.uniform(3.2, 8.0, center.size), rng.uniform(0.05, 0.95, center.size), 0.0], 2.0)
+    stock = np.floor(cpma * months).astype(int)
+    keep = status != STATUSES.index("Normostock")
+    return [{"center_id": int(c) + 1, "product_id": int(p) + 1, "latitude": float(lat[c]), "longitude": float(lon[c]),
+             "current_stock": int(s), "avg_monthly_consumption": float(m), "status_indicator": STATUSES[k]}
+            for c, p, s, m, k in zip(center[keep], product[keep], stock[keep], cpma[keep], status[keep])]
+
+
+def main(args) -> int:
+    shares = (args.overstock, args.understock, args.stockout, 1 - args.overstock - args.understock - args.stockout)
+    print(f"{'centros':>8}{'candidatos':>12}{'segundos':>10}{'transferencias':>16}{'unidades':>11}"
+          f"{'cobertura':>11}{'km medios':>11}")
+    for centers in args.centers:
+        rows = synthetic_region(centers, args.products, args.density, shares, args.seed)
+        started = time.perf_counter()
+        transfers = redistribution.plan_transfers(rows, args.max_distance_km)
+        seconds = time.perf_counter() - started
+        needed = sum(max(0, int(np.ceil(redistribution.TARGET_MONTHS * row["avg_monthly_consumption"]
+                                        - row["current_stock"])))
+                     for row in rows if row["status_indicator"] in redistribution.RECEIVER_STATUSES)
+        units = sum(t["quantity"] for t in transfers)
+        mean_km = sum(t["quantity"] * t["distance_km"] for t in transfers) / units if units else 0.0
+        print(f"{centers:>8}{len(rows):>12}{seconds:>10.2f}{len(transfers):>16}{units:>11}"
+              f"{units / needed if needed else 0:>11.0%}{mean_km:>11.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--centers", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--density", type=float, default=0.3, help="Fracción de productos presentes en cada centro")
+    parser.add_argument("--overstock", type=float, default=0.25, help="Fracción de filas con 'Sobrestock'")
+    parser.add_argument("--understock", type=float, default=0.2, help="Fracción de filas con 'Substock'")
+    parser.add_argument("--stockout", type=float, default=0.05, help="Fracción de filas 'Desabastecido'")
+    parser.add_argument("--max-distance-km", type=float, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    sys.exit(main(parser.parse_args()))
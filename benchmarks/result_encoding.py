@@ -0,0 +1,68 @@
+"""
+Benchmark del tamaño de los resultados de herramientas en el contexto del LLM.
+
+Compara, para filas con la forma de las herramientas de MediFinder, la lista de dicts que
+devolvían antes (cada fila repite todas las claves) con el formato columnar de
+MediFinderCore.encoding, con y sin presupuesto de tokens. Los tokens se estiman con
+encoding.estimate_tokens (caracteres / 4 del JSON compacto); no necesita base de datos.
+
+Uso:
+    python -m benchmarks.result_encoding --rows 20 200 1000 --budget 1500
+"""
+import argparse
+import datetime
+import random
+import sys
+
+from MediFinderCore import encoding
+
+STATUSES = ("Normostock", "Substock", "Desabastecido", "Sobrestock")
+
+
+def centers_rows(n: int, rng: random.Random) -> list:
+    """Filas como las de find_centers_with_stock_by_medicine_region."""
+    return [{
+        "center_name": f"CENTRO DE SALUD {rng.choice(['SAN JUAN', 'LA VICTORIA', 'SANTA ROSA', 'EL PORVENIR'])} {i}",
+        "address": f"AV. {rng.choice(['GRAU', 'BOLOGNESI', 'SAN MARTIN'])} {rng.randint(1, 2000)}",
+        "region_name": rng.choice(["LIMA", "PIURA", "TUMBES", "CUSCO"]),
+        "current_stock": rng.randint(1, 5000),
+        "report_date": datetime.date(2025, rng.randint(1, 6), 1).isoformat(),
+        "status_indicator": rng.choice(STATUSES),
+        "latitude": round(rng.uniform(-18, 0), 6),
+        "longitude": round(rng.uniform(-81, -69), 6),
+    } for i in range(n)]
+
+
+def low_stock_rows(n: int, rng: random.Random) -> list:
+    """Filas como las de generate_low_stock_report."""
+    return [{
+        "medicine_name": f"MEDICAMENTO {rng.randint(1, 3000)} {rng.choice(['500 mg TAB', '120 mg/5 mL JBE', '1 g INY'])}",
+        "center_name": f"CENTRO DE SALUD {i}",
+        "current_stock": rng.randint(0, 50),
+        "status_indicator": rng.choice(STATUSES[1:3]),
+    } for i in range(n)]
+
+
+def main(args) -> int:
+    rng = random.Random(args.seed)
+    print(f"{'resultado':<14}{'filas':>7}{'dicts':>10}{'columnar':>10}{'ahorro':>8}"
+          f"{'con presupuesto':>17}{'filas incluidas':>17}")
+    for label, make_rows in (("centros", centers_rows), ("bajo stock", low_stock_rows)):
+        for n in args.rows:
+            rows = make_rows(n, rng)
+            as_dicts = encoding.estimate_tokens({"status": "success", "rows": rows})
+            columnar = encoding.estimate_tokens(
+                {"status": "success", "rows": encoding.encode_rows(rows, token_budget=10**9)})
+            budgeted_table = encoding.encode_rows(rows, token_budget=args.budget)
+            budgeted = encoding.estimate_tokens({"status": "success", "rows": budgeted_table})
+            print(f"{label:<14}{n:>7}{as_dicts:>10}{columnar:>10}{1 - columnar / as_dicts:>8.0%}"
+                  f"{budgeted:>17}{len(budgeted_table['rows']):>17}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[20, 200, 1000])
+    parser.add_argument("--budget", type=int, default=encoding.TOKEN_BUDGET)
+    parser.add_argument("--seed", type=int, default=7)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,136 @@
+"""
+Benchmark de latencia por mensaje del agente raíz de MediFinderAgent.
+
+Compara el enrutador anterior (un LLM con ROOT_AGENT_INST que delega con 'transfer_to_agent')
+con PrefixRouterAgent (sin LLM, lee el prefijo 'Publico:'/'Analista:'). Ambos árboles usan
+un modelo simulado que tarda --latency-ms por turno, así que la diferencia es el turno del
+LLM enrutador que se ahorra en cada mensaje. No necesita base de datos ni Gemini.
+
+Uso:
+    python -m benchmarks.router_latency --messages 20 --latency-ms 300
+
+Sale con código 1 si algún mensaje llega al agente equivocado.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import AsyncGenerator
+
+from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from MediFinderAgent import agent as medifinder
+from MediFinderAgent.tools.prompts import (
+    ANALYTICS_AGENT_INST, PUBLIC_AGENT_INST, ROOT_AGENT_DESC, ROOT_AGENT_INST
+)
+
+EXPECTED_AGENT = {"Publico": "MediFinderPublicAgent", "Analista": "MediFinderAnalyticsAgent"}
+
+
+class StubLlm(BaseLlm):
+    """
+    Modelo simulado que enruta siempre bien: el enrutador LLM transfiere según el prefijo, y un
+    especialista que recibe un mensaje del otro rol transfiere a su par (como haría Gemini cuando
+    la sesión sigue en el último agente que respondió); si no, responde con texto.
+    """
+    model: str = "stub"
+    latency: float = 0.3
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.latency)
+        instruction = str(llm_request.config.system_instruction or "")
+        # Los eventos de otros agentes llegan como texto de rol "user"; solo cuentan los mensajes con prefijo.
+        user_texts = [part.text for content in llm_request.contents if content.role == "user"
+                      for part in (content.parts or []) if part.text and part.text.startswith(tuple(EXPECTED_AGENT))]
+        last_user = user_texts[-1] if user_texts else ""
+        target = EXPECTED_AGENT["Analista" if last_user.startswith("Analista:") else "Publico"]
+        current = {ROOT_AGENT_INST: None, PUBLIC_AGENT_INST: EXPECTED_AGENT["Publico"],
+                   ANALYTICS_AGENT_INST: EXPECTED_AGENT["Analista"]}
+        agent_name = next((name for inst, name in current.items() if inst in instruction), target)
+        answered = llm_request.contents and llm_request.contents[-1].role == "user" and any(
+            part.function_response for part in llm_request.contents[-1].parts or [])
+        if agent_name != target and not answered:
+            part = types.Part(function_call=types.FunctionCall(
+                name="transfer_to_agent", args={"agent_name": target}))
+        else:
+            part = types.Part(text=f"Respuesta a: {last_user}")
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[part]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=0, candidates_token_count=0, total_token_count=0),
+        )
+
+
+def specialists(model: BaseLlm) -> list:
+    return [medifinder.PublicAgent.clone(update={"model": model}),
+            medifinder.AnalyticsAgent.clone(update={"model": model})]
+
+
+def llm_router(model: BaseLlm) -> Agent:
+    """El agente raíz anterior: un LLM que solo decide a qué especialista delegar."""
+    return Agent(name="MediFinderRootAgent", model=model, description=ROOT_AGENT_DESC,
+                 instruction=ROOT_AGENT_INST, sub_agents=specialists(model))
+
+
+def prefix_router(model: BaseLlm) -> medifinder.PrefixRouterAgent:
+    return medifinder.root_agent.clone(update={
+        "sub_agents": specialists(model) + [medifinder.RoleClassifierAgent.clone(update={"model": model})],
+    })
+
+
+async def run_messages(root, messages: list):
+    """Envía los mensajes en una misma sesión; devuelve (latencias, agentes que respondieron)."""
+    session_service = InMemorySessionService()
+    runner = Runner(agent=root, app_name="router_bench", session_service=session_service)
+    session = await session_service.create_session(app_name="router_bench", user_id="bench")
+    latencies, authors = [], []
+    for message in messages:
+        start = time.perf_counter()
+        author = None
+        async for event in runner.run_async(
+            user_id="bench", session_id=session.id,
+            new_message=types.Content(role="user", parts=[types.Part(text=message)]),
+        ):
+            if event.content and any(part.text for part in event.content.parts or []):
+                author = event.author
+        latencies.append(time.perf_counter() - start)
+        authors.append(author)
+    return latencies, authors
+
+
+async def main(args) -> int:
+    model = StubLlm(latency=args.latency_ms / 1000)
+    roles = ["Publico" if i % 2 == 0 else "Analista" for i in range(args.messages)]
+    messages = [f"{role}: pregunta {i}" for i, role in enumerate(roles)]
+
+    # Calentamiento: la primera ejecución paga importaciones y la creación de objetos de ADK.
+    await run_messages(prefix_router(model.model_copy(update={"latency": 0})), messages[:2])
+
+    results = {}
+    for label, root in (("Enrutador LLM", llm_router(model)), ("Enrutador por prefijo", prefix_router(model))):
+        latencies, authors = await run_messages(root, messages)
+        wrong = sum(author != EXPECTED_AGENT[role] for author, role in zip(authors, roles))
+        results[label] = (statistics.mean(latencies), wrong)
+        print(f"{label:<24} media {statistics.mean(latencies) * 1000:7.1f} ms/mensaje   "
+              f"p95 {sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000:7.1f} ms   "
+              f"mal enrutados: {wrong}")
+
+    saved = results["Enrutador LLM"][0] - results["Enrutador por prefijo"][0]
+    print(f"Ahorro por mensaje: {saved * 1000:.1f} ms")
+    return 1 if any(wrong for _, wrong in results.values()) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    sys.exit(asyncio.run(main(parser.parse_args())))
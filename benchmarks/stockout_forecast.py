@@ -0,0 +1,170 @@
+"""
+Benchmark de la proyección de quiebres de stock (MediFinderCore.forecast) a escala nacional.
+
+Mide la carga de la foto (el CSV de forecast.SNAPSHOT_COPY convertido a arrays) y compara la
+proyección vectorizada con NumPy (una pasada sobre todas las filas) con la misma proyección
+calculada fila a fila en Python, comprobando que ambas dan los mismos días de cobertura. Por
+defecto usa filas sintéticas con la forma de inventory_latest, escritas como las devuelve COPY
+(no necesita base de datos); con --database usa la foto actual de la base de datos configurada
+y mide también la lectura con COPY y, como referencia, la lectura anterior con un DictCursor.
+
+Uso:
+    python -m benchmarks.stockout_forecast --rows 100000 1000000 2000000
+    python -m benchmarks.stockout_forecast --database
+"""
+import argparse
+import io
+import math
+import sys
+import time
+
+import numpy as np
+
+from MediFinderCore import db, forecast
+
+
+def synthetic_snapshot(n: int, seed: int) -> str:
+    """CSV como el de forecast.SNAPSHOT_COPY, con CPMA históricos y valores nulos ('nan') ocasionales."""
+    rng = np.random.default_rng(seed)
+    cpma = rng.gamma(2.0, 40.0, n).round(2)
+    growth = rng.lognormal(0.0, 0.15, n)
+    history = [np.where(rng.random(n) < 0.1, np.nan, (cpma / growth ** years).round(2)) for years in (1, 2, 3)]
+    last_month = np.where(rng.random(n) < 0.05, np.nan, rng.poisson(cpma * rng.uniform(0.7, 1.3, n)))
+    stock = np.where(rng.random(n) < 0.05, 0, rng.poisson(cpma * rng.uniform(0.2, 5.0, n)))
+    report_day = 20240 - 30 * rng.integers(0, 3, n)
+    matrix = np.column_stack([
+        rng.integers(1, 8001, n), rng.integers(1, 5001, n), rng.integers(1, 26, n), stock, cpma, last_month,
+        history[0], history[1], history[2], report_day,
+    ])  # en el orden de forecast.SNAPSHOT_COLUMNS
+    buffer = io.StringIO()
+    np.savetxt(buffer, matrix, fmt="%.10g", delimiter=",")
+    return buffer.getvalue()
+
+
+def database_snapshot() -> tuple:
+    """(CSV de la foto actual, segundos de la lectura con COPY, segundos de la lectura anterior)."""
+    read_seconds, text = _timed(forecast.read_snapshot, 1)
+
+    def dict_rows():
+        # Lectura anterior: una fila dict por centro x producto y una lista de Python por columna
+        with db.get_cursor() as cur:
+            cur.execute(forecast.SNAPSHOT_QUERY)
+            rows = cur.fetchall()
+        return {column: np.array([row[column] for row in rows], dtype=np.float64)
+                for column in forecast.SNAPSHOT_COLUMNS}
+
+    previous_seconds, _ = _timed(dict_rows, 1)
+    db.close_pool()
+    return text, read_seconds, previous_seconds
+
+
+def rows_from(matrix: np.ndarray) -> list:
+    """Filas dict (None en lugar de NaN) para la proyección fila a fila."""
+    return [{name: None if math.isnan(value) else value for name, value in zip(forecast.SNAPSHOT_COLUMNS, row)}
+            for row in matrix.tolist()]
+
+
+def project_row(row: dict) -> float:
+    """Días de cobertura de una fila, con las mismas reglas que forecast, sin NumPy."""
+    cpma, last_month = row["avg_monthly_consumption"], row["last_month_consumption"]
+    if cpma is None:
+        monthly = last_month
+    elif last_month is None:
+        monthly = cpma
+    else:
+        monthly = (1 - forecast.RECENT_WEIGHT) * cpma + forecast.RECENT_WEIGHT * last_month
+
+    points = [(years, math.log(value)) for years, value in
+              ((-3, row["cpma_36_months_ago"]), (-2, row["cpma_24_months_ago"]),
+               (-1, row["cpma_12_months_ago"]), (0, cpma)) if value is not None and value > 0]
+    growth = 1.0
+    if len(points) >= 2:
+        n = len(points)
+        sum_t = sum(t for t, _ in points)
+        sum_y = sum(y for _, y in points)
+        sum_tt = sum(t * t for t, _ in points)
+        sum_ty = sum(t * y for t, y in points)
+        growth = math.exp((n * sum_ty - sum_t * sum_y) / (n * sum_tt - sum_t ** 2))
+    growth = min(max(growth, forecast.MIN_ANNUAL_GROWTH), forecast.MAX_ANNUAL_GROWTH)
+
+    stock = row["current_stock"]
+    if stock <= 0:
+        return 0.0
+    if monthly is None or monthly <= 0:
+        return math.inf
+    daily = monthly * 12 / forecast.DAYS_PER_YEAR
+    rate = math.log(growth) / forecast.DAYS_PER_YEAR
+    if abs(rate) < 1e-12:
+        return stock / daily
+    argument = 1 + stock * rate / daily
+    return math.log(argument) / rate if argument > 0 else math.inf
+
+
+def _timed(function, repeat: int):
+    best, result = math.inf, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def compare(text: str, repeat: int) -> dict:
+    parse_seconds, matrix = _timed(lambda: forecast.parse_snapshot(text), repeat)
+    build_seconds, snapshot = _timed(lambda: forecast.StockForecast(matrix), 1)
+    columns = dict(zip(forecast.SNAPSHOT_COLUMNS, matrix.T))
+    rows = rows_from(matrix)
+
+    def vectorized():
+        monthly = forecast.monthly_consumption(columns["avg_monthly_consumption"], columns["last_month_consumption"])
+        growth = forecast.annual_growth(columns["avg_monthly_consumption"], columns["cpma_12_months_ago"],
+                                        columns["cpma_24_months_ago"], columns["cpma_36_months_ago"])
+        return forecast.days_of_supply(columns["current_stock"], monthly, growth)
+
+    numpy_seconds, numpy_days = _timed(vectorized, repeat)
+    loop_seconds, loop_days = _timed(lambda: np.array([project_row(row) for row in rows]), 1)
+    finite = np.isfinite(loop_days)
+    return {
+        "rows": len(rows),
+        "parse_s": parse_seconds,
+        "forecast_s": build_seconds,
+        "numpy_s": numpy_seconds,
+        "loop_s": loop_seconds,
+        "same_infinite": bool(np.array_equal(finite, np.isfinite(numpy_days))
+                              and np.array_equal(finite, np.isfinite(snapshot.days_of_supply))),
+        "max_abs_diff_days": float(np.max(np.abs(loop_days[finite] - numpy_days[finite]), initial=0.0)),
+    }
+
+
+def main(args) -> int:
+    if args.database:
+        text, read_seconds, previous_seconds = database_snapshot()
+        datasets = [("base de datos", text, read_seconds)]
+    else:
+        datasets = [(f"sintético {n}", synthetic_snapshot(n, args.seed), None) for n in args.rows]
+    print(f"{'datos':<22}{'filas':>10}{'COPY (s)':>10}{'parseo (s)':>12}{'foto (s)':>10}{'NumPy (s)':>12}"
+          f"{'bucle (s)':>12}{'aceleración':>13}{'dif. máx. (días)':>18}")
+    failures = 0
+    for label, text, read_seconds in datasets:
+        result = compare(text, args.repeat)
+        speedup = result["loop_s"] / result["numpy_s"] if result["numpy_s"] else math.inf
+        read = f"{read_seconds:>10.3f}" if read_seconds is not None else f"{'-':>10}"
+        print(f"{label:<22}{result['rows']:>10}{read}{result['parse_s']:>12.3f}{result['forecast_s']:>10.3f}"
+              f"{result['numpy_s']:>12.4f}{result['loop_s']:>12.3f}{speedup:>12.0f}x"
+              f"{result['max_abs_diff_days']:>18.2e}")
+        if not result["same_infinite"] or result["max_abs_diff_days"] > 1e-6:
+            print("    FALLO: la proyección vectorizada no coincide con la fila a fila")
+            failures += 1
+    if args.database:
+        print(f"Carga anterior (DictCursor y una lista por columna): {previous_seconds:.3f} s "
+              f"frente a {read_seconds + result['parse_s']:.3f} s con COPY y np.loadtxt")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--database", action="store_true", help="Usar la foto de inventory_latest de la base de datos")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones de la pasada vectorizada (se toma la mejor)")
+    parser.add_argument("--seed", type=int, default=7)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,255 @@
+"""
+Generador determinista de datos sintéticos de MediFinder a escala configurable.
+
+Escribe archivos CSV listos para COPY con las columnas de DB/DB-creation-script.sql
+(regions, medical_centers, products, inventory), un 'load.sql' para cargarlos con psql y un
+'manifest.json' con los parámetros y el número de filas. La misma semilla produce siempre los
+mismos archivos: cada centro usa su propio generador derivado de (semilla, center_id).
+
+Cada centro maneja una fracción (--density) del catálogo de productos y reporta todos los
+meses; el inventario tiene centros × productos × density × meses filas. Escala nacional:
+
+    python -m benchmarks.synthetic_data --out /tmp/medifinder_synth \
+        --regions 25 --centers 8000 --products 5000 --months 36 --density 0.05
+
+Carga (sobre una base creada con DB-creation-script.sql y las migraciones):
+    psql -d medifinder -f /tmp/medifinder_synth/load.sql
+o bien 'python -m benchmarks.tool_latency --load /tmp/medifinder_synth'.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+
+import numpy as np
+
+# Regiones del Perú; si se piden más, se añaden "REGION n".
+REGION_NAMES = [
+    "AMAZONAS", "ANCASH", "APURIMAC", "AREQUIPA", "AYACUCHO", "CAJAMARCA", "CALLAO", "CUSCO",
+    "HUANCAVELICA", "HUANUCO", "ICA", "JUNIN", "LA LIBERTAD", "LAMBAYEQUE", "LIMA", "LORETO",
+    "MADRE DE DIOS", "MOQUEGUA", "PASCO", "PIURA", "PUNO", "SAN MARTIN", "TACNA", "TUMBES", "UCAYALI",
+]
+INGREDIENTS = [
+    "AMOXICILINA", "PARACETAMOL", "IBUPROFENO", "METFORMINA", "ENALAPRIL", "LOSARTAN", "OMEPRAZOL",
+    "AZITROMICINA", "CIPROFLOXACINO", "CEFALEXINA", "DICLOFENACO", "NAPROXENO", "LORATADINA",
+    "CLORFENAMINA", "SALBUTAMOL", "PREDNISONA", "DEXAMETASONA", "RANITIDINA", "METRONIDAZOL",
+    "SULFAMETOXAZOL + TRIMETOPRIMA", "ACIDO FOLICO", "SULFATO FERROSO", "HIDROCLOROTIAZIDA",
+    "FUROSEMIDA", "ATORVASTATINA", "SIMVASTATINA", "GLIBENCLAMIDA", "INSULINA NPH", "CAPTOPRIL",
+    "AMLODIPINO", "NIFEDIPINO", "CLOTRIMAZOL", "FLUCONAZOL", "NISTATINA", "ALBENDAZOL",
+    "MEBENDAZOL", "IVERMECTINA", "ACICLOVIR", "OSELTAMIVIR", "DOXICICLINA", "CLARITROMICINA",
+    "GENTAMICINA", "CEFTRIAXONA", "OXITOCINA", "MISOPROSTOL", "TRAMADOL", "MORFINA", "KETOROLACO",
+    "METAMIZOL", "HIOSCINA", "ONDANSETRON", "METOCLOPRAMIDA", "LEVOTIROXINA", "CARBAMAZEPINA",
+    "FENITOINA", "ACIDO VALPROICO", "DIAZEPAM", "SERTRALINA", "FLUOXETINA", "HALOPERIDOL",
+]
+PRESENTATIONS = [
+    ("TAB", ["5 mg", "10 mg", "20 mg", "50 mg", "100 mg", "250 mg", "500 mg", "850 mg", "1 g"]),
+    ("CAP", ["20 mg", "250 mg", "500 mg"]),
+    ("JBE", ["120 mg/5 mL", "250 mg/5 mL"]),
+    ("INY", ["1 g", "500 mg/2 mL", "10 mg/mL"]),
+    ("SUS", ["200 mg/5 mL", "400 mg/5 mL"]),
+    ("CRM", ["1 %", "2 %"]),
+]
+CATEGORIES = ["I-1", "I-2", "I-3", "I-4", "II-1", "II-2", "III-1"]
+
+# Columnas de cada archivo, en el orden de COPY. status_indicator se calcula aquí con las
+# reglas de inventory_status_indicator() (migración 002) y se carga con medifinder.bulk_load.
+TABLES = {
+    "regions": ["region_id", "name", "code"],
+    "medical_centers": ["center_id", "code", "name", "region_id", "category", "institution_type",
+                        "address", "latitude", "longitude"],
+    "products": ["product_id", "code", "name", "type_id", "description", "dosage_form", "strength"],
+    "inventory": ["center_id", "product_id", "current_stock", "avg_monthly_consumption",
+                  "accumulated_consumption_4m", "last_month_consumption", "last_month_stock",
+                  "status_indicator", "cpma_12_months_ago", "cpma_24_months_ago", "cpma_36_months_ago",
+                  "accumulated_consumption_12m", "report_date"],
+}
+SEQUENCES = {"regions": "region_id", "medical_centers": "center_id", "products": "product_id"}
+
+
+def status_indicator(current_stock: int, avg_monthly_consumption: float) -> str:
+    """Mismas reglas que inventory_status_indicator() para filas con consumo conocido."""
+    if avg_monthly_consumption > 0:
+        if current_stock == 0:
+            return "Desabastecido"
+        if current_stock < avg_monthly_consumption:
+            return "Substock"
+        if current_stock > avg_monthly_consumption * 3:
+            return "Sobrestock"
+        return "Normostock"
+    if current_stock == 0:
+        return "Desabastecido"
+    return "Sin_Rotación" if current_stock > 0 else "Sin_Consumo"
+
+
+def month_starts(last_month: datetime.date, months: int) -> list:
+    dates = []
+    year, month = last_month.year, last_month.month
+    for _ in range(months):
+        dates.append(datetime.date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return dates[::-1]
+
+
+def region_rows(n: int) -> list:
+    names = REGION_NAMES[:n] + [f"REGION {i}" for i in range(len(REGION_NAMES) + 1, n + 1)]
+    return [[i, name, f"{i:02d}"] for i, name in enumerate(names, start=1)]
+
+
+def product_rows(n: int, rng: np.random.Generator) -> list:
+    combos = [(ingredient, strength, form) for ingredient in INGREDIENTS
+              for form, strengths in PRESENTATIONS for strength in strengths]
+    order = rng.permutation(len(combos))
+    rows = []
+    for product_id in range(1, n + 1):
+        ingredient, strength, form = combos[order[(product_id - 1) % len(combos)]]
+        lap = (product_id - 1) // len(combos)
+        name = f"{ingredient} {strength} {form}" + (f" ({lap + 1})" if lap else "")
+        rows.append([product_id, f"P{product_id:06d}", name, 1, None, form, strength])
+    return rows
+
+
+def center_rows(n: int, regions: list, rng: np.random.Generator) -> list:
+    # Cada región tiene un centroide dentro del territorio peruano; los centros se dispersan alrededor.
+    centroids = np.column_stack([rng.uniform(-17.5, -3.5, len(regions)), rng.uniform(-80.5, -69.5, len(regions))])
+    region_of = rng.integers(0, len(regions), n)
+    rows = []
+    for center_id in range(1, n + 1):
+        r = region_of[center_id - 1]
+        lat, lon = centroids[r] + rng.normal(0, 0.6, 2)
+        category = CATEGORIES[rng.integers(0, len(CATEGORIES))]
+        kind = "HOSPITAL" if category.startswith(("II", "III")) else "CENTRO DE SALUD"
+        rows.append([center_id, f"C{center_id:06d}", f"{kind} {regions[r][1]} {center_id}", regions[r][0],
+                     category, "GOBIERNO REGIONAL", f"AV. PRINCIPAL {rng.integers(1, 3000)}",
+                     round(float(lat), 6), round(float(lon), 6)])
+    return rows
+
+
+def inventory_rows(center_id: int, n_products: int, dates: list, density: float, seed: int):
+    """Filas de inventario de un centro: un subconjunto de productos reportado todos los meses."""
+    rng = np.random.default_rng([seed, center_id])
+    carried = np.flatnonzero(rng.random(n_products) < density) + 1
+    if carried.size == 0:
+        return
+    months = len(dates)
+    # Consumo mensual: nivel base log-normal por producto, estacionalidad anual y ruido.
+    base = rng.lognormal(mean=3.0, sigma=1.0, size=(carried.size, 1))
+    season = 1 + 0.25 * np.sin(2 * np.pi * (np.arange(months) + rng.integers(0, 12)) / 12)
+    consumption = np.rint(base * season * rng.gamma(4.0, 0.25, size=(carried.size, months))).astype(int)
+    # Stock: días de cobertura variables, con quiebres de stock ocasionales.
+    cover = rng.uniform(0.2, 4.5, size=(carried.size, months))
+    stock = np.rint(consumption * cover).astype(int)
+    stock[rng.random(stock.shape) < 0.03] = 0
+
+    cumulative = np.concatenate([np.zeros((carried.size, 1), dtype=int), np.cumsum(consumption, axis=1)], axis=1)
+    for m, report_date in enumerate(dates):
+        acc_12m = cumulative[:, m + 1] - cumulative[:, max(m - 11, 0)]
+        acc_4m = cumulative[:, m + 1] - cumulative[:, max(m - 3, 0)]
+        avg = acc_12m / min(m + 1, 12)
+        previous_stock = stock[:, m - 1] if m else stock[:, m]
+        for i, product_id in enumerate(carried):
+            cpma = round(float(avg[i]), 2)
+            yield [center_id, int(product_id), int(stock[i, m]), cpma, int(acc_4m[i]),
+                   int(consumption[i, m]), int(previous_stock[i]),
+                   status_indicator(int(stock[i, m]), cpma),
+                   round(float(base[i, 0]) * 0.95, 2), round(float(base[i, 0]) * 0.9, 2),
+                   round(float(base[i, 0]) * 0.85, 2), int(acc_12m[i]), report_date.isoformat()]
+
+
+def ensure_partitions_sql(manifest: dict) -> str:
+    """Crea las particiones mensuales del inventario (si la base de datos tiene la migración 005)."""
+    return ("DO $$ BEGIN IF to_regproc('ensure_inventory_partitions') IS NOT NULL THEN "
+            f"PERFORM ensure_inventory_partitions('{manifest['first_month']}', '{manifest['last_month']}'); "
+            "END IF; END $$;")
+
+
+def refresh_rollup_sql() -> str:
+    """Recalcula el resumen de consumo por región (si la base de datos tiene la migración 007)."""
+    return ("DO $$ BEGIN IF to_regproc('refresh_consumption_rollup') IS NOT NULL THEN "
+            "PERFORM refresh_consumption_rollup(); END IF; END $$;")
+
+
+def next_data_version_sql() -> str:
+    """Sube la versión de los datos una vez al final de la carga (si la base de datos tiene la migración 010)."""
+    return ("DO $$ BEGIN IF to_regproc('next_data_version') IS NOT NULL THEN "
+            "PERFORM next_data_version(); END IF; END $$;")
+
+
+def load_sql(manifest: dict, data_dir: str) -> str:
+    """Script de psql que carga los archivos de `data_dir` (con rutas absolutas: se puede ejecutar desde cualquier directorio)."""
+    lines = ["-- Generado por benchmarks/synthetic_data.py", "\\set ON_ERROR_STOP on", "BEGIN;",
+             "SET LOCAL medifinder.bulk_load = 'on';", ensure_partitions_sql(manifest)]
+    for table, columns in TABLES.items():
+        path = os.path.abspath(os.path.join(data_dir, manifest["files"][table])).replace("'", "''")
+        lines.append(f"\\copy {table} ({', '.join(columns)}) FROM '{path}' "
+                     "WITH (FORMAT csv, HEADER true)")
+    for table, column in SEQUENCES.items():
+        lines.append(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                     f"(SELECT COALESCE(MAX({column}), 1) FROM {table}));")
+    lines += [refresh_rollup_sql(), next_data_version_sql(), "COMMIT;", "ANALYZE;", ""]
+    return "\n".join(lines)
+
+
+def generate(out_dir: str, regions: int, centers: int, products: int, months: int,
+             density: float, seed: int, last_month: datetime.date) -> dict:
+    """Escribe los archivos en `out_dir` y devuelve el manifiesto."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dates = month_starts(last_month, months)
+    region_table = region_rows(regions)
+    tables = {
+        "regions": region_table,
+        "products": product_rows(products, rng),
+        "medical_centers": center_rows(centers, region_table, rng),
+    }
+    manifest = {
+        "seed": seed, "regions": regions, "centers": centers, "products": products, "months": months,
+        "density": density, "first_month": dates[0].isoformat(), "last_month": dates[-1].isoformat(),
+        "files": {table: f"{table}.csv" for table in TABLES}, "rows": {},
+    }
+    for table, rows in tables.items():
+        with open(os.path.join(out_dir, manifest["files"][table]), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(TABLES[table])
+            writer.writerows(rows)
+        manifest["rows"][table] = len(rows)
+
+    inventory_count = 0
+    with open(os.path.join(out_dir, manifest["files"]["inventory"]), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(TABLES["inventory"])
+        for center_id in range(1, centers + 1):
+            for row in inventory_rows(center_id, products, dates, density, seed):
+                writer.writerow(row)
+                inventory_count += 1
+    manifest["rows"]["inventory"] = inventory_count
+
+    with open(os.path.join(out_dir, "load.sql"), "w", encoding="utf-8") as f:
+        f.write(load_sql(manifest, out_dir))
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(args) -> int:
+    manifest = generate(args.out, args.regions, args.centers, args.products, args.months, args.density,
+                        args.seed, datetime.date.fromisoformat(args.last_month))
+    for table, count in manifest["rows"].items():
+        print(f"{table:<16}{count:>14,} filas")
+    print(f"Archivos en {os.path.abspath(args.out)} (cargar con load.sql)")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="Directorio de salida")
+    parser.add_argument("--regions", type=int, default=25)
+    parser.add_argument("--centers", type=int, default=500)
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--density", type=float, default=0.2,
+                        help="Fracción del catálogo que maneja cada centro (0-1)")
+    parser.add_argument("--last-month", default="2025-06-01", help="Primer día del último mes reportado")
+    parser.add_argument("--seed", type=int, default=42)
+    sys.exit(main(parser.parse_args()))
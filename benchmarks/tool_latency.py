@@ -0,0 +1,301 @@
+"""
+Benchmark de latencia de todas las herramientas de query_tools y analytics_tools.
+
+Opcionalmente carga un conjunto de datos de benchmarks.synthetic_data y después llama
+--iterations veces a cada herramienta con argumentos tomados de la propia base de datos
+(el medicamento con más centros con stock, su región principal, un centro que lo tiene...).
+Registra p50/p95/media de latencia y las filas devueltas, y escribe el resultado en JSON
+para compararlo con ejecuciones anteriores.
+
+Por defecto las cachés de respuestas, de búsqueda y de la proyección de stock se vacían antes de cada llamada, para
+medir las consultas; --warm las mantiene. Los catálogos en memoria se cargan una vez.
+
+Uso:
+    python -m benchmarks.synthetic_data --out /tmp/medifinder_synth --centers 2000 --products 1000
+    python -m benchmarks.tool_latency --load /tmp/medifinder_synth --truncate \
+        --iterations 20 --output bench_results.json
+    python -m benchmarks.tool_latency --output nuevo.json --baseline bench_results.json
+
+Con --baseline sale con código 1 si el p95 de alguna herramienta supera --max-regression
+veces el de la línea base.
+"""
+import argparse
+import asyncio
+import datetime
+import inspect
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from MediFinderCore import anomalies, answer_cache, async_db, catalog, db, forecast, metrics, search
+from MediFinderAgent.tools import analytics_tools, async_analytics_tools, async_query_tools, query_tools
+from benchmarks import synthetic_data
+
+# Herramientas sin consultas a la base de datos que no se miden.
+SKIPPED = {"send_notification_email": "simula el envío de un correo, no consulta la base de datos"}
+# Por debajo de este p95 (ms) las variaciones se consideran ruido al comparar con la línea base.
+NOISE_FLOOR_MS = 2.0
+
+
+def load_dataset(data_dir: str, truncate: bool) -> dict:
+    """Carga con COPY los archivos de synthetic_data en la base de datos configurada."""
+    with open(os.path.join(data_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            if truncate:
+                cur.execute("TRUNCATE regions, medical_centers, products, inventory RESTART IDENTITY CASCADE;")
+            cur.execute("SET LOCAL medifinder.bulk_load = 'on';")
+            cur.execute(synthetic_data.ensure_partitions_sql(manifest))
+            for table, columns in synthetic_data.TABLES.items():
+                with open(os.path.join(data_dir, manifest["files"][table]), encoding="utf-8") as f:
+                    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+            for table, column in synthetic_data.SEQUENCES.items():
+                cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                            f"(SELECT COALESCE(MAX({column}), 1) FROM {table}));")
+            cur.execute(synthetic_data.refresh_rollup_sql())
+            cur.execute(synthetic_data.next_data_version_sql())
+            cur.execute("ANALYZE;")
+            # Las anomalías de consumo (migración 008) se calculan sobre los datos recién cargados
+            cur.execute("SELECT to_regclass('consumption_anomalies') IS NOT NULL;")
+            has_anomalies = cur.fetchone()[0]
+    if has_anomalies:
+        anomalies.run()
+    catalog.invalidate()
+    return manifest
+
+
+def dataset_stats() -> dict:
+    """Tamaño del conjunto de datos (filas exactas de las tablas pequeñas, estimación del inventario)."""
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM regions) AS regions,
+                (SELECT COUNT(*) FROM medical_centers) AS centers,
+                (SELECT COUNT(*) FROM products) AS products,
+                (SELECT SUM(GREATEST(c.reltuples, 0))::bigint FROM pg_partition_tree('inventory') t
+                 JOIN pg_class c ON c.oid = t.relid) AS inventory_estimate,
+                (SELECT COUNT(*) FROM inventory_latest) AS inventory_latest;
+        """)
+        return dict(cur.fetchone())
+
+
+def sample_arguments() -> dict:
+    """Elige argumentos representativos: el medicamento con más centros con stock y su región principal."""
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT p.name AS medicine, r.name AS region, COUNT(*) AS centers
+            FROM inventory_latest il
+            JOIN products p ON p.product_id = il.product_id
+            JOIN medical_centers mc ON mc.center_id = il.center_id
+            JOIN regions r ON r.region_id = mc.region_id
+            WHERE il.current_stock > 0
+            GROUP BY p.name, r.name
+            ORDER BY centers DESC, p.name, r.name
+            LIMIT 1;
+        """)
+        top = cur.fetchone()
+        if top is None:
+            raise SystemExit("La base de datos no tiene inventario con stock; carga datos con --load.")
+        cur.execute("""
+            SELECT mc.name, mc.latitude, mc.longitude
+            FROM inventory_latest il
+            JOIN products p ON p.product_id = il.product_id
+            JOIN medical_centers mc ON mc.center_id = il.center_id
+            JOIN regions r ON r.region_id = mc.region_id
+            WHERE p.name = %s AND r.name = %s AND mc.latitude IS NOT NULL
+            ORDER BY mc.center_id
+            LIMIT 1;
+        """, (top["medicine"], top["region"]))
+        center = cur.fetchone()
+    return {
+        "medicine": top["medicine"], "ingredient": top["medicine"].split()[0], "region": top["region"],
+        "center": center["name"], "lat": center["latitude"], "lon": center["longitude"],
+    }
+
+
+def tool_cases(args: dict) -> dict:
+    """Llamadas a medir: nombre -> (módulo, función, argumentos posicionales, argumentos con nombre)."""
+    medicine, region = args["medicine"], args["region"]
+    return {
+        "find_medicine_details_by_name": ("query", "find_medicine_details_by_name", (args["ingredient"],), {}),
+        "find_centers_with_stock_by_medicine": ("query", "find_centers_with_stock_by_medicine", (medicine,), {}),
+        "find_centers_with_stock_by_medicine_region": (
+            "query", "find_centers_with_stock_by_medicine_region", (medicine, region), {}),
+        "find_nearest_centers_with_stock": (
+            "query", "find_nearest_centers_with_stock", (medicine, args["lat"], args["lon"]), {}),
+        "get_stock_details_for_medicine_at_center": (
+            "query", "get_stock_details_for_medicine_at_center", (medicine, args["center"]), {}),
+        "list_all_regions": ("query", "list_all_regions", (), {}),
+        "search_medicines_by_name": ("query", "search_medicines_by_name", (args["ingredient"],), {}),
+        "generate_low_stock_report": ("analytics", "generate_low_stock_report", (region,), {}),
+        "generate_low_stock_reports": ("analytics", "generate_low_stock_reports", (["all"],), {}),
+        "get_national_low_stock_overview": ("analytics", "get_national_low_stock_overview", (), {}),
+        "get_consumption_trends": ("analytics", "get_consumption_trends", (medicine, region), {}),
+        "get_consumption_trends[raw]": ("analytics", "get_consumption_trends", (medicine, region), {"mode": "raw"}),
+        "find_most_consumed_medicine_by_region": ("analytics", "find_most_consumed_medicine_by_region", (region,), {}),
+        "find_top_consuming_region_for_medicine": (
+            "analytics", "find_top_consuming_region_for_medicine", (medicine,), {}),
+        "forecast_stockouts": ("analytics", "forecast_stockouts", (region,), {}),
+        "suggest_stock_transfers": ("analytics", "suggest_stock_transfers", (region,), {}),
+        "get_consumption_anomalies": ("analytics", "get_consumption_anomalies", (), {"min_severity": 1}),
+    }
+
+
+def uncovered_tools(cases: dict) -> list:
+    """Funciones públicas de los módulos de herramientas que no se miden ni se omiten a propósito."""
+    covered = {function for _, function, _, _ in cases.values()} | set(SKIPPED)
+    public = [name for module in (query_tools, analytics_tools)
+              for name, value in inspect.getmembers(module, inspect.isfunction)
+              if not name.startswith("_") and value.__module__ == module.__name__]
+    return sorted(set(public) - covered)
+
+
+def clear_caches():
+    answer_cache.answers.clear()
+    search.medicines.clear()
+    forecast.invalidate()
+
+
+def summarize(latencies: list, result: dict) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))] * 1000, 3),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "rows": metrics.result_rows(result),
+        "status": result.get("status"),
+    }
+
+
+SYNC_MODULES = {"query": query_tools, "analytics": analytics_tools}
+ASYNC_MODULES = {"query": async_query_tools, "analytics": async_analytics_tools}
+
+
+def measure_case(case: tuple, iterations: int, warm: bool) -> dict:
+    """Mide una llamada de `tool_cases` con las herramientas síncronas."""
+    module, function, args, kwargs = case
+    tool = getattr(SYNC_MODULES[module], function)
+    tool(*args, **kwargs)  # Calentamiento (catálogos, planes, conexiones)
+    latencies = []
+    for _ in range(iterations):
+        if not warm:
+            clear_caches()
+        start = time.perf_counter()
+        result = tool(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, result)
+
+
+async def ameasure_case(case: tuple, iterations: int, warm: bool) -> dict:
+    """Mide una llamada de `tool_cases` con las herramientas asíncronas."""
+    module, function, args, kwargs = case
+    tool = getattr(ASYNC_MODULES[module], function)
+    await tool(*args, **kwargs)
+    latencies = []
+    for _ in range(iterations):
+        if not warm:
+            clear_caches()
+        start = time.perf_counter()
+        result = await tool(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, result)
+
+
+def run_sync(cases: dict, iterations: int, warm: bool) -> dict:
+    return {label: measure_case(case, iterations, warm) for label, case in cases.items()}
+
+
+async def run_async(cases: dict, iterations: int, warm: bool) -> dict:
+    results = {label: await ameasure_case(case, iterations, warm) for label, case in cases.items()}
+    await async_db.close_pool()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """Herramientas cuyo p95 empeoró más de `max_regression` veces respecto a la línea base."""
+    regressions = []
+    for label, current in results.items():
+        before = baseline.get("results", {}).get(label)
+        if not before:
+            continue
+        ratio = current["p95_ms"] / before["p95_ms"] if before["p95_ms"] else float("inf")
+        print(f"  {label:<46} p95 {before['p95_ms']:9.2f} -> {current['p95_ms']:9.2f} ms ({ratio:5.2f}x)")
+        if ratio > max_regression and current["p95_ms"] > NOISE_FLOOR_MS:
+            regressions.append(label)
+    return regressions
+
+
+def build_report(results: dict, mode: str, iterations: int, warm: bool, manifest, sample: dict) -> dict:
+    """Contenido del JSON de resultados (el mismo formato que lee --baseline)."""
+    return {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "mode": mode,
+        "iterations": iterations,
+        "warm_caches": warm,
+        "dataset": {"stats": dataset_stats(), "manifest": manifest},
+        "arguments": sample,
+        "skipped": SKIPPED,
+        "results": results,
+    }
+
+
+def main(args) -> int:
+    manifest = load_dataset(args.load, args.truncate) if args.load else None
+    catalog.invalidate()
+    sample = sample_arguments()
+    cases = tool_cases(sample)
+    for name in uncovered_tools(cases):
+        print(f"AVISO: la herramienta '{name}' no tiene caso de benchmark.")
+
+    if args.mode == "async":
+        results = asyncio.run(run_async(cases, args.iterations, args.warm))
+    else:
+        results = run_sync(cases, args.iterations, args.warm)
+
+    report = build_report(results, args.mode, args.iterations, args.warm, manifest, sample)
+    db.close_pool()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+
+    print(f"{'herramienta':<46}{'p50 ms':>10}{'p95 ms':>10}{'filas':>9}  estado")
+    for label, row in results.items():
+        print(f"{label:<46}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['rows']:>9}  {row['status']}")
+    print(f"Resultados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparación con {args.baseline} ({baseline.get('git_commit')}):")
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"FALLO: p95 más de {args.max_regression}x peor en: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--load", help="Directorio generado por benchmarks.synthetic_data a cargar antes de medir")
+    parser.add_argument("--truncate", action="store_true", help="Vaciar las tablas antes de cargar")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--warm", action="store_true", help="No vaciar las cachés entre llamadas")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--max-regression", type=float, default=1.5)
+    sys.exit(main(parser.parse_args()))
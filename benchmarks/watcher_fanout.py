@@ -0,0 +1,138 @@
+"""
+Benchmark del barrido nacional de MediFinderWatcher: regiones una por una vs en paralelo.
+
+Usa un modelo simulado (sin llamadas a Gemini ni a la base de datos) que tarda
+--latency-ms en cada turno, y ejecuta el MasterOrchestratorAgent real con distintos
+valores de 'region_concurrency'. Además de medir el tiempo, comprueba que:
+  - los eventos de cada región salen juntos y en el orden de la lista de regiones;
+  - cada región ve su propia 'current_region' (el estado no se pisa entre regiones).
+
+Uso:
+    python -m benchmarks.watcher_fanout --regions 25 --latency-ms 100 --concurrency 5
+
+Sale con código 1 si alguna comprobación falla o si la aceleración es menor que --min-speedup.
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from typing import AsyncGenerator
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from MediFinderWatcher import agent as watcher
+
+REGION_RE = re.compile(r"'current_region'\) es: (.+)")
+
+
+class StubLlm(BaseLlm):
+    """Modelo simulado: espera `latency` segundos y responde según la instrucción del agente."""
+    model: str = "stub"
+    latency: float = 0.1
+    regions: list = []
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.latency)
+        instruction = str(llm_request.config.system_instruction or "")
+        if "list_all_regions" in instruction:
+            text = json.dumps({"status": "success", "regions": self.regions})
+        else:
+            match = REGION_RE.search(instruction)
+            text = f"Análisis de {match.group(1).strip() if match else '?'}"
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=0, candidates_token_count=0, total_token_count=0),
+        )
+
+
+def build_orchestrator(model: BaseLlm, concurrency: int) -> watcher.MasterOrchestratorAgent:
+    return watcher.root_agent.clone(update={
+        "region_concurrency": concurrency,
+        # Sin pre-filtro ni modo incremental: todas las regiones pasan por los LLM y no se
+        # consulta la base de datos.
+        "prefilter_regions": False,
+        "incremental": False,
+        "sub_agents": [
+            sub_agent.clone(update={"model": model}) for sub_agent in watcher.root_agent.sub_agents
+        ],
+    })
+
+
+async def run_sweep(model: StubLlm, concurrency: int):
+    """Ejecuta un barrido completo y devuelve (segundos, lista de (región, texto) por evento)."""
+    orchestrator = build_orchestrator(model, concurrency)
+    session_service = InMemorySessionService()
+    runner = Runner(agent=orchestrator, app_name="watcher_bench", session_service=session_service)
+    session = await session_service.create_session(app_name="watcher_bench", user_id="bench")
+
+    seen = []
+    start = time.perf_counter()
+    async for event in runner.run_async(
+        user_id="bench", session_id=session.id,
+        new_message=types.Content(role="user", parts=[types.Part(text="Iniciar barrido")]),
+    ):
+        branch_region = (event.branch or "").rsplit(".", 1)[-1] if event.branch else None
+        text = "".join(part.text or "" for part in (event.content.parts if event.content else []))
+        seen.append((branch_region, event.author, text))
+    return time.perf_counter() - start, seen
+
+
+def check_events(regions: list, seen: list) -> list:
+    """Devuelve la lista de problemas encontrados en el orden y aislamiento de los eventos."""
+    problems = []
+    region_order = []
+    for branch_region, author, text in seen:
+        if branch_region not in regions:
+            continue
+        if not region_order or region_order[-1] != branch_region:
+            region_order.append(branch_region)
+        if author != watcher.root_agent.name and text \
+                and not text.endswith(branch_region):
+            problems.append(f"{branch_region}: el agente {author} vio otra región ({text!r})")
+    if region_order != regions:
+        problems.append(f"orden de regiones inesperado: {region_order}")
+    return problems
+
+
+async def main(args) -> int:
+    regions = [f"REGION_{i:02d}" for i in range(1, args.regions + 1)]
+    model = StubLlm(latency=args.latency_ms / 1000, regions=regions)
+
+    # Calentamiento: la primera ejecución paga importaciones y la creación de objetos de ADK.
+    await run_sweep(model.model_copy(update={"latency": 0}), args.concurrency)
+    sequential, seen_seq = await run_sweep(model, 1)
+    parallel, seen_par = await run_sweep(model, args.concurrency)
+    problems = check_events(regions, seen_seq) + check_events(regions, seen_par)
+    speedup = sequential / parallel
+
+    print(f"Regiones:                  {args.regions}")
+    print(f"Latencia por turno:        {args.latency_ms:.0f} ms")
+    print(f"Una por una:               {sequential:.3f} s")
+    print(f"En paralelo (máx. {args.concurrency:>2}):     {parallel:.3f} s")
+    print(f"Aceleración:               {speedup:.1f}x")
+
+    for problem in problems:
+        print(f"FALLO: {problem}")
+    if speedup < args.min_speedup:
+        print(f"FALLO: la aceleración ({speedup:.1f}x) es menor que {args.min_speedup}x.")
+        return 1
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--regions", type=int, default=25)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--min-speedup", type=float, default=2.0)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,7 +1,9 @@
 import requests
 import json
 import uuid
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, render_template_string, request, jsonify, stream_with_context
+
+from MediFinderCore import metrics
 
 # --- Configuración ---
 ADK_API_URL = "http://localhost:8000"
@@ -241,24 +243,103 @@ def index():
                 userInput.value = '';
                 typingIndicator.style.display = 'flex';
 
-                fetch('/chat', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    // Envía el mensaje con el prefijo al backend.
-                    body: JSON.stringify({ message: prefixedMessage })
-                })
-                .then(response => response.json())
-                .then(data => {
-                    typingIndicator.style.display = 'none';
-                    appendMessage(data.response, 'bot', data.tool_calls);
-                })
-                .catch(error => {
+                // Envía el mensaje con el prefijo al backend y muestra los eventos a medida que llegan.
+                streamMessage(prefixedMessage).catch(error => {
                     typingIndicator.style.display = 'none';
                     appendMessage('Lo siento, ocurrió un error al contactar al agente.', 'bot');
                     console.error('Error:', error);
                 });
             }
 
+            async function streamMessage(prefixedMessage) {
+                const response = await fetch('/chat/stream', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ message: prefixedMessage })
+                });
+                if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+                let botMessage = null;
+                let streamedText = '';
+                let finalReceived = false;
+                const getBotMessage = () => {
+                    if (!botMessage) {
+                        typingIndicator.style.display = 'none';
+                        botMessage = createBotMessage();
+                    }
+                    return botMessage;
+                };
+                const handleEvent = (data) => {
+                    if (data.type === 'tool') {
+                        getBotMessage().addToolCall(data.html);
+                    } else if (data.type === 'text_delta') {
+                        // Fragmento parcial: se acumula hasta que llegue el texto completo del turno.
+                        if (finalReceived) { streamedText = ''; finalReceived = false; }
+                        streamedText += data.text;
+                        getBotMessage().setText(streamedText);
+                    } else if (data.type === 'text') {
+                        streamedText = '';
+                        finalReceived = true;
+                        getBotMessage().setText(data.text);
+                    } else if (data.type === 'error') {
+                        getBotMessage().setText(data.text);
+                    } else if (data.type === 'done' && !botMessage) {
+                        getBotMessage().setText('No he podido procesar tu solicitud. Inténtalo de nuevo.');
+                    }
+                };
+
+                // Lee la respuesta como server-sent events: bloques "data: <json>" separados por una línea en blanco.
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let separator;
+                    while ((separator = buffer.indexOf('\\n\\n')) !== -1) {
+                        const frame = buffer.slice(0, separator);
+                        buffer = buffer.slice(separator + 2);
+                        const data = frame.split('\\n')
+                            .filter(line => line.startsWith('data:'))
+                            .map(line => line.slice(5).trim())
+                            .join('\\n');
+                        if (data) handleEvent(JSON.parse(data));
+                    }
+                }
+                typingIndicator.style.display = 'none';
+            }
+
+            function createBotMessage() {
+                const messageWrapper = document.createElement('div');
+                messageWrapper.className = 'message bot-message';
+
+                const messageContent = document.createElement('div');
+                messageContent.className = 'message-content';
+                messageContent.textContent = '...';
+                messageWrapper.appendChild(messageContent);
+
+                const toolCalls = [];
+                const toolDiv = document.createElement('div');
+                toolDiv.className = 'tool-call';
+
+                chatBox.appendChild(messageWrapper);
+                chatBox.scrollTop = chatBox.scrollHeight;
+
+                return {
+                    setText(text) {
+                        messageContent.textContent = text;
+                        chatBox.scrollTop = chatBox.scrollHeight;
+                    },
+                    addToolCall(html) {
+                        toolCalls.push(html);
+                        toolDiv.innerHTML = '<strong>Análisis del Agente:</strong><br><br>' + toolCalls.join('<br><hr><br>');
+                        if (!toolDiv.parentNode) messageWrapper.appendChild(toolDiv);
+                        chatBox.scrollTop = chatBox.scrollHeight;
+                    }
+                };
+            }
+
             function appendMessage(text, sender, toolCalls = []) {
                 const messageWrapper = document.createElement('div');
                 messageWrapper.className = 'message ' + (sender === 'user' ? 'user-message' : 'bot-message');
@@ -283,21 +364,35 @@ def index():
     </html>
     """)
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    """Maneja la lógica de la conversación con la API del ADK."""
-    # Recibe el mensaje ya prefijado desde el frontend.
-    user_message_with_prefix = request.json['message']
-    
-    payload = {
+def build_run_payload(user_message_with_prefix, streaming=False):
+    """Arma el cuerpo de la petición para /run y /run_sse del ADK."""
+    return {
         "app_name": APP_NAME,
         "user_id": USER_ID,
         "session_id": SESSION_ID,
         "new_message": {
             "role": "user",
             "parts": [{"text": user_message_with_prefix}]
-        }
+        },
+        "streaming": streaming
     }
+
+def format_tool_call(call):
+    return f"<b>Paso 1: Decido usar una herramienta</b><br>🤖 Herramienta: <code>{call['name']}</code><br>📋 Argumentos: <code>{json.dumps(call['args'])}</code>"
+
+def format_tool_response(resp):
+    response_data = json.dumps(resp.get('response', {}), ensure_ascii=False)
+    if len(response_data) > 350:
+        response_data = response_data[:350] + '...'
+    return f"<b>Paso 2: Analizo el resultado de la herramienta</b><br>🔍 Resultado: <code>{response_data}</code>"
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    """Maneja la lógica de la conversación con la API del ADK."""
+    # Recibe el mensaje ya prefijado desde el frontend.
+    user_message_with_prefix = request.json['message']
+    
+    payload = build_run_payload(user_message_with_prefix)
     
     run_url = f"{ADK_API_URL}/run"
     headers = {"Content-Type": "application/json"}
@@ -316,15 +411,10 @@ def chat():
             parts = content.get('parts', [{}])
             
             if 'functionCall' in parts[0]:
-                call = parts[0]['functionCall']
-                tool_calls_info.append(f"<b>Paso 1: Decido usar una herramienta</b><br>🤖 Herramienta: <code>{call['name']}</code><br>📋 Argumentos: <code>{json.dumps(call['args'])}</code>")
+                tool_calls_info.append(format_tool_call(parts[0]['functionCall']))
             
             if 'functionResponse' in parts[0]:
-                resp = parts[0]['functionResponse']
-                response_data = json.dumps(resp.get('response', {}), ensure_ascii=False)
-                if len(response_data) > 350:
-                    response_data = response_data[:350] + '...'
-                tool_calls_info.append(f"<b>Paso 2: Analizo el resultado de la herramienta</b><br>🔍 Resultado: <code>{response_data}</code>")
+                tool_calls_info.append(format_tool_response(parts[0]['functionResponse']))
 
             if 'text' in parts[0] and content.get('role') == 'model':
                 final_response = parts[0]['text']
@@ -335,6 +425,75 @@ def chat():
         print(f"Error al llamar a la API del ADK: {e}")
         return jsonify({'response': f"Error al contactar al agente: {e}", 'tool_calls': []}), 500
 
+def sse_message(data):
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_messages_for_event(event):
+    """Traduce un evento del ADK a los mensajes que la página sabe mostrar."""
+    if 'error' in event:
+        yield {"type": "error", "text": f"Error del agente: {event['error']}"}
+        return
+    content = event.get('content') or {}
+    for part in content.get('parts', []):
+        if 'functionCall' in part:
+            yield {"type": "tool", "html": format_tool_call(part['functionCall'])}
+        elif 'functionResponse' in part:
+            yield {"type": "tool", "html": format_tool_response(part['functionResponse'])}
+        elif part.get('text') and content.get('role') == 'model' and not part.get('thought'):
+            # Los eventos parciales traen fragmentos; el evento final del turno trae el texto completo.
+            yield {"type": "text_delta" if event.get('partial') else "text", "text": part['text']}
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Igual que /chat, pero usa /run_sse del ADK y reenvía al navegador cada llamada a herramienta
+    y cada fragmento de texto en cuanto llegan, como server-sent events.
+    """
+    payload = build_run_payload(request.json['message'], streaming=True)
+
+    def generate():
+        disconnected = False
+        try:
+            with requests.post(f"{ADK_API_URL}/run_sse", json=payload, stream=True) as response:
+                response.raise_for_status()
+                # chunk_size=None entrega cada bloque en cuanto llega, sin esperar a llenar un búfer.
+                for line in response.iter_lines(chunk_size=None):
+                    if not line.startswith(b"data:"):
+                        continue
+                    try:
+                        messages = list(stream_messages_for_event(json.loads(line[5:].decode("utf-8"))))
+                    except (ValueError, TypeError, AttributeError, KeyError) as e:
+                        # Un evento mal formado o con una forma inesperada no corta la respuesta: se omite.
+                        print(f"Evento del ADK omitido ({type(e).__name__}: {e}): {line[:200]!r}")
+                        continue
+                    for message in messages:
+                        yield sse_message(message)
+        except GeneratorExit:
+            disconnected = True  # El navegador cerró la conexión: ya no se puede enviar nada
+            raise
+        except requests.exceptions.RequestException as e:
+            print(f"Error al llamar a la API del ADK: {e}")
+            yield sse_message({"type": "error", "text": f"Error al contactar al agente: {e}"})
+        except Exception as e:
+            print(f"Error al reenviar la respuesta del ADK: {e}")
+            yield sse_message({"type": "error", "text": f"Error al procesar la respuesta del agente: {e}"})
+        finally:
+            # 'done' cierra siempre la respuesta; si no llegó ningún mensaje, la página muestra un aviso.
+            if not disconnected:
+                yield sse_message({"type": "done"})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Métricas de las herramientas en formato Prometheus. Las herramientas corren en el proceso de
+    'adk api_server' (y del Watcher); con TOOL_METRICS_DIR apuntando al mismo directorio en todos
+    los procesos, aquí se suman las de todos.
+    """
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == '__main__':
     if create_adk_session():
         app.run(debug=True, port=5000)
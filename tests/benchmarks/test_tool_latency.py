@@ -0,0 +1,83 @@
+"""
+Benchmark de latencia de cada herramienta de query_tools y analytics_tools, como pruebas.
+
+Usa los casos y las mediciones de benchmarks/tool_latency.py: cada herramienta es una prueba
+que falla si devuelve un error o, con --bench-baseline, si su p95 empeora más de
+--bench-max-regression veces. La fixture de sesión carga el conjunto sintético con semilla fija
+(salvo --bench-existing-data) y al terminar escribe los resultados en --bench-output, con el
+mismo formato que `python -m benchmarks.tool_latency` (sirve de línea base para ambos).
+"""
+import asyncio
+import datetime
+import json
+
+import pytest
+
+from benchmarks import synthetic_data, tool_latency
+from MediFinderCore import async_db, catalog, db
+
+# Conjunto sintético que se carga antes de medir (el mismo con cada ejecución).
+DATASET = {"regions": 25, "centers": 300, "products": 200, "months": 12, "density": 0.2, "seed": 42,
+           "last_month": "2025-06-01"}
+# Las etiquetas de los casos no dependen de los argumentos, que se eligen con los datos ya cargados.
+PLACEHOLDER_ARGS = dict.fromkeys(("medicine", "ingredient", "region", "center", "lat", "lon"))
+CASE_LABELS = list(tool_latency.tool_cases(PLACEHOLDER_ARGS))
+
+
+@pytest.fixture(scope="session")
+def bench(request, tmp_path_factory):
+    """Carga los datos, elige los argumentos de los casos y escribe el JSON al terminar la sesión."""
+    config = request.config
+    manifest = None
+    if not config.getoption("--bench-existing-data"):
+        data_dir = str(tmp_path_factory.mktemp("medifinder_synth"))
+        params = dict(DATASET, last_month=datetime.date.fromisoformat(DATASET["last_month"]))
+        synthetic_data.generate(data_dir, **params)
+        manifest = tool_latency.load_dataset(data_dir, truncate=True)
+    catalog.invalidate()
+    sample = tool_latency.sample_arguments()
+    state = {"cases": tool_latency.tool_cases(sample), "results": {},
+             "iterations": config.getoption("--bench-iterations"), "mode": config.getoption("--bench-mode")}
+    yield state
+
+    report = tool_latency.build_report(state["results"], state["mode"], state["iterations"], False,
+                                       manifest, sample)
+    db.close_pool()
+    with open(config.getoption("--bench-output"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+
+
+@pytest.fixture(scope="session")
+def baseline(request):
+    path = request.config.getoption("--bench-baseline")
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_every_tool_has_a_case():
+    assert tool_latency.uncovered_tools(tool_latency.tool_cases(PLACEHOLDER_ARGS)) == []
+
+
+@pytest.mark.database
+@pytest.mark.benchmark
+@pytest.mark.parametrize("label", CASE_LABELS)
+def test_tool_latency(bench, baseline, request, label):
+    case = bench["cases"][label]
+    if bench["mode"] == "async":
+        async def measure():
+            try:
+                return await tool_latency.ameasure_case(case, bench["iterations"], warm=False)
+            finally:
+                await async_db.close_pool()
+        result = asyncio.run(measure())
+    else:
+        result = tool_latency.measure_case(case, bench["iterations"], warm=False)
+    bench["results"][label] = result
+
+    assert result["status"] != "error", f"{label} devolvió un error"
+    if baseline is not None:
+        max_regression = request.config.getoption("--bench-max-regression")
+        assert tool_latency.compare({label: result}, baseline, max_regression) == [], (
+            f"{label}: p95 {result['p95_ms']} ms, más de {max_regression}x la línea base")
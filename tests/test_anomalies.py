@@ -0,0 +1,81 @@
+"""z robusto de consumos anómalos (MediFinderCore.anomalies)."""
+import math
+
+import numpy as np
+import pytest
+
+from MediFinderCore import anomalies
+
+NAN = float("nan")
+
+
+def expected_z(log_ratio: np.ndarray, position: int) -> float:
+    median = np.median(log_ratio)
+    mad = np.median(np.abs(log_ratio - median))
+    return (log_ratio[position] - median) / max(anomalies.MAD_SCALE * mad, anomalies.MIN_LOG_SPREAD)
+
+
+def noisy_product(rows: int, seed: int) -> tuple:
+    """Consumos de un producto que varían como mucho un 20 % frente a una línea base de 100."""
+    rng = np.random.default_rng(seed)
+    last_month = np.round(100 * rng.uniform(0.8, 1.2, rows))
+    return last_month, np.full((rows, 4), 100.0)
+
+
+def test_robust_z_against_the_product_median_and_mad():
+    last_month, history = noisy_product(30, seed=1)
+    last_month[0] = 400
+    result = anomalies.score(last_month, history, np.ones(30))
+    log_ratio = np.log1p(last_month) - np.log1p(100)
+    assert result["robust_z"] == pytest.approx([expected_z(log_ratio, i) for i in range(30)])
+    assert result["ratio"][0] == 4 and result["baseline"][0] == 100
+    assert result["severity"][0] == sum(abs(result["robust_z"][0]) >= z for z in anomalies.Z_THRESHOLDS) > 0
+    assert (result["severity"][1:] == 0).all()
+
+
+def test_each_product_uses_its_own_spread():
+    # El mismo +50 % es normal en un producto muy variable y anómalo en uno estable
+    stable = np.full(25, 100.0)
+    volatile = np.round(100 * np.random.default_rng(3).uniform(0.3, 3.0, 25))
+    last_month = np.concatenate([[150.0], stable[1:], [150.0], volatile[1:]])
+    history = np.full((50, 4), 100.0)
+    result = anomalies.score(last_month, history, np.repeat([1, 2], 25))
+    assert result["severity"][0] > 0
+    assert result["severity"][25] == 0
+
+
+def test_small_products_fall_back_to_the_national_distribution():
+    big, big_history = noisy_product(40, seed=4)
+    last_month = np.concatenate([big, [100.0, 100.0, 300.0]])
+    history = np.vstack([big_history, np.full((3, 4), 100.0)])
+    result = anomalies.score(last_month, history, np.r_[np.ones(40), [2, 2, 2]])
+    log_ratio = np.log1p(last_month) - np.log1p(100)
+    assert result["robust_z"][42] == pytest.approx(expected_z(log_ratio, 42))
+    assert result["severity"][42] > 0
+
+
+def test_baseline_is_the_median_of_the_available_history():
+    result = anomalies.score([10, 10, 10], [[40, 10, NAN, 20], [NAN, NAN, NAN, NAN], [0, 0, NAN, 0]], [1, 1, 1])
+    assert result["baseline"][0] == 20
+    assert math.isnan(result["baseline"][1]) and math.isnan(result["robust_z"][1])
+    assert result["severity"][1] == 0
+    assert math.isnan(result["ratio"][2])   # línea base 0: sin razón, pero sí z
+
+
+def test_small_ratio_changes_are_not_anomalies():
+    # Todas iguales (MAD 0): un +20 % ya pasa el primer umbral de z, pero no llega a MIN_RATIO_CHANGE
+    last_month = np.r_[[120.0], np.full(29, 100.0)]
+    result = anomalies.score(last_month, np.full((30, 4), 100.0), np.ones(30))
+    assert abs(result["robust_z"][0]) >= anomalies.Z_THRESHOLDS[0]
+    assert result["severity"][0] == 0
+
+
+def test_detect_reads_the_copy_csv():
+    day = 20240  # 2025-06-01
+    lines = [f"{center},7,3,{day},100,100,100,nan,100" for center in range(1, 30)]
+    lines += [f"30,7,nan,{day},5,100,100,100,100", f"31,7,3,{day},400,100,nan,nan,100"]
+    found = anomalies.detect(anomalies.parse_snapshot("\n".join(lines) + "\n"))
+    assert [(a["center_id"], a["direction"], a["region_id"]) for a in found] == [(30, "baja", None), (31, "alza", 3)]
+    assert found[0]["report_date"] == "2025-06-01"
+    assert found[1]["ratio"] == 4.0 and found[1]["last_month_consumption"] == 400
+    assert anomalies.detect(anomalies.parse_snapshot("")) == []
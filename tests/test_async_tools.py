@@ -0,0 +1,64 @@
+"""Herramientas asíncronas: mismos resultados que las síncronas y sin bloquear el event loop."""
+import asyncio
+
+import pytest
+
+from benchmarks import async_concurrency
+from MediFinderCore import async_db, db
+from MediFinderAgent.tools import async_query_tools, query_tools
+
+pytestmark = pytest.mark.database
+
+SESSIONS = 10
+LATENCY = 0.2
+
+
+@pytest.fixture(scope="module")
+def medicine_region():
+    """Un medicamento con stock en alguna región, para que las herramientas devuelvan filas."""
+    with db.get_cursor() as cur:
+        cur.execute("""
+            SELECT p.name AS medicine, r.name AS region
+            FROM inventory_latest il
+            JOIN products p ON il.product_id = p.product_id
+            JOIN medical_centers mc ON il.center_id = mc.center_id
+            JOIN regions r ON mc.region_id = r.region_id
+            WHERE il.current_stock > 0
+            LIMIT 1;
+        """)
+        row = cur.fetchone()
+    if row is None:
+        pytest.skip("la base de datos no tiene inventario con stock")
+    return row["medicine"], row["region"]
+
+
+def test_async_tool_matches_sync(medicine_region):
+    medicine, region = medicine_region
+
+    async def call():
+        try:
+            return await async_query_tools.find_centers_with_stock_by_medicine_region(medicine, region)
+        finally:
+            await async_db.close_pool()
+
+    expected = query_tools.find_centers_with_stock_by_medicine_region(medicine, region)
+    assert expected["status"] == "success"
+    assert asyncio.run(call()) == expected
+
+
+def test_async_sessions_run_concurrently(medicine_region):
+    medicine, region = medicine_region
+
+    async def measure():
+        try:
+            # Calentamiento: abre el pool para no medir el establecimiento de conexiones.
+            await async_concurrency.async_session(medicine, region, 0)
+            single = await async_concurrency.run_async_sessions(1, medicine, region, LATENCY)
+            total = await async_concurrency.run_async_sessions(SESSIONS, medicine, region, LATENCY)
+            return single, total
+        finally:
+            await async_db.close_pool()
+
+    single, total = asyncio.run(measure())
+    # En serie serían SESSIONS veces una sesión; en paralelo, cerca de una sola.
+    assert total < 2 * single, f"{SESSIONS} sesiones tardaron {total:.3f} s y una sola {single:.3f} s"
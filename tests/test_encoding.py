@@ -0,0 +1,49 @@
+"""Codificación columnar de los resultados de herramientas (MediFinderCore.encoding)."""
+import random
+
+from benchmarks import result_encoding
+from MediFinderCore import encoding
+
+
+def test_round_trip_without_budget_limit():
+    rows = result_encoding.centers_rows(20, random.Random(1))
+    table = encoding.encode_rows(rows, token_budget=10**9)
+    assert table["columns"] == list(rows[0])
+    assert table["total_rows"] == 20 and table["omitted_rows"] == 0
+    assert encoding.decode_rows(table) == rows
+
+
+def test_budget_keeps_leading_rows_and_exact_summary():
+    rows = result_encoding.centers_rows(500, random.Random(2))
+    table = encoding.encode_rows(rows, token_budget=1500)
+    kept = len(table["rows"])
+    assert 0 < kept < 500
+    assert table["omitted_rows"] == 500 - kept
+    assert encoding.decode_rows(table) == rows[:kept]
+    assert encoding.estimate_tokens({"columns": table["columns"], "rows": table["rows"],
+                                     "summary": table["summary"]}) <= 1500 + kept
+    # El resumen cubre todas las filas, también las omitidas
+    summary = table["summary"]
+    assert summary["count"] == 500
+    assert summary["current_stock"]["total"] == sum(row["current_stock"] for row in rows)
+    assert sum(summary["status_indicator_counts"].values()) == 500
+
+
+def test_at_least_one_row_even_over_budget():
+    rows = [{"center_name": "X" * 1000, "current_stock": 1}]
+    table = encoding.encode_rows(rows, token_budget=10)
+    assert table["rows"] == [["X" * 1000, 1]] and table["omitted_rows"] == 0
+
+
+def test_summary_skips_ids_and_coordinates():
+    rows = [{"center_id": 1, "latitude": -12.0, "current_stock": 5},
+            {"center_id": 2, "latitude": -13.0, "current_stock": 7}]
+    summary = encoding.encode_rows(rows)["summary"]
+    assert "center_id" not in summary and "latitude" not in summary
+    assert summary["current_stock"] == {"total": 12, "min": 5, "max": 7}
+
+
+def test_empty_rows():
+    table = encoding.encode_rows([])
+    assert table["columns"] == [] and table["rows"] == []
+    assert table["total_rows"] == 0 and table["summary"] == {"count": 0}
@@ -0,0 +1,100 @@
+"""Proyección vectorizada de quiebres de stock (MediFinderCore.forecast)."""
+import datetime
+import math
+
+import numpy as np
+import pytest
+
+from benchmarks import stockout_forecast
+from MediFinderCore import forecast
+
+
+def daily(monthly: float) -> float:
+    return monthly * 12 / forecast.DAYS_PER_YEAR
+
+
+def test_days_of_supply_without_trend():
+    days = forecast.days_of_supply([300.0], [30.0], [1.0])
+    assert days[0] == pytest.approx(300 / daily(30))
+
+
+def test_days_of_supply_with_growing_consumption_uses_up_the_stock():
+    stock, monthly, growth = 300.0, 30.0, 1.5
+    days = forecast.days_of_supply([stock], [monthly], [growth])[0]
+    rate = math.log(growth) / forecast.DAYS_PER_YEAR
+    # Consumo acumulado con crecimiento continuo hasta ese día: tiene que ser el stock
+    assert daily(monthly) * (math.exp(rate * days) - 1) / rate == pytest.approx(stock)
+    assert days < stock / daily(monthly)
+
+
+def test_days_of_supply_when_shrinking_consumption_never_runs_out():
+    # Con consumo que se reduce a la mitad cada año, lo consumido nunca pasa de daily / |rate|
+    rate = math.log(0.5) / forecast.DAYS_PER_YEAR
+    stock = 2 * daily(30) / abs(rate)
+    assert forecast.days_of_supply([stock], [30.0], [0.5])[0] == math.inf
+
+
+@pytest.mark.parametrize("stock,monthly,expected", [
+    (0.0, 30.0, 0.0),
+    (-5.0, 30.0, 0.0),
+    (100.0, 0.0, math.inf),
+    (100.0, float("nan"), math.inf),
+])
+def test_days_of_supply_edge_cases(stock, monthly, expected):
+    assert forecast.days_of_supply([stock], [monthly], [1.0])[0] == expected
+
+
+def test_monthly_consumption_blends_and_falls_back():
+    nan = float("nan")
+    rates = forecast.monthly_consumption([100.0, nan, 100.0, nan], [50.0, 50.0, nan, nan])
+    weight = forecast.RECENT_WEIGHT
+    assert rates[0] == pytest.approx((1 - weight) * 100 + weight * 50)
+    assert rates[1] == 50 and rates[2] == 100
+    assert math.isnan(rates[3])
+
+
+def test_annual_growth_fits_the_cpma_history():
+    nan = float("nan")
+    growth = forecast.annual_growth(
+        cpma=[100 * 1.2 ** 3, 100.0, 100.0, 100.0],
+        cpma_12=[100 * 1.2 ** 2, nan, 10.0, 0.0],
+        cpma_24=[100 * 1.2, nan, 1.0, 0.0],
+        cpma_36=[100.0, nan, 0.1, nan],
+    )
+    assert growth[0] == pytest.approx(1.2)
+    assert growth[1] == 1.0                            # un solo CPMA: sin tendencia
+    assert growth[2] == forecast.MAX_ANNUAL_GROWTH     # x10 por año, acotado
+    assert growth[3] == 1.0                            # CPMA históricos en cero no cuentan
+
+
+def test_vectorized_matches_row_by_row_reference():
+    matrix = forecast.parse_snapshot(stockout_forecast.synthetic_snapshot(2000, seed=3))
+    vectorized = forecast.StockForecast(matrix).days_of_supply
+    expected = np.array([stockout_forecast.project_row(row) for row in stockout_forecast.rows_from(matrix)])
+    np.testing.assert_allclose(vectorized, expected, rtol=1e-9)
+
+
+def test_empty_snapshot():
+    snapshot = forecast.StockForecast(forecast.parse_snapshot(""))
+    assert snapshot.size == 0
+    assert len(snapshot.at_risk(30)) == 0
+
+
+def test_at_risk_and_stockout_date():
+    day = (datetime.date(2025, 6, 1) - forecast.EPOCH).days
+    nan = float("nan")
+    # center, product, region, stock, cpma, último mes, cpma_12, cpma_24, cpma_36, día de reporte
+    matrix = np.array([
+        [1, 1, 1, 30, 30, nan, nan, nan, nan, day],        # ~30 días
+        [2, 1, 1, 10, 30, nan, nan, nan, nan, day],        # ~10 días
+        [3, 1, 2, 10, 30, nan, nan, nan, nan, day],        # otra región
+        [4, 1, 1, 10, 30, nan, nan, nan, nan, day - 30],   # reportado un mes antes: ya agotado
+        [5, 1, 1, 0, 30, nan, nan, nan, nan, day],         # sin stock: no cuenta
+        [6, 1, 1, 9000, 30, nan, nan, nan, nan, day],      # cobertura de años
+    ], dtype=np.float64)
+    snapshot = forecast.StockForecast(matrix)
+    assert snapshot.reference_date == datetime.date(2025, 6, 1)
+    risky = snapshot.at_risk(45, region_id=1)
+    assert [int(snapshot.center_id[position]) for position in risky] == [4, 2, 1]
+    assert snapshot.stockout_date(1) == datetime.date(2025, 6, 1) + datetime.timedelta(
+        days=math.floor(10 / daily(30)))
@@ -0,0 +1,72 @@
+"""Reenvío de /run_sse del ADK al navegador en /chat/stream (sin ADK: la respuesta se simula)."""
+import json
+
+import pytest
+import requests
+
+import frontend_app
+
+
+class FakeResponse:
+    def __init__(self, lines, error=None):
+        self.lines = lines
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, chunk_size=None):
+        yield from self.lines
+        if self.error:
+            raise self.error
+
+
+def event_line(event) -> bytes:
+    return b"data: " + json.dumps(event).encode("utf-8")
+
+
+TEXT_EVENT = {"content": {"role": "model", "parts": [{"text": "Hay stock en 3 centros."}]}}
+
+
+def stream(monkeypatch, response) -> list:
+    def fake_post(*args, **kwargs):
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(frontend_app.requests, "post", fake_post)
+    client = frontend_app.app.test_client()
+    body = client.post("/chat/stream", json={"message": "[PÚBLICO] amoxicilina en Tumbes"}).get_data(as_text=True)
+    return [json.loads(frame[len("data: "):]) for frame in body.split("\n\n") if frame]
+
+
+def test_relays_text_and_finishes_with_done(monkeypatch):
+    messages = stream(monkeypatch, FakeResponse([b": ping", event_line(TEXT_EVENT)]))
+    assert messages == [{"type": "text", "text": "Hay stock en 3 centros."}, {"type": "done"}]
+
+
+@pytest.mark.parametrize("bad_line", [
+    b"data: {no es json",
+    b"data: \xff\xfe",
+    event_line(["una", "lista"]),
+    event_line({"content": {"role": "model", "parts": ["texto suelto"]}}),
+])
+def test_malformed_events_are_skipped(monkeypatch, bad_line):
+    messages = stream(monkeypatch, FakeResponse([bad_line, event_line(TEXT_EVENT)]))
+    assert messages == [{"type": "text", "text": "Hay stock en 3 centros."}, {"type": "done"}]
+
+
+def test_connection_error_sends_error_then_done(monkeypatch):
+    messages = stream(monkeypatch, requests.exceptions.ConnectionError("rechazada"))
+    assert [message["type"] for message in messages] == ["error", "done"]
+
+
+def test_unexpected_error_mid_stream_sends_error_then_done(monkeypatch):
+    messages = stream(monkeypatch, FakeResponse([event_line(TEXT_EVENT)], error=RuntimeError("corte")))
+    assert [message["type"] for message in messages] == ["text", "error", "done"]
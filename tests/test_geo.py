@@ -0,0 +1,76 @@
+"""Búsqueda de centros cercanos con el KD-tree de MediFinderCore.geo."""
+import math
+
+import numpy as np
+import pytest
+
+from MediFinderCore import geo
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * geo.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+@pytest.fixture(scope="module")
+def centers():
+    # Centros repartidos por un recuadro parecido al del Perú
+    rng = np.random.default_rng(7)
+    lats, lons = rng.uniform(-18, 0, 500), rng.uniform(-81, -69, 500)
+    return [{"center_id": i + 1, "latitude": float(lat), "longitude": float(lon)}
+            for i, (lat, lon) in enumerate(zip(lats, lons))]
+
+
+def brute_force(centers, lat, lon, k, radius_km=None, allowed=None):
+    distances = sorted(
+        (haversine_km(lat, lon, c["latitude"], c["longitude"]), c["center_id"]) for c in centers
+        if (allowed is None or c["center_id"] in allowed))
+    if radius_km is not None:
+        distances = [d for d in distances if d[0] <= radius_km]
+    return [(center_id, distance) for distance, center_id in distances[:k]]
+
+
+def assert_same(found, expected):
+    assert [center_id for center_id, _ in found] == [center_id for center_id, _ in expected]
+    for (_, got), (_, want) in zip(found, expected):
+        assert got == pytest.approx(want, abs=1e-6)
+
+
+@pytest.mark.parametrize("lat,lon", [(-12.05, -77.04), (-3.57, -80.45), (-16.4, -71.54)])
+def test_nearest_matches_haversine(centers, lat, lon):
+    index = geo.CenterSpatialIndex(centers)
+    assert_same(index.nearest(lat, lon, k=5), brute_force(centers, lat, lon, 5))
+
+
+def test_nearest_with_radius(centers):
+    index = geo.CenterSpatialIndex(centers)
+    found = index.nearest(-12.05, -77.04, k=50, radius_km=150)
+    assert_same(found, brute_force(centers, -12.05, -77.04, 50, radius_km=150))
+    assert all(distance <= 150 for _, distance in found)
+
+
+def test_nearest_only_allowed_centers(centers):
+    # Pocos centros permitidos: la búsqueda tiene que ampliarse más allá de los k primeros vecinos
+    allowed = {c["center_id"] for c in centers[::37]}
+    index = geo.CenterSpatialIndex(centers)
+    found = index.nearest(-12.05, -77.04, k=5, allowed=allowed)
+    assert_same(found, brute_force(centers, -12.05, -77.04, 5, allowed=allowed))
+
+
+def test_centers_without_coordinates_are_skipped():
+    index = geo.CenterSpatialIndex([
+        {"center_id": 1, "latitude": None, "longitude": -77.0},
+        {"center_id": 2, "latitude": -12.0, "longitude": -77.0},
+    ])
+    assert index.size == 1
+    assert [center_id for center_id, _ in index.nearest(-12.0, -77.0, k=5)] == [2]
+    assert geo.CenterSpatialIndex([]).nearest(-12.0, -77.0) == []
+
+
+def test_nearest_pairs_respects_max_km():
+    points_lat, points_lon = [-12.0, -12.5, -14.0], [-77.0, -77.0, -77.0]
+    queries, points, distances = geo.nearest_pairs(points_lat, points_lon, [-12.0], [-77.0], k=3, max_km=100)
+    assert list(queries) == [0, 0]
+    assert list(points) == [0, 1]
+    assert distances[1] == pytest.approx(haversine_km(-12.0, -77.0, -12.5, -77.0))
@@ -0,0 +1,36 @@
+"""Lectura de cabeceras y números de los archivos del MINSA (sin base de datos)."""
+import re
+
+import pytest
+
+from MediFinderCore import ingest
+
+
+@pytest.mark.parametrize("decimal,value,expected", [
+    (".", "12.5", True),
+    (".", "1,234.5", True),
+    (".", "-7", True),
+    (".", ".5", True),
+    (".", "1e3", True),
+    (".", "12,5", False),      # coma decimal con --decimal '.': se rechaza, no se lee como 125
+    (".", "1,2,3", False),
+    (".", "abc", False),
+    (",", "12,5", True),
+    (",", "1.234,5", True),     # no se lee como 1.2345
+    (",", "1.234", True),
+    (",", "12.5", False),
+    (",", "1.23,4", False),
+])
+def test_number_pattern(decimal, value, expected):
+    assert bool(re.match(ingest.number_pattern(decimal), value)) is expected
+
+
+def test_number_pattern_rejects_unknown_separator():
+    with pytest.raises(ValueError):
+        ingest.number_pattern(";")
+
+
+def test_map_header_accepts_aliases_and_ignores_unknown_columns():
+    header = ["\ufeffCODIGO_EESS", "Medicamento", "Stock Actual", "Observación", "stock"]
+    assert ingest.map_header(header) == [
+        "center_code", "product_name", "current_stock", "ignored_3", "ignored_4"]
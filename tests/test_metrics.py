@@ -0,0 +1,81 @@
+"""Instrumentación de herramientas (MediFinderCore.metrics)."""
+import asyncio
+
+import pytest
+
+from MediFinderCore import metrics
+
+pytestmark = pytest.mark.skipif(not metrics.ENABLED, reason="TOOL_METRICS_ENABLED=false")
+
+
+def count(metric: str, *labels) -> int:
+    series = metrics.registry.snapshot().get(metrics._series_key(metric, labels))
+    return series["count"] if series else 0
+
+
+def total(metric: str, *labels) -> float:
+    return metrics.registry.snapshot()[metrics._series_key(metric, labels)]["sum"]
+
+
+@metrics.instrument
+def inner_tool():
+    metrics.add_query_time(0.25)
+    return {"status": "success", "rows": [1, 2, 3]}
+
+
+@metrics.instrument
+def outer_tool():
+    metrics.add_query_time(0.5)
+    inner = inner_tool()
+    return {"status": "success", "rows": inner["rows"] + [4]}
+
+
+@metrics.instrument
+async def ainner_tool():
+    metrics.add_query_time(0.25)
+    return {"status": "success", "rows": [1, 2, 3]}
+
+
+@metrics.instrument
+async def aouter_tool():
+    metrics.add_query_time(0.5)
+    inner = await ainner_tool()
+    return {"status": "success", "rows": inner["rows"] + [4]}
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+
+def test_single_call_is_recorded():
+    inner_tool()
+    assert count("medifinder_tool_duration_seconds", "inner_tool", "success") == 1
+    assert total("medifinder_tool_rows", "inner_tool") == 3
+    assert total("medifinder_tool_db_query_seconds", "inner_tool") == pytest.approx(0.25)
+
+
+def test_nested_call_only_records_the_outermost():
+    outer_tool()
+    assert count("medifinder_tool_duration_seconds", "outer_tool", "success") == 1
+    assert count("medifinder_tool_duration_seconds", "inner_tool", "success") == 0
+    assert total("medifinder_tool_rows", "outer_tool") == 4
+    # El tiempo de base de datos de la llamada interior cuenta una vez, en la exterior
+    assert total("medifinder_tool_db_query_seconds", "outer_tool") == pytest.approx(0.75)
+
+
+def test_nested_async_call_only_records_the_outermost():
+    asyncio.run(aouter_tool())
+    assert count("medifinder_tool_duration_seconds", "aouter_tool", "success") == 1
+    assert count("medifinder_tool_duration_seconds", "ainner_tool", "success") == 0
+    assert total("medifinder_tool_db_query_seconds", "aouter_tool") == pytest.approx(0.75)
+
+
+def test_sibling_calls_are_recorded_separately():
+    inner_tool()
+    outer_tool()
+    inner_tool()
+    assert count("medifinder_tool_duration_seconds", "inner_tool", "success") == 2
+    assert count("medifinder_tool_duration_seconds", "outer_tool", "success") == 1
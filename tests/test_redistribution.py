@@ -0,0 +1,86 @@
+"""Plan de transferencias entre centros de una región (MediFinderCore.redistribution)."""
+import numpy as np
+import pytest
+
+from benchmarks.redistribution import synthetic_region
+from MediFinderCore import redistribution
+from tests.test_geo import haversine_km
+
+MAX_KM = 100
+
+
+def row(center_id, latitude, stock, status, product_id=1, cpma=10.0):
+    return {"center_id": center_id, "product_id": product_id, "latitude": latitude, "longitude": -77.0,
+            "current_stock": stock, "avg_monthly_consumption": cpma, "status_indicator": status}
+
+
+def spare(r):
+    return int(np.floor(r["current_stock"] - redistribution.OVERSTOCK_MONTHS * r["avg_monthly_consumption"]))
+
+
+def need(r):
+    return int(np.ceil(redistribution.TARGET_MONTHS * r["avg_monthly_consumption"] - r["current_stock"]))
+
+
+def moved(transfers):
+    return {(t["from_center_id"], t["to_center_id"]): t["quantity"] for t in transfers}
+
+
+def test_short_supply_moves_everything_to_the_nearest_first():
+    rows = [row(1, -12.0, 50, "Sobrestock"),       # cede 20
+            row(2, -12.1, 5, "Substock"),          # pide 15, a ~11 km
+            row(3, -12.5, 0, "Desabastecido")]     # pide 20, a ~56 km
+    assert moved(redistribution.plan_transfers(rows, MAX_KM)) == {(1, 2): 15, (1, 3): 5}
+
+
+def test_enough_supply_covers_every_need_from_the_nearest_donor():
+    rows = [row(1, -12.0, 500, "Sobrestock"), row(2, -12.6, 500, "Sobrestock"),
+            row(3, -12.1, 5, "Substock"), row(4, -12.5, 0, "Desabastecido")]
+    assert moved(redistribution.plan_transfers(rows, MAX_KM)) == {(1, 3): 15, (2, 4): 20}
+
+
+def test_distance_limit_and_products_are_respected():
+    rows = [row(1, -12.0, 50, "Sobrestock"),
+            row(2, -13.5, 0, "Desabastecido"),                 # a ~167 km
+            row(3, -12.1, 0, "Desabastecido", product_id=2),   # otro producto
+            row(4, -12.1, 20, "Normostock")]                   # ni cede ni pide
+    assert redistribution.plan_transfers(rows, MAX_KM) == []
+    assert redistribution.plan_transfers([], MAX_KM) == []
+
+
+def test_synthetic_region_stays_within_supply_and_need():
+    rows = synthetic_region(120, 60, 0.3, (0.25, 0.2, 0.05, 0.5), seed=11)
+    transfers = redistribution.plan_transfers(rows, MAX_KM)
+    assert transfers
+    by_pair = {(r["center_id"], r["product_id"]): r for r in rows}
+    given, received = {}, {}
+    for t in transfers:
+        source = by_pair[(t["from_center_id"], t["product_id"])]
+        target = by_pair[(t["to_center_id"], t["product_id"])]
+        assert source["status_indicator"] in redistribution.DONOR_STATUSES
+        assert target["status_indicator"] in redistribution.RECEIVER_STATUSES
+        assert t["quantity"] > 0 and t["to_need"] == need(target)
+        km = haversine_km(source["latitude"], source["longitude"], target["latitude"], target["longitude"])
+        assert t["distance_km"] == pytest.approx(km, abs=0.05) and km <= MAX_KM
+        given[id(source)] = given.get(id(source), 0) + t["quantity"]
+        received[id(target)] = received.get(id(target), 0) + t["quantity"]
+    sources = {id(r): r for r in rows}
+    assert all(quantity <= spare(sources[key]) for key, quantity in given.items())
+    assert all(quantity <= need(sources[key]) for key, quantity in received.items())
+
+
+def test_plan_is_deterministic():
+    rows = synthetic_region(80, 40, 0.3, (0.25, 0.2, 0.05, 0.5), seed=5)
+    first = redistribution.plan_transfers(rows, MAX_KM)
+    assert first == redistribution.plan_transfers(rows, MAX_KM)
+
+
+def test_rank_puts_stockouts_first_then_quantity_then_distance():
+    transfers = [
+        {"to_status": "Substock", "quantity": 50, "distance_km": 1.0},
+        {"to_status": "Desabastecido", "quantity": 5, "distance_km": 9.0},
+        {"to_status": "Desabastecido", "quantity": 5, "distance_km": 2.0},
+        {"to_status": "Desabastecido", "quantity": 8, "distance_km": 30.0},
+    ]
+    ranked = redistribution.rank_transfers(transfers)
+    assert [(t["quantity"], t["distance_km"]) for t in ranked] == [(8, 30.0), (5, 2.0), (5, 9.0), (50, 1.0)]
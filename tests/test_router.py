@@ -0,0 +1,38 @@
+"""Enrutador por prefijo de rol de MediFinderAgent (modelo simulado, sin Gemini ni base de datos)."""
+import asyncio
+
+import pytest
+
+from benchmarks import router_latency
+from MediFinderAgent import agent as medifinder
+
+
+@pytest.mark.parametrize("text,role", [
+    ("Publico: ¿hay amoxicilina en Tumbes?", "publico"),
+    ("Público: paracetamol", "publico"),
+    ("  PUBLICO : ibuprofeno", "publico"),
+    ("Analista: reporte de bajo stock en Piura", "analista"),
+    ("analista:tendencias", "analista"),
+    ("¿Hay amoxicilina en Tumbes?", None),
+    ("Publicó: algo", None),
+    ("Consulta Analista: x", None),   # el prefijo tiene que ir al principio
+    ("Analista tendencias", None),    # sin ':' no es un prefijo
+    ("", None),
+    (None, None),
+])
+def test_role_from_text(text, role):
+    assert medifinder._role_from_text(text) == role
+
+
+def test_messages_reach_the_expected_agent():
+    model = router_latency.StubLlm(latency=0)
+    messages = ["Publico: pregunta 1", "Analista: pregunta 2", "Analista: pregunta 3", "Publico: pregunta 4"]
+    _, authors = asyncio.run(router_latency.run_messages(router_latency.prefix_router(model), messages))
+    assert authors == [router_latency.EXPECTED_AGENT[message.split(":")[0]] for message in messages]
+
+
+def test_unprefixed_message_goes_to_public_agent_without_fallback():
+    model = router_latency.StubLlm(latency=0)
+    root = router_latency.prefix_router(model).clone(update={"llm_fallback": False})
+    _, authors = asyncio.run(router_latency.run_messages(root, ["¿Hay amoxicilina en Tumbes?"]))
+    assert authors == ["MediFinderPublicAgent"]
@@ -0,0 +1,50 @@
+"""Barrido del Watcher en paralelo, con un modelo simulado (sin base de datos ni Gemini)."""
+import asyncio
+
+import pytest
+
+from benchmarks import watcher_fanout
+
+REGIONS = [f"REGION_{i:02d}" for i in range(1, 11)]
+LATENCY = 0.05
+CONCURRENCY = 5
+
+
+@pytest.fixture(scope="module")
+def sweeps():
+    """(segundos, eventos) de un barrido región por región y de otro en paralelo."""
+    model = watcher_fanout.StubLlm(latency=LATENCY, regions=REGIONS)
+
+    async def run():
+        # Calentamiento: la primera ejecución paga importaciones y la creación de objetos de ADK.
+        await watcher_fanout.run_sweep(model.model_copy(update={"latency": 0}), CONCURRENCY)
+        return (await watcher_fanout.run_sweep(model, 1),
+                await watcher_fanout.run_sweep(model, CONCURRENCY))
+
+    sequential, parallel = asyncio.run(run())
+    return {"sequential": sequential, "parallel": parallel}
+
+
+def test_parallel_sweep_is_faster(sweeps):
+    sequential, _ = sweeps["sequential"]
+    parallel, _ = sweeps["parallel"]
+    assert sequential / parallel >= 2, f"una por una {sequential:.3f} s, en paralelo {parallel:.3f} s"
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_events_grouped_by_region_in_list_order(sweeps, mode):
+    _, seen = sweeps[mode]
+    order = []
+    for region, _, _ in seen:
+        if region in REGIONS and (not order or order[-1] != region):
+            order.append(region)
+    assert order == REGIONS
+
+
+@pytest.mark.parametrize("mode", ["sequential", "parallel"])
+def test_each_region_sees_its_own_state(sweeps, mode):
+    _, seen = sweeps[mode]
+    analyzed = {region for region, author, text in seen
+                if region in REGIONS and author != watcher_fanout.watcher.root_agent.name and text}
+    assert analyzed == set(REGIONS)
+    assert watcher_fanout.check_events(REGIONS, seen) == []